@@ -2,22 +2,31 @@
 import sys
 import os
 import time
-import traceback
+import shutil
+import functools
+import tempfile
+from contextlib import asynccontextmanager
+
+# 常用目录路径，仅在导入时计算一次
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FRONTEND_DIR = os.path.join(BASE_DIR, "frontend")
+FRONTEND_INDEX = os.path.join(FRONTEND_DIR, "index.html")
 
 # 添加项目根目录到路径中
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
+from fastapi.responses import JSONResponse, FileResponse, HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
 import os
-from pydantic import BaseModel
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional, Dict, Any
 from src.langchain_enhanced_kb import LangChainEnhancedKnowledgeBase
 from src.utils.logger import logger
-from src.utils.log_utils import log_search_results, log_model_interaction
+from src.utils.log_utils import log_api_call, log_search_results, log_model_interaction
 from src.config.settings import Config
 
 
@@ -26,20 +35,148 @@ LANGFUSE_CLIENT = None
 LANGFUSE_ENABLED = False
 
 
-# 初始化知识库
-kb = LangChainEnhancedKnowledgeBase()
-kb.initialize()
+# 知识库实例，在应用启动（lifespan）时按 Config.KB_IMPL 创建
+kb: Optional[LangChainEnhancedKnowledgeBase] = None
+
+# 阻塞操作（写盘、文档入库、检索与问答）专用线程池，避免与默认执行器（Starlette内部也在使用）争抢线程
+EXECUTOR = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 4) * 4))
+
+# 上传文件分块写盘的块大小（1MB）
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# 所有批量上传请求共享的并发上限，在应用启动（lifespan）时创建
+_upload_semaphore: Optional[asyncio.Semaphore] = None
+
+
+async def run_blocking(func, *args):
+    """在专用线程池中执行阻塞调用，保持事件循环响应"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(EXECUTOR, func, *args)
+
+
+def _sendfile_copy(source, buffer, chunk_size: int) -> bool:
+    """在内核中完成文件到文件的复制（Linux零拷贝），条件不满足时返回False由调用方回退"""
+    # 只有已落盘的临时文件才有真实文件描述符；内存中的小文件调用fileno()会强制写盘，得不偿失
+    if not hasattr(os, "sendfile") or not getattr(source, "_rolled", False):
+        return False
+    try:
+        in_fd = source.fileno()
+        out_fd = buffer.fileno()
+    except (AttributeError, OSError, ValueError):
+        return False
+    
+    start = offset = source.tell()
+    try:
+        while True:
+            sent = os.sendfile(out_fd, in_fd, offset, chunk_size)
+            if sent == 0:
+                break
+            offset += sent
+    except OSError:
+        # 平台不支持文件到文件的sendfile（如macOS）时，尚未写入任何数据即可安全回退
+        if offset == start:
+            return False
+        raise
+    source.seek(offset)
+    return True
+
+
+def _copy_to_disk(source, file_path: str, chunk_size: int):
+    """同步分块复制，供线程池调用"""
+    with open(file_path, "wb") as buffer:
+        if not _sendfile_copy(source, buffer, chunk_size):
+            shutil.copyfileobj(source, buffer, length=chunk_size)
+
+
+def _unique_upload_path(filename: str) -> str:
+    """
+    为上传文件分配独立路径：每个文件放在 UPLOAD_DIR 下新建的临时子目录中，
+    同名文件并发上传时不会写入同一路径，且保留原文件名（入库时作为 filename 元数据）
+    """
+    os.makedirs(Config.UPLOAD_DIR, exist_ok=True)
+    upload_dir = tempfile.mkdtemp(prefix="upload_", dir=Config.UPLOAD_DIR)
+    return os.path.join(upload_dir, os.path.basename(filename))
+
+
+async def save_upload_file(file: UploadFile, file_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """分块将上传文件写入磁盘，避免把整个文件读入内存"""
+    await run_blocking(_copy_to_disk, file.file, file_path, chunk_size)
+
+
+async def ingest(source: str):
+    """在线程池中加载并添加文档到知识库"""
+    return await run_blocking(kb.load_and_add_documents, source)
+
+# 前端首页内容缓存（UTF-8字节），在启动时读取一次
+_INDEX_HTML: Optional[bytes] = None
+
+
+def _load_index_html(frontend_path: str) -> Optional[bytes]:
+    """读取前端首页并统一转换为UTF-8编码，文件不存在时返回None"""
+    try:
+        with open(frontend_path, 'rb') as file:
+            raw = file.read()
+    except FileNotFoundError:
+        logger.warning(f"前端文件未找到: {frontend_path}")
+        return None
+    
+    try:
+        raw.decode('utf-8')
+    except UnicodeDecodeError:
+        logger.warning(f"前端文件编码错误: {frontend_path}, 尝试使用gbk编码")
+        raw = raw.decode('gbk').encode('utf-8')
+    
+    logger.info(f"成功读取前端文件: {frontend_path}")
+    return raw
+
+
+def _create_knowledge_base():
+    """创建并初始化知识库（连接ES、创建索引等阻塞操作）"""
+    if Config.KB_IMPL == "langchain":
+        knowledge_base = LangChainEnhancedKnowledgeBase()
+    else:
+        # 原始实现仅在需要时导入，避免加载两套组件
+        from src.models.knowledge_base import KnowledgeBase
+        knowledge_base = KnowledgeBase()
+    logger.info(f"使用知识库实现: {type(knowledge_base).__name__}")
+    knowledge_base.initialize()
+    return knowledge_base
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时并行完成知识库初始化与前端页面加载，关闭时释放线程池"""
+    global kb, _INDEX_HTML, _upload_semaphore
+    logger.info("知识库系统启动中...")
+    try:
+        Config.validate()
+        logger.info("配置验证通过")
+    except Exception as e:
+        logger.error(f"配置验证失败: {e}")
+        raise
+    
+    kb, _INDEX_HTML = await asyncio.gather(
+        run_blocking(_create_knowledge_base),
+        run_blocking(_load_index_html, FRONTEND_INDEX)
+    )
+    
+    _upload_semaphore = asyncio.Semaphore(Config.UPLOAD_CONCURRENCY)
+    
+    yield
+    
+    EXECUTOR.shutdown(wait=False)
 
 # 创建FastAPI应用
 app = FastAPI(
     title="知识库系统", 
     description="基于通义千问和ElasticSearch的知识库系统", 
     version="1.0.0",
-    responses={404: {"description": "未找到"}}  # 添加默认响应定义
+    responses={404: {"description": "未找到"}},  # 添加默认响应定义
+    default_response_class=ORJSONResponse,  # 使用orjson序列化响应，加快大结果集的编码
+    lifespan=lifespan
 )
 
 # 挂载静态文件目录以提供前端页面
-app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend")), name="static")
+app.mount("/static", StaticFiles(directory=FRONTEND_DIR), name="static")
 
 # 添加CORS中间件
 app.add_middleware(
@@ -50,53 +187,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# API模型定义
+def traced(func):
+    """开启 ENABLE_API_TRACING 时为接口添加 log_api_call 调用日志"""
+    return log_api_call(func) if Config.ENABLE_API_TRACING else func
+
+# API模型定义（请求体只读，忽略未知字段）
+REQUEST_MODEL_CONFIG = ConfigDict(extra="ignore", frozen=True)
+
 class QueryRequest(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+    
     question: str
     top_k: int = 5
     use_reranker: bool = True
     reranker_model: str = "default"  # 重排序模型类型
 
 class DocumentAddRequest(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+    
     source: str  # 文档路径或URL
 
 class SearchRequest(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+    
     query: str
     top_k: int = 5
     use_reranker: bool = True
     reranker_model: str = "default"  # 重排序模型类型
 
-@app.on_event("startup")
-async def startup_event():
-    """应用启动事件"""
-    logger.info("知识库系统启动中...")
-    try:
-        Config.validate()
-        logger.info("配置验证通过")
-    except Exception as e:
-        logger.error(f"配置验证失败: {e}")
-        raise
-
 @app.get("/")
+@traced
 async def root():
     """根路径 - 返回前端页面"""
     logger.info("根路径访问 - 返回前端页面")
-    frontend_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend", "index.html")
-    try:
-        with open(frontend_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-        logger.info(f"成功读取前端文件: {frontend_path}")
-        return HTMLResponse(content=content, status_code=200)
-    except FileNotFoundError:
-        logger.warning(f"前端文件未找到: {frontend_path}")
-        return {"message": "知识库系统API服务运行正常", "frontend_path": frontend_path}
-    except UnicodeDecodeError:
-        logger.warning(f"前端文件编码错误: {frontend_path}, 尝试使用gbk编码")
-        with open(frontend_path, 'r', encoding='gbk') as file:
-            content = file.read()
-        return HTMLResponse(content=content, status_code=200)
+    if _INDEX_HTML is None:
+        return {"message": "知识库系统API服务运行正常", "frontend_path": FRONTEND_INDEX}
+    return HTMLResponse(content=_INDEX_HTML, status_code=200, media_type="text/html; charset=utf-8")
 
 @app.get("/health/")
+@traced
 async def health_check():
     """健康检查"""
     logger.info("健康检查请求")
@@ -106,22 +235,18 @@ async def health_check():
     }
 
 @app.post("/upload/")
+@traced
 async def upload_file(file: UploadFile = File(...)):
     """上传单个文档到知识库（保持原有兼容性）"""
     start_time = time.time()
     try:
-        # 创建上传目录
-        os.makedirs(Config.UPLOAD_DIR, exist_ok=True)
-        
-        # 保存上传的文件
-        file_path = os.path.join(Config.UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # 保存上传的文件（每个文件使用独立路径）
+        file_path = _unique_upload_path(file.filename)
+        await save_upload_file(file, file_path)
         
         # 添加文档到知识库
         logger.info(f"开始处理上传文件: {file.filename}")
-        kb.load_and_add_documents(file_path)
+        await ingest(file_path)
         
         response_time = time.time() - start_time
         logger.info(f"文件 {file.filename} 上传并添加到知识库成功，处理时间: {response_time:.2f}秒")
@@ -135,71 +260,82 @@ async def upload_file(file: UploadFile = File(...)):
     except Exception as e:
         response_time = time.time() - start_time
         logger.error(f"上传文件失败，处理时间: {response_time:.2f}秒")
-        logger.error(f"上传文件失败: {str(e)}")
-        logger.error(f"堆栈跟踪: {traceback.format_exc()}")
+        logger.exception(f"上传文件失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"上传文件失败: {str(e)}")
 
 
 @app.post("/upload_batch/")
+@traced
 async def upload_batch(files: List[UploadFile] = File(...)):
     """批量上传文档到知识库"""
     start_time = time.time()
-    results = []
     
-    # 创建上传目录
-    os.makedirs(Config.UPLOAD_DIR, exist_ok=True)
+    # 限制同时处理的文件数（所有批量上传请求共享），避免超出ES/Embedding服务的速率限制
+    async def _handle(file: UploadFile) -> Dict[str, Any]:
+        async with _upload_semaphore:
+            try:
+                # 保存上传的文件（每个文件使用独立路径，同名文件互不覆盖）
+                file_path = _unique_upload_path(file.filename)
+                await save_upload_file(file, file_path)
+                
+                # 添加文档到知识库（阻塞调用放入线程池，使多个文件的嵌入/ES请求重叠）
+                logger.debug("开始处理上传文件: {}", file.filename)
+                await ingest(file_path)
+                
+                # 记录成功结果
+                return {
+                    "filename": file.filename,
+                    "status": "success",
+                    "message": f"文档 {file.filename} 已成功添加到知识库"
+                }
+                
+            except Exception as e:
+                logger.exception(f"上传文件 {file.filename} 失败: {str(e)}")
+                
+                # 记录失败结果
+                return {
+                    "filename": file.filename,
+                    "status": "failed",
+                    "message": f"文档 {file.filename} 上传失败: {str(e)}"
+                }
     
-    for file in files:
-        try:
-            # 保存上传的文件
-            file_path = os.path.join(Config.UPLOAD_DIR, file.filename)
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
-            
-            # 添加文档到知识库
-            logger.info(f"开始处理上传文件: {file.filename}")
-            kb.load_and_add_documents(file_path)
-            
-            # 记录成功结果
-            results.append({
-                "filename": file.filename,
-                "status": "success",
-                "message": f"文档 {file.filename} 已成功添加到知识库"
-            })
-            
-            logger.info(f"文件 {file.filename} 上传并添加到知识库成功")
-            
-        except Exception as e:
-            logger.error(f"上传文件 {file.filename} 失败: {str(e)}")
-            logger.error(f"堆栈跟踪: {traceback.format_exc()}")
-            
-            # 记录失败结果
+    outcomes = await asyncio.gather(*[_handle(file) for file in files], return_exceptions=True)
+    
+    results = []
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, BaseException):
+            # 例如请求被取消等未被_handle捕获的异常
             results.append({
                 "filename": file.filename,
                 "status": "failed",
-                "message": f"文档 {file.filename} 上传失败: {str(e)}"
+                "message": f"文档 {file.filename} 上传失败: {str(outcome)}"
             })
+        else:
+            results.append(outcome)
+    
+    success_count = len([r for r in results if r['status'] == 'success'])
+    failure_count = len(results) - success_count
     
     response_time = time.time() - start_time
-    logger.info(f"批量上传完成，处理时间: {response_time:.2f}秒，成功 {len([r for r in results if r['status'] == 'success'])} 个，失败 {len([r for r in results if r['status'] == 'failed'])} 个")
+    logger.info(f"批量上传完成，处理时间: {response_time:.2f}秒，成功 {success_count} 个，失败 {failure_count} 个")
     
     return {
-        "status": "partial_success" if any(r['status'] == 'failed' for r in results) else "success",
+        "status": "partial_success" if failure_count else "success",
         "results": results,
         "total_uploaded": len(results),
-        "success_count": len([r for r in results if r['status'] == 'success']),
-        "failure_count": len([r for r in results if r['status'] == 'failed']),
+        "success_count": success_count,
+        "failure_count": failure_count,
         "processing_time": response_time
     }
 
 @app.post("/add_document/")
+@traced
 async def add_document(request: DocumentAddRequest):
     """从指定路径添加文档到知识库"""
     start_time = time.time()
     try:
         logger.info(f"开始从 {request.source} 添加文档")
-        kb.load_and_add_documents(request.source)
+        await ingest(request.source)
         
         response_time = time.time() - start_time
         logger.info(f"从 {request.source} 添加文档成功，处理时间: {response_time:.2f}秒")
@@ -212,51 +348,56 @@ async def add_document(request: DocumentAddRequest):
     except Exception as e:
         response_time = time.time() - start_time
         logger.error(f"添加文档失败，处理时间: {response_time:.2f}秒")
-        logger.error(f"添加文档失败: {str(e)}")
-        logger.error(f"堆栈跟踪: {traceback.format_exc()}")
+        logger.exception(f"添加文档失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"添加文档失败: {str(e)}")
 
 @app.post("/search/")
+@traced
 async def search_documents(request: SearchRequest):
     """搜索文档"""
     start_time = time.time()
     try:
         logger.info(f"开始搜索: {request.query[:50]}...")
-        results = kb.search(request.query, request.top_k, use_reranker=request.use_reranker, reranker_model=request.reranker_model)
+        results = await run_blocking(
+            functools.partial(kb.search, request.query, request.top_k, use_reranker=request.use_reranker, reranker_model=request.reranker_model)
+        )
         
         response_time = time.time() - start_time
         logger.info(f"搜索完成，返回 {len(results)} 个结果，处理时间: {response_time:.2f}秒")
         log_search_results(request.query, results)
         
-        return {
+        # 结果均为JSON原生类型，直接返回ORJSONResponse跳过jsonable_encoder
+        return ORJSONResponse({
             "query": request.query,
             "results": results,
             "count": len(results),
             "use_reranker": request.use_reranker,
             "reranker_model": request.reranker_model,
             "response_time": response_time
-        }
+        })
     except Exception as e:
         response_time = time.time() - start_time
         logger.error(f"搜索失败，处理时间: {response_time:.2f}秒")
-        logger.error(f"搜索失败: {str(e)}")
-        logger.error(f"堆栈跟踪: {traceback.format_exc()}")
+        logger.exception(f"搜索失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
 
 @app.post("/chat/")
+@traced
 async def chat_with_kb(request: QueryRequest):
     """与知识库对话"""
     start_time = time.time()
     try:
         logger.info(f"开始处理问答请求: {request.question[:50]}...")
         
-        result = kb.ask(request.question, request.top_k, use_reranker=request.use_reranker, reranker_model=request.reranker_model)
+        result = await run_blocking(
+            functools.partial(kb.ask, request.question, request.top_k, use_reranker=request.use_reranker, reranker_model=request.reranker_model)
+        )
         
         response_time = time.time() - start_time
         logger.info(f"问答处理完成，响应时间: {response_time:.2f}秒")
         log_model_interaction(request.question, result['answer'])
         
-        return {
+        return ORJSONResponse({
             "question": request.question,
             "answer": result['answer'],
             "sources": result['sources'],
@@ -265,12 +406,11 @@ async def chat_with_kb(request: QueryRequest):
             "response_time": response_time,
             "use_reranker": request.use_reranker,
             "reranker_model": request.reranker_model
-        }
+        })
     except Exception as e:
         response_time = time.time() - start_time
         logger.error(f"问答处理失败，响应时间: {response_time:.2f}秒")
-        logger.error(f"问答失败: {str(e)}")
-        logger.error(f"堆栈跟踪: {traceback.format_exc()}")
+        logger.exception(f"问答失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"问答失败: {str(e)}")
 
 
@@ -6,10 +6,16 @@ class Config:
     # 通义千问API配置
     DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY", "")
     QWEN_MODEL_NAME = os.getenv("QWEN_MODEL_NAME", "qwen-max")
+    LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 4096))  # 模型响应缓存条数（按完整提示词精确匹配，只缓存温度为0的调用），设为0则禁用
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 3600))  # 模型响应缓存有效期（秒）
+    LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 16))  # 批量并发调用模型时的最大并发请求数
     
     # 阿里embedding模型配置
     DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY", "")
     EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "text-embedding-v4")
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 10))  # 单次嵌入请求的文本数（text-embedding-v4上限为10）
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 4096))  # 查询向量LRU缓存条数，设为0则禁用缓存
+    EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))  # 文档入库时并发进行的嵌入请求数
     
     # Elasticsearch配置
     ES_HOST = os.getenv("ES_HOST", "localhost")
@@ -18,12 +24,38 @@ class Config:
     ES_USERNAME = os.getenv("ES_USERNAME", "elastic")
     ES_PASSWORD = os.getenv("ES_PASSWORD", "your_elasticsearch_password")
     ES_INDEX_NAME = os.getenv("ES_INDEX_NAME", "knowledge_base_index")
+    ES_CONNECTIONS_PER_NODE = int(os.getenv("ES_CONNECTIONS_PER_NODE", 32))  # 每个ES节点的HTTP连接池大小
+    ES_SNIFF = os.getenv("ES_SNIFF", "false").lower() in ("1", "true", "yes")  # 是否启用节点嗅探（多节点集群使用；单节点或经代理/容器映射访问时保持关闭）
+    ES_BULK_THREADS = int(os.getenv("ES_BULK_THREADS", 8))  # 批量写入时并发发送bulk请求的线程数
+    ES_VECTOR_INDEX_TYPE = os.getenv("ES_VECTOR_INDEX_TYPE", "int8_hnsw")  # 向量字段的HNSW索引类型: int8_hnsw（int8标量量化）或 hnsw（不量化）
+    SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 2000))  # 检索结果缓存条数，设为0则禁用缓存
+    SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 600))  # 检索结果缓存有效期（秒）
+    SEARCH_CACHE_SIMILARITY = float(os.getenv("SEARCH_CACHE_SIMILARITY", 0))  # 语义相近查询复用结果的余弦相似度阈值（如0.95），0表示只做精确匹配
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1000))  # 问答结果缓存条数（按问题+检索上下文），设为0则禁用
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 600))  # 问答结果缓存有效期（秒）
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0))  # 同一上下文下语义相近问题复用答案的余弦相似度阈值（如0.95），0表示只做精确匹配
+    ES_HYBRID_FUSION = os.getenv("ES_HYBRID_FUSION", "linear").lower()  # 混合搜索融合方式: linear（客户端加权）或 rrf（ES服务端RRF，需要相应许可）
+    SEARCH_CANDIDATE_MULTIPLIER = float(os.getenv("SEARCH_CANDIDATE_MULTIPLIER", 1.5))  # 混合搜索候选数为top_k的倍数（每路检索条数及送入重排序的条数）
+    RERANK_CACHE_PATH = os.getenv("RERANK_CACHE_PATH", os.path.join("data", "rerank_scores.db"))  # 重排序得分缓存（SQLite）路径，设为空则禁用
+    RERANK_CACHE_TTL = float(os.getenv("RERANK_CACHE_TTL", 30 * 24 * 3600))  # 重排序得分缓存的有效期（秒），过期的得分会被定期清理
+    RERANK_CACHE_MAX_ROWS = int(os.getenv("RERANK_CACHE_MAX_ROWS", 1000000))  # 重排序得分缓存最多保存的得分条数，超出时删除最早写入的得分
+    RERANK_RESULT_CACHE_SIZE = int(os.getenv("RERANK_RESULT_CACHE_SIZE", 4096))  # 查询级重排结果缓存条数，设为0则禁用
+    RERANK_RESULT_CACHE_TTL = float(os.getenv("RERANK_RESULT_CACHE_TTL", 20))  # 查询级重排结果缓存有效期（秒）
+    LLM_RERANK_MAX_WORKERS = int(os.getenv("LLM_RERANK_MAX_WORKERS", 8))  # LLM逐文档重排的最大并发数
+    CROSS_ENCODER_ONNX_PATH = os.getenv("CROSS_ENCODER_ONNX_PATH", "")  # CrossEncoder ONNX INT8模型目录，设置后使用ONNX Runtime推理
+    ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", 0))  # ONNX Runtime算子内线程数，0表示自动
+    JINA_RERANKER_CT2_PATH = os.getenv("JINA_RERANKER_CT2_PATH", "")  # 本地Jina重排序模型的CTranslate2 INT8转换目录，设置后使用CTranslate2推理
     
     # 服务配置
     HOST = os.getenv("HOST", "0.0.0.0")
     PORT = int(os.getenv("PORT", 8080))  # 修改为8080端口避免冲突
+    UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 8))  # 批量上传并发处理的文件数
+    KB_IMPL = os.getenv("KB_IMPL", "langchain").lower()  # 知识库实现: langchain（增强版）或 basic（原始KnowledgeBase）
+    ENABLE_API_TRACING = os.getenv("ENABLE_API_TRACING", "false").lower() in ("1", "true", "yes")  # 是否用log_api_call记录每个接口调用
     
     # 数据目录
+    DOCUMENT_LOADER_WORKERS = int(os.getenv("DOCUMENT_LOADER_WORKERS", 0))  # 按目录导入时并行解析文档的进程数，0表示自动（CPU核数，最多4个），1表示不使用多进程
+    SPLITTER_LENGTH_UNIT = os.getenv("SPLITTER_LENGTH_UNIT", "chars").lower()  # 文档分块大小的计量单位: chars（字符数）或 tokens（估算的token数）
     UPLOAD_DIR = os.path.join("data", "uploads")
     KNOWLEDGE_DIR = os.path.join("data", "knowledge")
     
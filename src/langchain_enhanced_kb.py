@@ -2,15 +2,21 @@
 from typing import List, Dict, Any
 from .models.es_vector_store import ElasticSearchClient
 from .utils.embedding_client import EmbeddingClient
-from .utils.document_loader import DocumentLoader
+from .utils.document_loader import DocumentLoader, extract_content_and_metadata
 from .utils.logger import logger
 from .langchain_integration.qwen_model import QwenLLMWrapper
 from .langchain_integration.es_vector_store_wrapper import ElasticSearchVectorStore
-from .langchain_integration.chains import RAGChain, QuestionRephraseChain, ComparativeAnswerChain
+from .langchain_integration.chains import RAGChain, QuestionRephraseChain, ComparativeAnswerChain, StructuredOutputParser
+from .prompts import dynamic_prompt_generator
+import asyncio
 import os
 import sys
 
 
+# 结构化输出解析器无状态，模块级共享一个实例
+_OUTPUT_PARSER = StructuredOutputParser()
+
+
 class LangChainEnhancedKnowledgeBase:
     """基于LangChain增强版的知识库主类"""
     
@@ -56,32 +62,9 @@ class LangChainEnhancedKnowledgeBase:
                 raise RuntimeError("知识库未初始化")
         
         # 提取内容和元数据
-        texts = []
-        metadatas = []
-        
-        for i, doc in enumerate(documents):
-            logger.info(f"正在处理文档 {i+1}/{len(documents)}")
-            
-            # 获取文档内容
-            if hasattr(doc, 'page_content'):
-                content = doc.page_content
-            elif isinstance(doc, dict) and 'page_content' in doc:
-                content = doc['page_content']
-            elif isinstance(doc, str):
-                content = doc
-            else:
-                content = str(doc)
-            
-            # 获取元数据
-            if hasattr(doc, 'metadata'):
-                metadata = doc.metadata
-            elif isinstance(doc, dict) and 'metadata' in doc:
-                metadata = doc['metadata']
-            else:
-                metadata = {}
-            
-            texts.append(content)
-            metadatas.append(metadata)
+        pairs = list(map(extract_content_and_metadata, documents))
+        texts = [content for content, _ in pairs]
+        metadatas = [metadata for _, metadata in pairs]
         
         # 添加到向量存储
         ids = self.vector_store.add_texts(texts, metadatas)
@@ -146,6 +129,7 @@ class LangChainEnhancedKnowledgeBase:
     def ask(self, question: str, top_k: int = 5, use_reranker: bool = True, reranker_model: str = "default"):
         """使用LangChain RAG链提问并获取答案"""
         # 优先使用动态提示生成器分析文档类型
+        search_results = None
         try:
             # 搜索相关文档
             search_results = self.search(question, top_k, use_reranker=use_reranker, reranker_model=reranker_model)
@@ -168,22 +152,17 @@ class LangChainEnhancedKnowledgeBase:
                     'use_reranker': use_reranker  # 记录是否使用了重排序
                 })
             
-            context = "\n\n".join(context_parts)
-            
-            # 使用动态提示生成器根据上下文生成适应性提示
-            from .prompts import dynamic_prompt_generator
+            # 使用动态提示生成器根据上下文生成适应性提示（上下文片段由生成器拼接）
             adaptive_prompt = dynamic_prompt_generator.generate_context_aware_prompt(
                 question=question,
-                context=context
+                context_parts=context_parts
             )
             
             # 使用模型直接回答
             response = self.llm._call(adaptive_prompt)
             
             # 解析结构化响应
-            from .langchain_integration.chains import StructuredOutputParser
-            output_parser = StructuredOutputParser()
-            structured_response = output_parser.parse(response)
+            structured_response = _OUTPUT_PARSER.parse(response)
             
             # 提取最终答案
             answer = structured_response.get('final_answer', '未能从上下文中找到相关信息。')
@@ -206,6 +185,9 @@ class LangChainEnhancedKnowledgeBase:
                 "use_reranker": use_reranker,
                 "reranker_model": reranker_model
             }
+            # 检索已成功完成时复用其结果，避免再次嵌入和查询ES
+            if search_results is not None:
+                chain_input["search_results"] = search_results
             
             result = self.rag_chain(chain_input)
             
@@ -235,4 +217,38 @@ class LangChainEnhancedKnowledgeBase:
         }
         
         result = self.comparative_answer_chain(chain_input)
-        return result['final_answer']
\ No newline at end of file
+        return result['final_answer']
+
+    async def aask_comparative(
+        self,
+        question: str,
+        companies: List[str],
+        top_k: int = 5,
+        use_reranker: bool = True,
+        reranker_model: str = "default"
+    ):
+        """比较类问题：拆分为各公司的子问题并发回答，再汇总得出最终结论"""
+        rephrased_questions = await asyncio.to_thread(self.rephrase_question, question, companies)
+        
+        # 各子问题的检索与模型调用相互独立，总耗时取决于最慢的一个
+        sub_results = await asyncio.gather(*(
+            self.rag_chain.acall({
+                "question": item.get("question", question),
+                "top_k": top_k,
+                "use_reranker": use_reranker,
+                "reranker_model": reranker_model
+            })
+            for item in rephrased_questions
+        ))
+        
+        context = "\n\n".join(
+            f"{item.get('company_name', '')}: {result['answer']}"
+            for item, result in zip(rephrased_questions, sub_results)
+        )
+        final_answer = await asyncio.to_thread(self.get_comparative_answer, context, question)
+        
+        return {
+            'answer': final_answer,
+            'rephrased_questions': rephrased_questions,
+            'sub_answers': [result['answer'] for result in sub_results]
+        }
@@ -7,9 +7,76 @@ from langchain_core.output_parsers import BaseOutputParser
 from .qwen_model import QwenLLMWrapper
 from .es_vector_store_wrapper import ElasticSearchVectorStore
 from ..prompts import LangChainPrompts, StepByStepAnalysis
+from functools import lru_cache
+import asyncio
 import json
 import re
 from src.utils.logger import logger
+from src.utils.answer_type import determine_answer_type
+
+
+# StructuredOutputParser 使用的正则表达式，模块加载时编译一次
+_FENCE_RE = re.compile(r'```(?:json)?\s*\n?(.*?)```', re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+_STEP_RE = re.compile(r'"step_by_step_analysis"\s*:\s*"([^"]*)"')
+_STEP_ALT_RE = re.compile(r'"step_by_step_analysis"[^}]*?"([^"]*)"')
+_SUMMARY_RE = re.compile(r'"reasoning_summary"\s*:\s*"([^"]*)"')
+_SUMMARY_ALT_RE = re.compile(r'"reasoning_summary"[^}]*?"([^"]*)"')
+_PAGES_RE = re.compile(r'"relevant_pages"\s*:\s*\[([^\]]*)\]')
+_PAGES_ALT_RE = re.compile(r'\[([0-9,\s]+)\]')
+_FINAL_RE = re.compile(r'"final_answer"\s*:\s*"([^"]*)"')
+_FINAL_ALT_RE = re.compile(r'"final_answer"[^}]*?"([^"]*)"')
+_DIGIT_RE = re.compile(r'\d+')
+
+# 单次遍历转义JSON字符串中的控制字符
+_JSON_ESCAPE_TABLE = str.maketrans({'\n': '\\n', '\t': '\\t', '\r': '\\r'})
+
+# 快速路径优先使用orjson解析（其JSONDecodeError是json.JSONDecodeError的子类）；raw_decode只有标准库提供
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# raw_decode扫描使用的解码器及可接受对象的字段（含问题重写链输出的questions）
+_JSON_DECODER = json.JSONDecoder()
+_EXPECTED_KEYS = ("step_by_step_analysis", "reasoning_summary", "relevant_pages", "final_answer", "questions")
+
+# 答案类型到自适应提示模板构建函数的映射，未知类型回退到 string
+_PROMPT_BUILDERS = {
+    "name": LangChainPrompts.get_adaptive_name_qa_prompt,
+    "number": LangChainPrompts.get_adaptive_number_qa_prompt,
+    "boolean": LangChainPrompts.get_adaptive_boolean_qa_prompt,
+    "names": LangChainPrompts.get_adaptive_names_qa_prompt,
+    "string": LangChainPrompts.get_adaptive_string_qa_prompt,
+}
+
+
+@lru_cache(maxsize=None)
+def _get_prompt_template(answer_type: str) -> PromptTemplate:
+    """获取答案类型对应的提示模板（模板内容固定，每种类型只构建一次）"""
+    return _PROMPT_BUILDERS.get(answer_type, _PROMPT_BUILDERS["string"])()
+
+# 问题重写与比较答案的系统提示，导入一次；不可用时各链回退到简单提示
+try:
+    from ..prompts import RephrasedQuestionsPrompt
+    _REPHRASE_SYSTEM_PROMPT = RephrasedQuestionsPrompt.system_prompt
+except (ImportError, AttributeError):
+    _REPHRASE_SYSTEM_PROMPT = None
+
+try:
+    from ..prompts import ComparativeAnswerPrompt
+    _COMPARATIVE_SYSTEM_PROMPT = ComparativeAnswerPrompt.system_prompt
+except (ImportError, AttributeError):
+    _COMPARATIVE_SYSTEM_PROMPT = None
+
+
+def _try_json(text: str) -> Optional[Any]:
+    """尝试解析JSON，失败时返回None而不是抛出异常"""
+    try:
+        return _json_loads(text)
+    except json.JSONDecodeError:
+        return None
 
 
 class AnswerTypeClassifier:
@@ -26,43 +93,51 @@ class AnswerTypeClassifier:
         Returns:
             答案类型 ("name", "number", "boolean", "names", "string")
         """
-        question_lower = question.lower()
-        
-        # 数字类型关键词
-        number_keywords = ["多少", "金额", "数值", "数量", "比例", "百分比", "率", "收入", "利润", "资产", "负债", 
-                          "销售额", "成本", "费用", "投资", "市值", "股价", "收益", "产值", "产量", "销量"]
-        
-        # 名称类型关键词
-        name_keywords = ["谁", "哪个", "哪位", "什么人", "姓名", "名字", "叫什么", "称谓", "职务", "职位", "角色"]
-        
-        # Boolean类型关键词
-        boolean_keywords = ["是否", "有没有", "是否存在", "能否", "可否", "是不是", "有没有", "是否具备", "是否拥有"]
-        
-        # Names类型关键词
-        names_keywords = ["哪些", "哪些人", "几个人", "都有谁", "都包括", "分别", "列表", "清单", "所有", "多个"]
+        return determine_answer_type(question)
+
+class StructuredOutputParser(BaseOutputParser[Dict[str, Any]]):
+    """结构化输出解析器"""
+    
+    @staticmethod
+    def _raw_decode_first_object(text: str) -> Optional[Dict[str, Any]]:
+        """线性扫描每个"{"候选位置，返回第一个包含已知字段的合法JSON对象"""
+        start_idx = text.find("{")
+        while start_idx != -1:
+            try:
+                obj, _ = _JSON_DECODER.raw_decode(text, start_idx)
+            except json.JSONDecodeError:
+                obj = None
+            if isinstance(obj, dict) and any(key in obj for key in _EXPECTED_KEYS):
+                return obj
+            start_idx = text.find("{", start_idx + 1)
+        return None
+    
+    @staticmethod
+    def _extract_fields(text: str) -> Dict[str, Any]:
+        """使用正则表达式从无法解析的文本中提取常见的JSON键值"""
+        result = {}
         
-        # 检查数字类型
-        if any(keyword in question_lower for keyword in number_keywords):
-            return "number"
+        # 提取 step_by_step_analysis
+        step_match = _STEP_RE.search(text) or _STEP_ALT_RE.search(text)
+        if step_match:
+            result['step_by_step_analysis'] = step_match.group(1).replace('\\n', '\n')
         
-        # 检查名称类型
-        if any(keyword in question_lower for keyword in name_keywords):
-            return "name"
+        # 提取 reasoning_summary
+        summary_match = _SUMMARY_RE.search(text) or _SUMMARY_ALT_RE.search(text)
+        if summary_match:
+            result['reasoning_summary'] = summary_match.group(1)
         
-        # 检查Boolean类型
-        if any(keyword in question_lower for keyword in boolean_keywords):
-            return "boolean"
+        # 提取 relevant_pages（页码列表只含整数，直接提取数字，无需经过JSON解析）
+        pages_match = _PAGES_RE.search(text) or _PAGES_ALT_RE.search(text)
+        if pages_match:
+            result['relevant_pages'] = list(map(int, _DIGIT_RE.findall(pages_match.group(1))))
         
-        # 检查Names类型
-        if any(keyword in question_lower for keyword in names_keywords):
-            return "names"
+        # 提取 final_answer
+        final_match = _FINAL_RE.search(text) or _FINAL_ALT_RE.search(text)
+        if final_match:
+            result['final_answer'] = final_match.group(1)
         
-        # 默认为字符串类型
-        return "string"
-
-
-class StructuredOutputParser(BaseOutputParser[Dict[str, Any]]):
-    """结构化输出解析器"""
+        return result
     
     def parse(self, text: str) -> Dict[str, Any]:
         """
@@ -79,31 +154,15 @@ class StructuredOutputParser(BaseOutputParser[Dict[str, Any]]):
             processed_text = text.strip()
             
             # 如果文本包含markdown代码块，提取其中的内容
-            if "```" in processed_text:
-                # 找到第一个```之后的内容
-                lines = processed_text.split('\n')
-                inside_json = False
-                json_lines = []
-                
-                for line in lines:
-                    if line.strip().startswith('```json') or line.strip() == '```':
-                        if not inside_json and '```json' in line:
-                            inside_json = True
-                            continue
-                        elif inside_json and line.strip() == '```':
-                            inside_json = False
-                            continue
-                    if inside_json:
-                        json_lines.append(line)
-                
-                if json_lines:
-                    processed_text = '\n'.join(json_lines).strip()
+            fence_match = _FENCE_RE.search(processed_text)
+            fenced_text = fence_match.group(1).strip() if fence_match else ""
+            if fenced_text:
+                processed_text = fenced_text
             
             # 第一步：尝试直接解析整个文本
-            try:
-                return json.loads(processed_text)
-            except json.JSONDecodeError:
-                pass  # 继续尝试其他方法
+            parsed = _try_json(processed_text)
+            if parsed is not None:
+                return parsed
             
             # 第二步：尝试提取花括号内的内容
             start_idx = processed_text.find("{")
@@ -111,94 +170,39 @@ class StructuredOutputParser(BaseOutputParser[Dict[str, Any]]):
             
             if start_idx != -1 and end_idx != -1 and start_idx < end_idx:
                 json_candidate = processed_text[start_idx:end_idx+1]
+                parsed = _try_json(json_candidate)
+                if parsed is not None:
+                    return parsed
                 
-                # 尝试解析提取的内容
-                try:
-                    return json.loads(json_candidate)
-                except json.JSONDecodeError:
-                    # 如果直接解析失败，尝试清理常见格式错误
-                    cleaned_json = json_candidate
-                    
-                    # 移除尾部多余的逗号
-                    cleaned_json = re.sub(r',(\s*[}\]])', r'\1', cleaned_json)
-                    
-                    # 替换可能造成问题的特殊字符
-                    cleaned_json = cleaned_json.replace('\n', '\\n').replace('\t', '\\t').replace('\r', '\\r')
-                    
-                    try:
-                        return json.loads(cleaned_json)
-                    except json.JSONDecodeError:
-                        pass  # 继续尝试其他方法
+                # 如果直接解析失败，移除尾部多余的逗号并替换可能造成问题的特殊字符
+                cleaned_json = _TRAILING_COMMA_RE.sub(r'\1', json_candidate).translate(_JSON_ESCAPE_TABLE)
+                parsed = _try_json(cleaned_json)
+                if parsed is not None:
+                    return parsed
             
-            # 第三步：如果上述尝试都失败，尝试使用正则表达式提取键值对
-            # 查找常见的JSON键
-            result = {}
+            # 第三步：从每个"{"位置用C实现的raw_decode尝试解析，跳过JSON前后的多余文字
+            parsed = self._raw_decode_first_object(processed_text)
+            if parsed is not None:
+                return parsed
             
-            # 提取 step_by_step_analysis
-            step_match = re.search(r'"step_by_step_analysis"\s*:\s*"([^"]*)"', processed_text)
-            if step_match:
-                result['step_by_step_analysis'] = step_match.group(1).replace('\\n', '\n')
-            else:
-                # 尝试查找非转义的引号
-                step_alt_match = re.search(r'"step_by_step_analysis"[^}]*?"([^"]*)"', processed_text)
-                if step_alt_match:
-                    result['step_by_step_analysis'] = step_alt_match.group(1).replace('\\n', '\n')
+            # 第四步：如果上述尝试都失败，尝试使用正则表达式提取键值对
+            result = self._extract_fields(processed_text)
             
-            # 提取 reasoning_summary
-            summary_match = re.search(r'"reasoning_summary"\s*:\s*"([^"]*)"', processed_text)
-            if summary_match:
-                result['reasoning_summary'] = summary_match.group(1)
-            else:
-                summary_alt_match = re.search(r'"reasoning_summary"[^}]*?"([^"]*)"', processed_text)
-                if summary_alt_match:
-                    result['reasoning_summary'] = summary_alt_match.group(1)
-            
-            # 提取 relevant_pages
-            pages_match = re.search(r'"relevant_pages"\s*:\s*\[([^\]]*)\]', processed_text)
-            if pages_match:
-                try:
-                    pages_str = "[" + pages_match.group(1) + "]"
-                    result['relevant_pages'] = json.loads(pages_str)
-                except:
-                    # 如果列表解析失败，尝试手动解析
-                    page_numbers = re.findall(r'\d+', pages_match.group(1))
-                    result['relevant_pages'] = [int(p) for p in page_numbers]
-            else:
-                # 查找列表模式的替代方案
-                pages_alt_match = re.search(r'\[([0-9,\s]+)\]', processed_text)
-                if pages_alt_match:
-                    page_numbers = re.findall(r'\d+', pages_alt_match.group(1))
-                    result['relevant_pages'] = [int(p) for p in page_numbers if p]
-            
-            # 提取 final_answer
-            final_match = re.search(r'"final_answer"\s*:\s*"([^"]*)"', processed_text)
-            if final_match:
-                result['final_answer'] = final_match.group(1)
-            else:
-                final_alt_match = re.search(r'"final_answer"[^}]*?"([^"]*)"', processed_text)
-                if final_alt_match:
-                    result['final_answer'] = final_alt_match.group(1)
-            
-            # 如果至少提取到了一个字段，返回结果
-            if result:
-                # 补全缺失的字段
-                if 'step_by_step_analysis' not in result:
-                    result['step_by_step_analysis'] = "未找到分步分析"
-                if 'reasoning_summary' not in result:
-                    result['reasoning_summary'] = "未找到推理摘要"
-                if 'relevant_pages' not in result:
-                    result['relevant_pages'] = []
-                if 'final_answer' not in result:
-                    result['final_answer'] = processed_text
-                return result
-            else:
-                # 如果所有方法都失败，返回默认结构
+            # 如果所有方法都失败，返回默认结构
+            if not result:
                 return {
                     "step_by_step_analysis": f"无法解析响应格式，原始内容: {processed_text[:200]}...",
                     "reasoning_summary": "响应格式异常",
                     "relevant_pages": [],
                     "final_answer": processed_text
                 }
+            
+            # 至少提取到了一个字段，补全缺失的字段
+            result.setdefault('step_by_step_analysis', "未找到分步分析")
+            result.setdefault('reasoning_summary', "未找到推理摘要")
+            result.setdefault('relevant_pages', [])
+            result.setdefault('final_answer', processed_text)
+            return result
                 
         except Exception as e:
             logger.error(f"解析过程中遇到未知错误: {str(e)}")
@@ -210,7 +214,6 @@ class StructuredOutputParser(BaseOutputParser[Dict[str, Any]]):
                 "final_answer": text
             }
 
-
 class RAGChain:
     """RAG链实现"""
     
@@ -238,31 +241,31 @@ class RAGChain:
         use_reranker = inputs.get("use_reranker", True)
         reranker_model = inputs.get("reranker_model", "default")
 
-        # 步骤1: 搜索相关文档
-        search_results = self.vector_store.hybrid_search(
-            query_text=question,
-            top_k=top_k,
-            use_reranker=use_reranker,
-            reranker_model=reranker_model
-        )
+        # 步骤1: 搜索相关文档（调用方已提供检索结果时直接复用）
+        search_results = inputs.get("search_results")
+        if search_results is None:
+            search_results = self.vector_store.hybrid_search(
+                query_text=question,
+                top_k=top_k,
+                use_reranker=use_reranker,
+                reranker_model=reranker_model
+            )
         
         # 构建上下文
-        context_parts = []
-        sources = []
-
-        for result in search_results:
-            context_parts.append(result['content'])
-            # 优先使用重排序得分，如果没有则使用混合得分
-            score = result.get('rerank_score', result.get('hybrid_score', 0.0))
-            sources.append({
+        context_parts = [result['content'] for result in search_results]
+        # 优先使用重排序得分，如果没有则使用混合得分
+        sources = [
+            {
                 'id': result['id'],
                 'content': result['content'][:200] + "...",
-                'score': score,
+                'score': result.get('rerank_score', result.get('hybrid_score', 0.0)),
                 'original_score': result.get('hybrid_score', 0.0),  # 保留原始得分
                 'rerank_position': result.get('rerank_position'),   # 重排序位置
                 'original_position': result.get('original_position'), # 原始位置
                 'use_reranker': use_reranker  # 记录是否使用了重排序
-            })
+            }
+            for result in search_results
+        ]
         
         context = "\n\n".join(context_parts)
         
@@ -270,16 +273,7 @@ class RAGChain:
         answer_type = self.answer_type_classifier.determine_answer_type(question)
         
         # 选择相应的提示模板
-        if answer_type == "name":
-            prompt_template = LangChainPrompts.get_adaptive_name_qa_prompt()
-        elif answer_type == "number":
-            prompt_template = LangChainPrompts.get_adaptive_number_qa_prompt()
-        elif answer_type == "boolean":
-            prompt_template = LangChainPrompts.get_adaptive_boolean_qa_prompt()
-        elif answer_type == "names":
-            prompt_template = LangChainPrompts.get_adaptive_names_qa_prompt()
-        else:  # 默认为 string
-            prompt_template = LangChainPrompts.get_adaptive_string_qa_prompt()
+        prompt_template = _get_prompt_template(answer_type)
         
         # 格式化提示
         formatted_prompt = prompt_template.format(context=context, question=question)
@@ -318,6 +312,19 @@ class RAGChain:
             }
 
 
+    async def acall(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        异步执行RAG链：检索与模型调用在线程中运行，多个子问题可通过asyncio.gather并发
+        
+        Args:
+            inputs: 输入参数，同__call__
+            
+        Returns:
+            输出结果
+        """
+        return await asyncio.to_thread(self, inputs)
+
+
 class QuestionRephraseChain:
     """问题重写链实现"""
     
@@ -341,17 +348,13 @@ class QuestionRephraseChain:
         question = inputs["question"]
         companies = inputs["companies"]
         
-        # 检查LangChainPrompts中是否存在rephrase_question_prompt
-        # 如果不存在，我们使用动态提示生成器或者手动构建
-        try:
-            from ..prompts import RephrasedQuestionsPrompt
+        companies_str = ", ".join(f'"{comp}"' for comp in companies)
+        if _REPHRASE_SYSTEM_PROMPT is not None:
             # 使用原始提示结构构建
-            companies_str = ", ".join([f'"{comp}"' for comp in companies])
             user_content = f"原始比较问题：'{question}'\n\n涉及公司：{companies_str}"
-            formatted_prompt = f"{RephrasedQuestionsPrompt.system_prompt}\n\n{user_content}"
-        except:
+            formatted_prompt = f"{_REPHRASE_SYSTEM_PROMPT}\n\n{user_content}"
+        else:
             # 回退到简单的提示
-            companies_str = ", ".join([f'"{comp}"' for comp in companies])
             formatted_prompt = f"你是一个问题重写系统。将比较问题'{question}'拆解为针对每个公司的独立问题。涉及公司：{companies_str}。请返回JSON格式：{{'questions': [{{'company_name': '...', 'question': '...'}}]}}"
         
         try:
@@ -394,13 +397,10 @@ class ComparativeAnswerChain:
         context = inputs["context"]
         question = inputs["question"]
         
-        # 检查LangChainPrompts中是否存在comparative_answer_prompt
-        # 如果不存在，我们使用动态提示生成器或者手动构建
-        try:
-            from ..prompts import ComparativeAnswerPrompt
+        if _COMPARATIVE_SYSTEM_PROMPT is not None:
             # 使用原始提示结构构建
-            formatted_prompt = f"{ComparativeAnswerPrompt.system_prompt}\n\n以下是单个公司的回答：\n\"{context}\"\n\n---\n\n以下是原始比较问题：\n\"{question}\""
-        except:
+            formatted_prompt = f"{_COMPARATIVE_SYSTEM_PROMPT}\n\n以下是单个公司的回答：\n\"{context}\"\n\n---\n\n以下是原始比较问题：\n\"{question}\""
+        else:
             # 回退到简单的提示
             formatted_prompt = f"你是一个问答系统，基于各公司独立答案给出原始比较问题的最终结论。只能基于已给出的答案，不可引入外部知识。请分步详细推理。\n\n以下是单个公司的回答：\n\"{context}\"\n\n---\n\n以下是原始比较问题：\n\"{question}\"。请返回JSON格式：{{'step_by_step_analysis': '...', 'reasoning_summary': '...', 'relevant_pages': [], 'final_answer': '...'}}"
         
@@ -14,6 +14,8 @@ from langchain_core.vectorstores import VectorStore
 from src.models.es_vector_store import ElasticSearchClient
 from src.utils.logger import logger
 from src.config.settings import Config
+from collections import OrderedDict
+import threading
 import numpy as np
 
 
@@ -36,8 +38,41 @@ class ElasticSearchVectorStore(VectorStore):
         """
         self.es_client = es_client
         self.embedding_function = embedding_function
+        # 自定义嵌入函数的查询向量缓存（EmbeddingClient自带缓存）
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        # 未提供嵌入函数时使用的默认嵌入客户端，首次使用时创建
+        self._fallback_embedder = None
         super().__init__()
     
+    def _get_fallback_embedder(self):
+        """获取项目原有的嵌入客户端（每个实例只创建一次）"""
+        if self._fallback_embedder is None:
+            from src.utils.embedding_client import EmbeddingClient
+            self._fallback_embedder = EmbeddingClient()
+        return self._fallback_embedder
+    
+    def _embed_query(self, query: str) -> List[float]:
+        """生成查询向量，重复查询直接复用缓存结果"""
+        if not self.embedding_function:
+            return self._get_fallback_embedder().embed_query(query)
+        
+        if Config.EMBEDDING_CACHE_SIZE <= 0:
+            return self.embedding_function.embed_query(query)
+        
+        with self._query_cache_lock:
+            cached = self._query_cache.get(query)
+            if cached is not None:
+                self._query_cache.move_to_end(query)
+                return cached
+        
+        query_vector = self.embedding_function.embed_query(query)
+        with self._query_cache_lock:
+            self._query_cache[query] = query_vector
+            while len(self._query_cache) > Config.EMBEDDING_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return query_vector
+    
     def add_texts(
         self,
         texts: List[str],
@@ -55,29 +90,23 @@ class ElasticSearchVectorStore(VectorStore):
         Returns:
             IDs列表
         """
-        ids = []
-        
-        for i, text in enumerate(texts):
-            # 生成嵌入向量
-            if self.embedding_function:
-                embedding = self.embedding_function.embed_query(text)
-            else:
-                # 使用项目原有的嵌入客户端
-                from src.utils.embedding_client import EmbeddingClient
-                embedding_client = EmbeddingClient()
-                embedding = embedding_client.embed_query(text)
-            
-            # 准备元数据
-            metadata = metadatas[i] if metadatas and i < len(metadatas) else {}
-            
-            # 添加到向量数据库
-            result_id = self.es_client.add_document(
-                content=text,
-                vector=embedding,
-                metadata=metadata
-            )
-            
-            ids.append(result_id)
+        embedder = self.embedding_function or self._get_fallback_embedder()
+        batch_size = Config.EMBEDDING_BATCH_SIZE
+        
+        def iter_documents():
+            # 按批次生成嵌入向量，摊薄每次API调用的网络往返；以生成器形式交给bulk写入
+            for start in range(0, len(texts), batch_size):
+                batch_texts = texts[start:start + batch_size]
+                embeddings = embedder.embed_documents(batch_texts)
+                
+                for offset, (text, embedding) in enumerate(zip(batch_texts, embeddings)):
+                    i = start + offset
+                    # 准备元数据
+                    metadata = metadatas[i] if metadatas and i < len(metadatas) else {}
+                    yield text, embedding, metadata
+        
+        # 批量写入向量数据库
+        ids = self.es_client.bulk_add_documents(iter_documents())
             
         logger.info(f"成功添加 {len(ids)} 个文档到向量存储")
         return ids
@@ -100,12 +129,7 @@ class ElasticSearchVectorStore(VectorStore):
             Document列表
         """
         # 生成查询向量
-        if self.embedding_function:
-            query_vector = self.embedding_function.embed_query(query)
-        else:
-            from src.utils.embedding_client import EmbeddingClient
-            embedding_client = EmbeddingClient()
-            query_vector = embedding_client.embed_query(query)
+        query_vector = self._embed_query(query)
         
         # 执行搜索
         results = self.es_client.search(
@@ -150,12 +174,7 @@ class ElasticSearchVectorStore(VectorStore):
             搜索结果列表
         """
         # 生成查询向量
-        if self.embedding_function:
-            query_vector = self.embedding_function.embed_query(query_text)
-        else:
-            from src.utils.embedding_client import EmbeddingClient
-            embedding_client = EmbeddingClient()
-            query_vector = embedding_client.embed_query(query_text)
+        query_vector = self._embed_query(query_text)
         
         # 执行混合搜索
         results = self.es_client.hybrid_search(
@@ -1,5 +1,8 @@
 """LangChain兼容的通义千问模型包装器"""
 from typing import Any, Dict, List, Optional, Union, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import asyncio
 from langchain_core.callbacks import CallbackManagerForLLMRun
 from langchain_core.language_models import BaseLanguageModel, LanguageModelInput
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
@@ -9,6 +12,50 @@ from langchain_core.runnables import RunnableConfig
 import dashscope
 from src.config.settings import Config
 from src.utils.logger import logger
+from src.utils.dashscope_http import install_dashscope_keepalive
+
+# _generate 批量提示词时的最大并发调用数
+MAX_CONCURRENT_GENERATIONS = 8
+# temperature 为 0 时缓存的响应条数
+GENERATION_CACHE_SIZE = 512
+
+
+def _call_generation(model_name: str, prompt: str, temperature: float, max_tokens: int) -> str:
+    """调用 DashScope 生成接口，返回响应文本"""
+    response = dashscope.Generation.call(
+        model=model_name,
+        prompt=prompt,
+        temperature=temperature,
+        max_tokens=max_tokens
+    )
+    
+    if response.status_code == 200:
+        response_text = response.output.text
+        logger.info(f"收到模型响应: {response_text[:50]}...")
+        return response_text
+    else:
+        error_msg = f"API调用失败: {response.code} - {response.message}"
+        logger.error(error_msg)
+        raise Exception(error_msg)
+
+
+# 异常不会被 lru_cache 缓存，失败的调用下次仍会重试
+_cached_generation = lru_cache(maxsize=GENERATION_CACHE_SIZE)(_call_generation)
+
+# 消息类型到角色前缀的映射
+_MESSAGE_PREFIXES = {
+    HumanMessage: "Human: ",
+    AIMessage: "Assistant: ",
+    SystemMessage: "System: ",
+}
+
+
+def _format_message(msg: BaseMessage) -> str:
+    """格式化单条消息：精确类型走字典查找，子类（如消息块）回退到isinstance判断"""
+    prefix = _MESSAGE_PREFIXES.get(type(msg))
+    if prefix is None:
+        prefix = next((p for cls, p in _MESSAGE_PREFIXES.items() if isinstance(msg, cls)), "")
+    return f"{prefix}{msg.content}"
 
 
 class QwenLLMWrapper(BaseLanguageModel[str]):
@@ -26,6 +73,7 @@ class QwenLLMWrapper(BaseLanguageModel[str]):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         dashscope.api_key = self.api_key
+        install_dashscope_keepalive()
         
     @property
     def _llm_type(self) -> str:
@@ -39,33 +87,28 @@ class QwenLLMWrapper(BaseLanguageModel[str]):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> LLMResult:
-        """同步生成方法"""
-        generations = []
+        """同步生成方法（多个提示词并发调用）"""
+        if len(prompts) <= 1:
+            texts = [self._raw_call(prompt) for prompt in prompts]
+        else:
+            # DashScope调用是I/O密集型，线程等待网络时会释放GIL；map保持结果与提示词顺序一致
+            with ThreadPoolExecutor(max_workers=min(len(prompts), MAX_CONCURRENT_GENERATIONS)) as executor:
+                texts = list(executor.map(self._raw_call, prompts))
         
-        for prompt in prompts:
-            try:
-                response = dashscope.Generation.call(
-                    model=self.model_name,
-                    prompt=prompt,
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens
-                )
-                
-                if response.status_code == 200:
-                    text = response.output.text
-                    generations.append([{'text': text}])  # 修改为正确的格式
-                    logger.info(f"模型响应成功: {text[:50]}...")
-                else:
-                    error_msg = f"API调用失败: {response.code} - {response.message}"
-                    logger.error(error_msg)
-                    raise Exception(error_msg)
-                    
-            except Exception as e:
-                logger.error(f"生成失败: {str(e)}")
-                raise
-                
+        generations = [[{'text': text}] for text in texts]  # 修改为正确的格式
         return LLMResult(generations=generations)
     
+    def _raw_call(self, prompt: str) -> str:
+        """调用模型并返回文本，_call、_generate 共用此入口"""
+        try:
+            if self.temperature == 0:
+                # 温度为0时输出确定，相同提示词直接复用缓存的响应
+                return _cached_generation(self.model_name, prompt, self.temperature, self.max_tokens)
+            return _call_generation(self.model_name, prompt, self.temperature, self.max_tokens)
+        except Exception as e:
+            logger.error(f"调用失败: {str(e)}")
+            raise
+    
     def _stream(
         self,
         prompts: List[str],
@@ -73,25 +116,32 @@ class QwenLLMWrapper(BaseLanguageModel[str]):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> Iterator[GenerationChunk]:
-        """流式生成方法"""
+        """流式生成方法（增量输出，收到片段即返回）"""
         for prompt in prompts:
             try:
-                # DashScope目前不支持真正的流式输出，我们模拟单次输出
-                response = dashscope.Generation.call(
+                responses = dashscope.Generation.call(
                     model=self.model_name,
                     prompt=prompt,
                     temperature=self.temperature,
-                    max_tokens=self.max_tokens
+                    max_tokens=self.max_tokens,
+                    stream=True,
+                    incremental_output=True
                 )
                 
-                if response.status_code == 200:
-                    text = response.output.text
-                    # 模拟流式输出
-                    yield GenerationChunk(text=text, generation_info={"finish_reason": "stop"})
-                else:
-                    error_msg = f"API调用失败: {response.code} - {response.message}"
-                    logger.error(error_msg)
-                    raise Exception(error_msg)
+                for response in responses:
+                    if response.status_code != 200:
+                        error_msg = f"API调用失败: {response.code} - {response.message}"
+                        logger.error(error_msg)
+                        raise Exception(error_msg)
+                    
+                    text = response.output.text or ""
+                    # 中间片段的 finish_reason 为 "null"，只在最后一个片段上标记结束原因
+                    finish_reason = response.output.finish_reason
+                    generation_info = {"finish_reason": finish_reason} if finish_reason not in (None, "null") else None
+                    chunk = GenerationChunk(text=text, generation_info=generation_info)
+                    if run_manager:
+                        run_manager.on_llm_new_token(text, chunk=chunk)
+                    yield chunk
                     
             except Exception as e:
                 logger.error(f"流式生成失败: {str(e)}")
@@ -105,26 +155,7 @@ class QwenLLMWrapper(BaseLanguageModel[str]):
         **kwargs: Any,
     ) -> str:
         """直接调用方法"""
-        try:
-            response = dashscope.Generation.call(
-                model=self.model_name,
-                prompt=prompt,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
-            
-            if response.status_code == 200:
-                response_text = response.output.text
-                logger.info(f"收到模型响应: {response_text[:50]}...")
-                return response_text
-            else:
-                error_msg = f"API调用失败: {response.code} - {response.message}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
-                
-        except Exception as e:
-            logger.error(f"调用失败: {str(e)}")
-            raise
+        return self._raw_call(prompt)
     
     @property
     def _identifying_params(self) -> Dict[str, Any]:
@@ -157,17 +188,7 @@ class QwenLLMWrapper(BaseLanguageModel[str]):
 
     def _format_messages_to_string(self, messages: List[BaseMessage]) -> str:
         """将消息列表格式化为字符串"""
-        formatted_messages = []
-        for msg in messages:
-            if isinstance(msg, HumanMessage):
-                formatted_messages.append(f"Human: {msg.content}")
-            elif isinstance(msg, AIMessage):
-                formatted_messages.append(f"Assistant: {msg.content}")
-            elif isinstance(msg, SystemMessage):
-                formatted_messages.append(f"System: {msg.content}")
-            else:
-                formatted_messages.append(str(msg.content))
-        return "\n".join(formatted_messages)
+        return "\n".join(_format_message(msg) for msg in messages)
 
     def predict(self, text: str, **kwargs: Any) -> str:
         """实现predict方法"""
@@ -197,13 +218,12 @@ class QwenLLMWrapper(BaseLanguageModel[str]):
         **kwargs: Any
     ) -> LLMResult:
         """实现异步agenerate_prompt方法"""
-        # 同步实现
-        return self._generate(prompts, stop=stop, **kwargs)
+        # 在线程中执行同步调用，等待DashScope响应期间不阻塞事件循环
+        return await asyncio.to_thread(self._generate, prompts, stop=stop, **kwargs)
 
     async def apredict(self, text: str, **kwargs: Any) -> str:
         """实现异步apredict方法"""
-        # 同步实现
-        return self._call(prompt=text, **kwargs)
+        return await asyncio.to_thread(self._call, prompt=text, **kwargs)
 
     async def apredict_messages(
         self, 
@@ -211,7 +231,6 @@ class QwenLLMWrapper(BaseLanguageModel[str]):
         **kwargs: Any
     ) -> AIMessage:
         """实现异步apredict_messages方法"""
-        # 同步实现
         text = self._format_messages_to_string(messages)
-        response_text = self._call(prompt=text, **kwargs)
+        response_text = await asyncio.to_thread(self._call, prompt=text, **kwargs)
         return AIMessage(content=response_text)
\ No newline at end of file
@@ -1,13 +1,17 @@
 # 向量数据库客户端 - ElasticSearch
-from elasticsearch import Elasticsearch
-from typing import List, Dict, Any, Optional
+from elasticsearch import Elasticsearch, BadRequestError, AuthorizationException
+from elasticsearch.helpers import parallel_bulk
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+import heapq
+import math
+import threading
 import sys
 import os
 # 添加项目根目录到路径中
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config.settings import Config
 from utils.logger import logger
-from utils.es_compatibility import create_es_client, adjust_mapping_for_es9
+from utils.es_compatibility import get_es_client, adjust_mapping_for_es9, to_es_vector
 import numpy as np
 
 # 导入高兼容性重排序器
@@ -17,19 +21,60 @@ except ImportError as e:
     logger.warning(f"无法导入高兼容性重排序器: {e}")
     get_high_comp_reranker = None
 
+# bulk写入每个请求的最大文档数与字节数
+BULK_CHUNK_SIZE = 500
+BULK_MAX_CHUNK_BYTES = 10 * 1024 * 1024
+# 已分块、等待发送的bulk请求队列长度
+BULK_QUEUE_SIZE = 4
+
+# 批量写入期间使用的索引设置：降低刷新频率、异步刷写translog；写入结束后重置为默认值
+BULK_LOAD_SETTINGS = {"refresh_interval": "30s", "translog.durability": "async"}
+BULK_LOAD_RESET_SETTINGS = {"refresh_interval": None, "translog.durability": None}
+# 各索引正在进行的批量写入数：第一个写入开始时应用上述设置，最后一个写入结束时才重置，
+# 避免并发上传中先结束的写入把仍在写入的索引改回默认设置
+_active_bulk_loads: Dict[str, int] = {}
+_bulk_loads_lock = threading.Lock()
+
+# HNSW建图参数（ES默认值）
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 100
+
+# kNN检索的候选数：top_k的倍数，且不低于下限、不超过ES允许的上限
+KNN_CANDIDATES_FACTOR = 10
+KNN_MIN_CANDIDATES = 100
+KNN_MAX_CANDIDATES = 10000
+# cosine相似度的kNN得分为 (1 + cos) / 2，乘2还原为 cos + 1 区间，保持混合搜索权重不变
+VECTOR_SCORE_SCALE = 2.0
+
+# 服务端RRF融合参数：参与融合的排名窗口为 top_k 的倍数，rank_constant 使用ES默认值
+RRF_WINDOW_FACTOR = 4
+RRF_RANK_CONSTANT = 60
+
+# 检索结果只返回需要的字段（不回传1024维向量），且不统计命中总数
+SEARCH_RESPONSE_OPTIONS = {"_source": ["content", "metadata"], "track_total_hits": False}
+
+# 关键词搜索的检索字段（只能查询文本和关键字类型字段），模块级常量避免每次请求重建
+KEYWORD_SEARCH_FIELDS = ["content^2", "metadata.source", "metadata.filename", "metadata.title", "metadata.author", "metadata.subject", "metadata.creator", "metadata.producer", "metadata.keywords"]
+
 class ElasticSearchClient:
     """ElasticSearch 向量数据库客户端"""
     
     def __init__(self):
-        # 使用兼容ES 9.x的方式创建客户端
-        self.es = create_es_client()
+        # 使用兼容ES 9.x的方式创建客户端（进程内共享同一个客户端和连接池）
+        self.es = get_es_client()
         self.index_name = Config.ES_INDEX_NAME
+        self._use_rrf = Config.ES_HYBRID_FUSION == "rrf"
+        # 已确认索引存在后不再重复发送exists请求，删除索引时重置
+        self._index_exists: Optional[bool] = None
         
     def create_index(self, dimension: int = 1536):
         """创建向量索引"""
+        if self._index_exists:
+            return True
         try:
             if self.es.indices.exists(index=self.index_name):
                 logger.info(f"索引 {self.index_name} 已存在")
+                self._index_exists = True
                 return True
                 
             mapping = {
@@ -43,7 +88,14 @@ class ElasticSearchClient:
                             "type": "dense_vector",
                             "dims": dimension,
                             "index": True,
-                            "similarity": "cosine"
+                            "similarity": "cosine",
+                            # 文档向量仍以float32写入，由ES在建图时做int8标量量化，
+                            # 查询向量同样由ES量化，检索时无需额外处理
+                            "index_options": {
+                                "type": Config.ES_VECTOR_INDEX_TYPE,
+                                "m": HNSW_M,
+                                "ef_construction": HNSW_EF_CONSTRUCTION
+                            }
                         },
                         "metadata": {
                             "type": "object",
@@ -95,17 +147,7 @@ class ElasticSearchClient:
                 body=mapping
             )
             logger.info(f"成功创建索引 {self.index_name}")
-            return result.get('acknowledged', False)
-            
-        except Exception as e:
-            logger.error(f"创建索引失败: {str(e)}")
-            raise
-            
-            result = self.es.indices.create(
-                index=self.index_name,
-                body=mapping
-            )
-            logger.info(f"成功创建索引 {self.index_name}")
+            self._index_exists = True
             return result.get('acknowledged', False)
             
         except Exception as e:
@@ -117,7 +159,7 @@ class ElasticSearchClient:
         try:
             doc = {
                 "content": content,
-                "vector": vector,
+                "vector": to_es_vector(vector),
                 "metadata": metadata or {}
             }
             
@@ -133,38 +175,134 @@ class ElasticSearchClient:
             logger.error(f"添加文档失败: {str(e)}")
             raise
     
+    def _put_index_settings(self, settings: Dict[str, Any]):
+        """更新索引设置，失败时只记录警告，不影响写入本身"""
+        try:
+            self.es.indices.put_settings(index=self.index_name, settings={"index": settings})
+        except Exception as e:
+            logger.warning(f"更新索引设置失败: {str(e)}")
+    
+    def _begin_bulk_load(self):
+        """登记一次批量写入，当前索引没有其他写入时应用批量写入设置"""
+        with _bulk_loads_lock:
+            active = _active_bulk_loads.get(self.index_name, 0)
+            if active == 0:
+                self._put_index_settings(BULK_LOAD_SETTINGS)
+            _active_bulk_loads[self.index_name] = active + 1
+    
+    def _end_bulk_load(self):
+        """结束一次批量写入，最后一个写入结束时重置索引设置"""
+        with _bulk_loads_lock:
+            active = _active_bulk_loads.get(self.index_name, 1) - 1
+            if active == 0:
+                _active_bulk_loads.pop(self.index_name, None)
+                self._put_index_settings(BULK_LOAD_RESET_SETTINGS)
+            else:
+                _active_bulk_loads[self.index_name] = active
+    
+    def bulk_add_documents(self, documents: Iterable[Tuple[str, List[float], Dict[str, Any]]]) -> List[str]:
+        """
+        批量添加文档到索引，按块发送bulk请求代替逐条index，多个线程并发发送bulk请求
+        
+        Args:
+            documents: (content, vector, metadata) 三元组的可迭代对象，可以是生成器
+            
+        Returns:
+            写入文档的ID列表
+        """
+        actions = (
+            {
+                "_op_type": "index",
+                "_index": self.index_name,
+                "_source": {
+                    "content": content,
+                    "vector": to_es_vector(vector),
+                    "metadata": metadata or {}
+                }
+            }
+            for content, vector, metadata in documents
+        )
+        
+        ids = []
+        self._begin_bulk_load()
+        try:
+            for _, item in parallel_bulk(
+                self.es.options(request_timeout=60),
+                actions,
+                thread_count=max(1, Config.ES_BULK_THREADS),
+                chunk_size=BULK_CHUNK_SIZE,
+                max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+                queue_size=BULK_QUEUE_SIZE
+            ):
+                ids.append(item["index"].get("_id"))
+        except Exception as e:
+            logger.error(f"批量添加文档失败: {str(e)}")
+            raise
+        finally:
+            self._end_bulk_load()
+        
+        # 写入期间降低了刷新频率，结束后刷新一次使新文档立即可检索
+        try:
+            self.es.indices.refresh(index=self.index_name)
+        except Exception as e:
+            logger.warning(f"刷新索引失败: {str(e)}")
+        
+        logger.debug(f"批量添加文档成功: {len(ids)} 个")
+        return ids
+    
+    @staticmethod
+    def _vector_query_body(query_vector: List[float], top_k: int) -> Dict[str, Any]:
+        """构建向量检索请求体"""
+        # 使用dense_vector索引的HNSW图做近似kNN检索，避免script_score逐文档计算余弦相似度
+        return {
+            "knn": {
+                "field": "vector",
+                "query_vector": to_es_vector(query_vector),
+                "k": top_k,
+                "num_candidates": min(max(top_k * KNN_CANDIDATES_FACTOR, KNN_MIN_CANDIDATES), KNN_MAX_CANDIDATES)
+            },
+            **SEARCH_RESPONSE_OPTIONS,
+            "size": top_k
+        }
+    
+    @staticmethod
+    def _keyword_query_body(query: str, top_k: int) -> Dict[str, Any]:
+        """构建关键词检索请求体"""
+        return {
+            "query": {
+                "multi_match": {
+                    "query": query,
+                    "fields": KEYWORD_SEARCH_FIELDS,
+                    "type": "best_fields",
+                    "fuzziness": "AUTO"
+                }
+            },
+            **SEARCH_RESPONSE_OPTIONS,
+            "size": top_k
+        }
+    
+    @staticmethod
+    def _hits_to_results(response: Dict[str, Any], score_scale: float = 1.0) -> List[Dict[str, Any]]:
+        """将ES命中结果转换为统一的结果字典"""
+        results = []
+        for hit in response['hits']['hits']:
+            results.append({
+                'id': hit['_id'],
+                'score': hit['_score'] * score_scale,
+                'content': hit['_source']['content'],
+                'metadata': hit['_source']['metadata']
+            })
+        return results
+    
     def search_by_vector(self, query_vector: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
         """基于向量相似度搜索"""
         try:
-            query = {
-                "query": {
-                    "script_score": {
-                        "query": {"match_all": {}},
-                        "script": {
-                            "source": "cosineSimilarity(params.query_vector, 'vector') + 1.0",
-                            "params": {
-                                "query_vector": query_vector
-                            }
-                        }
-                    }
-                },
-                "size": top_k
-            }
-            
             response = self.es.search(
                 index=self.index_name,
-                body=query
+                body=self._vector_query_body(query_vector, top_k)
             )
             
-            results = []
-            for hit in response['hits']['hits']:
-                results.append({
-                    'id': hit['_id'],
-                    'score': hit['_score'],
-                    'content': hit['_source']['content'],
-                    'metadata': hit['_source']['metadata']
-                })
-                
+            results = self._hits_to_results(response, VECTOR_SCORE_SCALE)
             logger.debug(f"向量搜索返回了 {len(results)} 个结果")
             return results
             
@@ -175,32 +313,12 @@ class ElasticSearchClient:
     def keyword_search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """基于关键词搜索"""
         try:
-            query_body = {
-                "query": {
-                    "multi_match": {
-                        "query": query,
-                        "fields": ["content^2", "metadata.source", "metadata.filename", "metadata.title", "metadata.author", "metadata.subject", "metadata.creator", "metadata.producer", "metadata.keywords"],  # 只能查询文本和关键字类型字段
-                        "type": "best_fields",
-                        "fuzziness": "AUTO"
-                    }
-                },
-                "size": top_k
-            }
-            
             response = self.es.search(
                 index=self.index_name,
-                body=query_body
+                body=self._keyword_query_body(query, top_k)
             )
             
-            results = []
-            for hit in response['hits']['hits']:
-                results.append({
-                    'id': hit['_id'],
-                    'score': hit['_score'],
-                    'content': hit['_source']['content'],
-                    'metadata': hit['_source']['metadata']
-                })
-                
+            results = self._hits_to_results(response)
             logger.debug(f"关键词搜索返回了 {len(results)} 个结果")
             return results
             
@@ -208,62 +326,120 @@ class ElasticSearchClient:
             logger.error(f"关键词搜索失败: {str(e)}")
             raise
     
+    def _vector_and_keyword_search(self, query_text: str, query_vector: List[float], top_k: int):
+        """在一次msearch请求中同时执行向量检索和关键词检索，返回 (向量结果, 关键词结果)"""
+        header = {"index": self.index_name}
+        response = self.es.msearch(searches=[
+            header, self._vector_query_body(query_vector, top_k),
+            header, self._keyword_query_body(query_text, top_k),
+        ])
+        
+        vector_response, keyword_response = response['responses']
+        for sub_response in (vector_response, keyword_response):
+            if 'error' in sub_response:
+                raise RuntimeError(f"msearch子查询失败: {sub_response['error']}")
+        
+        return (
+            self._hits_to_results(vector_response, VECTOR_SCORE_SCALE),
+            self._hits_to_results(keyword_response)
+        )
+    
+    def _linear_fusion_search(self, query_text: str, query_vector: List[float],
+                              top_k: int, vector_weight: float) -> List[Dict[str, Any]]:
+        """分别检索向量与关键词结果，在客户端按权重融合并排序"""
+        # 向量搜索和关键词搜索合并为一次msearch往返，由ES并发执行
+        vector_results, keyword_results = self._vector_and_keyword_search(query_text, query_vector, top_k)
+        
+        # 将搜索结果合并去重：按文档ID分配行号，两路得分写入同一个数组
+        index_of = {}
+        items = []
+        for item in vector_results + keyword_results:
+            if item['id'] not in index_of:
+                index_of[item['id']] = len(items)
+                items.append(item)
+        
+        scores = np.zeros((len(items), 2), dtype=np.float32)
+        for item in vector_results:
+            scores[index_of[item['id']], 0] = item['score']
+        for item in keyword_results:
+            scores[index_of[item['id']], 1] = item['score']
+        
+        # 计算综合得分并按综合得分降序排序（稳定排序，同分时保持向量结果在前）
+        hybrid_scores = scores @ np.array([vector_weight, 1 - vector_weight], dtype=np.float32)
+        order = np.argsort(-hybrid_scores, kind="stable")
+        
+        return [
+            {
+                'id': items[i]['id'],
+                'content': items[i]['content'],
+                'metadata': items[i]['metadata'],
+                'vector_score': float(scores[i, 0]),
+                'keyword_score': float(scores[i, 1]),
+                'hybrid_score': float(hybrid_scores[i])
+            }
+            for i in order
+        ]
+    
+    def _rrf_search(self, query_text: str, query_vector: List[float], top_k: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        使用ES服务端RRF（倒数排名融合）一次性合并kNN与关键词检索的排名
+        
+        Returns:
+            按RRF得分排序的结果；ES不支持RRF（版本或许可限制）时返回None，并在本实例内不再尝试
+        """
+        vector_query = self._vector_query_body(query_vector, top_k)["knn"]
+        keyword_query = self._keyword_query_body(query_text, top_k)["query"]
+        body = {
+            "retriever": {
+                "rrf": {
+                    "retrievers": [
+                        {"standard": {"query": keyword_query}},
+                        {"knn": vector_query}
+                    ],
+                    "rank_window_size": top_k * RRF_WINDOW_FACTOR,
+                    "rank_constant": RRF_RANK_CONSTANT
+                }
+            },
+            **SEARCH_RESPONSE_OPTIONS,
+            "size": top_k
+        }
+        
+        try:
+            response = self.es.search(index=self.index_name, body=body)
+        except (BadRequestError, AuthorizationException) as e:
+            # 400: ES版本不支持retriever/RRF；403: 当前许可不包含RRF
+            self._use_rrf = False
+            logger.warning(f"ES服务端RRF不可用，回退到客户端加权融合: {str(e)}")
+            return None
+        
+        results = self._hits_to_results(response)
+        for item in results:
+            item['hybrid_score'] = item['score']
+        return results
+    
     def hybrid_search(self, query_text: str, query_vector: List[float], 
                      top_k: int = 5, vector_weight: float = 0.7, 
-                     use_reranker: bool = True) -> List[Dict[str, Any]]:
-        """混合搜索（向量+关键词）"""
+                     use_reranker: bool = True,
+                     candidate_multiplier: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        混合搜索（向量+关键词）
+        
+        Args:
+            candidate_multiplier: 候选数为 top_k 的倍数，决定每路检索返回的条数和送入重排序的条数，
+                                  默认使用 Config.SEARCH_CANDIDATE_MULTIPLIER
+        """
+        if candidate_multiplier is None:
+            candidate_multiplier = Config.SEARCH_CANDIDATE_MULTIPLIER
+        candidate_k = max(top_k, math.ceil(top_k * candidate_multiplier))
         try:
-            # 分别执行向量搜索和关键词搜索
-            vector_results = self.search_by_vector(query_vector, top_k=top_k*2)
-            keyword_results = self.keyword_search(query_text, top_k=top_k*2)
-            
-            # 将搜索结果合并去重
-            all_results = {}
-            
-            # 添加向量搜索结果，带权重
-            for item in vector_results:
-                doc_id = item['id']
-                all_results[doc_id] = {
-                    'id': doc_id,
-                    'content': item['content'],
-                    'metadata': item['metadata'],
-                    'vector_score': item['score'],
-                    'keyword_score': 0.0
-                }
-            
-            # 添加/更新关键词搜索结果分数
-            for item in keyword_results:
-                doc_id = item['id']
-                if doc_id not in all_results:
-                    all_results[doc_id] = {
-                        'id': doc_id,
-                        'content': item['content'],
-                        'metadata': item['metadata'],
-                        'vector_score': 0.0,
-                        'keyword_score': item['score']
-                    }
-                else:
-                    all_results[doc_id]['keyword_score'] = item['score']
-            
-            # 计算综合得分
-            pre_rerank_results = []
-            for doc_id, scores in all_results.items():
-                hybrid_score = (
-                    scores['vector_score'] * vector_weight + 
-                    scores['keyword_score'] * (1 - vector_weight)
-                )
-                
-                pre_rerank_results.append({
-                    'id': scores['id'],
-                    'content': scores['content'],
-                    'metadata': scores['metadata'],
-                    'hybrid_score': hybrid_score,
-                    'vector_score': scores['vector_score'],
-                    'keyword_score': scores['keyword_score']
-                })
-            
-            # 按综合得分排序
-            pre_rerank_results.sort(key=lambda x: x['hybrid_score'], reverse=True)
+            # 优先使用ES服务端RRF融合；未启用或不可用时回退到客户端加权融合
+            pre_rerank_results = None
+            if self._use_rrf:
+                pre_rerank_results = self._rrf_search(query_text, query_vector, candidate_k)
+            if pre_rerank_results is None:
+                pre_rerank_results = self._linear_fusion_search(query_text, query_vector, candidate_k, vector_weight)
+            # 两路结果合并后可能多于候选数，只保留融合得分最高的候选送入重排序
+            pre_rerank_results = pre_rerank_results[:candidate_k]
             
             # 应用高兼容性重排序（如果启用且可用）
             if use_reranker and get_high_comp_reranker is not None:
@@ -274,14 +450,14 @@ class ElasticSearchClient:
                         reranked_results = reranker.rerank_search_results(
                             query_text, 
                             pre_rerank_results, 
-                            top_k=min(top_k*2, len(pre_rerank_results))
+                            top_k=len(pre_rerank_results)
                         )
                         
-                        # 对重排序后的结果再次按重排序得分排序
-                        reranked_results.sort(key=lambda x: x['rerank_score'], reverse=True)
+                        # 按重排序得分取前top_k个，无需对全部结果排序
+                        final_results = heapq.nlargest(top_k, reranked_results, key=lambda x: x['rerank_score'])
                         
-                        logger.info(f"重排序完成，返回 {len(reranked_results[:top_k])} 个最终结果")
-                        return reranked_results[:top_k]
+                        logger.info(f"重排序完成，返回 {len(final_results)} 个最终结果")
+                        return final_results
                     else:
                         logger.debug("高兼容性重排序器未初始化，使用原始混合排序结果")
                 except Exception as e:
@@ -299,6 +475,7 @@ class ElasticSearchClient:
     def delete_index(self):
         """删除索引"""
         try:
+            self._index_exists = None
             if self.es.indices.exists(index=self.index_name):
                 result = self.es.indices.delete(index=self.index_name)
                 logger.info(f"成功删除索引 {self.index_name}")
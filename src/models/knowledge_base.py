@@ -1,14 +1,20 @@
 # 知识库主类
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import sys
 import os
 # 添加项目根目录到路径中
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from config.settings import Config
 from models.es_vector_store import ElasticSearchClient
 from utils.embedding_client import EmbeddingClient
-from utils.document_loader import DocumentLoader
+from utils.document_loader import DocumentLoader, extract_content_and_metadata
 from utils.qwen_client import QwenLLMClient
+from utils.semantic_cache import SemanticSearchCache
+from utils.answer_type import determine_answer_type
 from utils.logger import logger
 from src.prompts import (
     AnswerWithRAGContextNamePrompt,
@@ -21,6 +27,15 @@ from src.prompts import (
 import re
 
 
+# 文档入库进度日志的输出间隔（每处理N个文档记录一次）
+PROGRESS_LOG_INTERVAL = 1000
+
+
+def _copy_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """复制检索结果列表及其中的结果字典，调用方修改返回值不会影响缓存中的结果"""
+    return [dict(result) for result in results]
+
+
 class KnowledgeBase:
     """知识库主类"""
     
@@ -28,6 +43,11 @@ class KnowledgeBase:
         self.es_client = ElasticSearchClient()
         self.embedding_client = EmbeddingClient()
         self.qwen_client = QwenLLMClient()
+        self.search_cache = SemanticSearchCache(
+            max_size=Config.SEARCH_CACHE_SIZE,
+            ttl=Config.SEARCH_CACHE_TTL,
+            similarity_threshold=Config.SEARCH_CACHE_SIMILARITY
+        )
         self.is_initialized = False
     
     def initialize(self):
@@ -42,44 +62,53 @@ class KnowledgeBase:
             logger.error(f"知识库初始化失败: {str(e)}")
             return False
     
-    def add_documents(self, documents: List[Any]):
-        """添加文档到知识库"""
+    def add_documents(self, documents: Iterable[Any]):
+        """添加文档到知识库（documents可以是列表或生成器，逐批消费，不整体载入内存）"""
         if not self.is_initialized:
             if not self.initialize():
                 raise RuntimeError("知识库未初始化")
         
-        for i, doc in enumerate(documents):
-            logger.info(f"正在处理文档 {i+1}/{len(documents)}")
-            
-            # 获取文档内容
-            if hasattr(doc, 'page_content'):
-                content = doc.page_content
-            elif isinstance(doc, dict) and 'page_content' in doc:
-                content = doc['page_content']
-            elif isinstance(doc, str):
-                content = doc
-            else:
-                content = str(doc)
-            
-            # 生成嵌入向量
-            embedding = self.embedding_client.embed_query(content)
-            
-            # 获取元数据
-            if hasattr(doc, 'metadata'):
-                metadata = doc.metadata
-            elif isinstance(doc, dict) and 'metadata' in doc:
-                metadata = doc['metadata']
-            else:
-                metadata = {}
-            
-            # 添加到向量数据库
-            self.es_client.add_document(
-                content=content,
-                vector=embedding,
-                metadata=metadata
-            )
+        batch_size = Config.EMBEDDING_BATCH_SIZE
+        document_iter = iter(documents)
+        processed = 0
+        
+        def next_batch():
+            return list(map(extract_content_and_metadata, islice(document_iter, batch_size)))
         
-        logger.info(f"成功添加 {len(documents)} 个文档到知识库")
+        def embed_batch(batch):
+            return self.embedding_client.embed_documents([content for content, _ in batch])
+        
+        def iter_documents():
+            # 按批次调用嵌入接口，并在后台线程中预取后续批次，使嵌入请求与bulk写入重叠；
+            # 以生成器形式产出 (内容, 向量, 元数据)，由bulk写入按块发送
+            nonlocal processed
+            workers = max(1, Config.EMBEDDING_CONCURRENCY)
+            batch_iter = iter(next_batch, [])
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = deque(
+                    (batch, executor.submit(embed_batch, batch))
+                    for batch in islice(batch_iter, workers)
+                )
+                while pending:
+                    batch, future = pending.popleft()
+                    next_pending = next(batch_iter, None)
+                    if next_pending is not None:
+                        pending.append((next_pending, executor.submit(embed_batch, next_pending)))
+                    
+                    if processed % PROGRESS_LOG_INTERVAL < batch_size:
+                        logger.info("正在处理第 {} 个文档", processed + 1)
+                    
+                    for (content, metadata), embedding in zip(batch, future.result()):
+                        yield content, embedding, metadata
+                    processed += len(batch)
+        
+        # 批量添加到向量数据库；知识库内容变化后缓存的检索结果不再有效
+        try:
+            self.es_client.bulk_add_documents(iter_documents())
+        finally:
+            self.search_cache.invalidate()
+        
+        logger.info(f"成功添加 {processed} 个文档到知识库")
     
     def load_and_add_documents(
         self, 
@@ -96,14 +125,16 @@ class KnowledgeBase:
             chunk_overlap: 分块重叠大小
         """
         if os.path.isdir(source):
-            documents = DocumentLoader.load_documents_from_directory(
+            # 目录按文件流式加载，边加载边入库
+            documents = DocumentLoader.iter_documents_from_directory(
                 source,
                 use_advanced_splitting=True,
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap
             )
         else:
-            documents = DocumentLoader.load_document(
+            # 单个文件按页流式加载
+            documents = DocumentLoader.iter_document(
                 source,
                 use_advanced_splitting=True,
                 chunk_size=chunk_size,
@@ -118,9 +149,25 @@ class KnowledgeBase:
         if not self.is_initialized:
             raise RuntimeError("知识库未初始化")
         
+        # 先查检索结果缓存（精确匹配无需生成查询向量）
+        cache_params = (top_k, use_reranker)
+        cached = self.search_cache.get(query, cache_params)
+        if cached is not None:
+            logger.info(f"检索缓存命中，返回 {len(cached)} 个结果")
+            return _copy_results(cached)
+        
         # 生成查询向量
         query_vector = self.embedding_client.embed_query(query)
         
+        # 语义相近的查询复用其检索结果
+        cached = self.search_cache.get_similar(query_vector, cache_params)
+        if cached is not None:
+            logger.info(f"检索缓存语义命中，返回 {len(cached)} 个结果")
+            return _copy_results(cached)
+        
+        # 记录检索开始时的缓存代数，检索期间有新文档入库时不缓存本次结果
+        cache_generation = self.search_cache.generation
+        
         # 执行混合搜索（可选择是否使用重排序）
         # 注意：reranker_model参数暂时未在es_client中使用，
         # 因为通用重排序器已在内部处理了模型选择
@@ -130,10 +177,15 @@ class KnowledgeBase:
             top_k=top_k,
             use_reranker=use_reranker
         )
+        self.search_cache.put(query, cache_params, _copy_results(results), query_vector, generation=cache_generation)
         
         logger.info(f"搜索完成，返回 {len(results)} 个结果")
         return results
     
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取检索缓存统计信息"""
+        return self.search_cache.get_cache_stats()
+    
     def determine_answer_type(self, question: str) -> str:
         """
         根据问题内容判断答案类型
@@ -144,39 +196,7 @@ class KnowledgeBase:
         Returns:
             答案类型 ("name", "number", "boolean", "names", "string")
         """
-        question_lower = question.lower()
-        
-        # 数字类型关键词
-        number_keywords = ["多少", "金额", "数值", "数量", "比例", "百分比", "率", "收入", "利润", "资产", "负债", 
-                          "销售额", "成本", "费用", "投资", "市值", "股价", "收益", "产值", "产量", "销量"]
-        
-        # 名称类型关键词
-        name_keywords = ["谁", "哪个", "哪位", "什么人", "姓名", "名字", "叫什么", "称谓", "职务", "职位", "角色"]
-        
-        # Boolean类型关键词
-        boolean_keywords = ["是否", "有没有", "是否存在", "能否", "可否", "是不是", "有没有", "是否具备", "是否拥有"]
-        
-        # Names类型关键词
-        names_keywords = ["哪些", "哪些人", "几个人", "都有谁", "都包括", "分别", "列表", "清单", "所有", "多个"]
-        
-        # 检查数字类型
-        if any(keyword in question_lower for keyword in number_keywords):
-            return "number"
-        
-        # 检查名称类型
-        if any(keyword in question_lower for keyword in name_keywords):
-            return "name"
-        
-        # 检查Boolean类型
-        if any(keyword in question_lower for keyword in boolean_keywords):
-            return "boolean"
-        
-        # 检查Names类型
-        if any(keyword in question_lower for keyword in names_keywords):
-            return "names"
-        
-        # 默认为字符串类型
-        return "string"
+        return determine_answer_type(question)
 
     def ask(self, question: str, top_k: int = 5, use_reranker: bool = True, reranker_model: str = "default"):
         """提问并获取答案"""
@@ -208,17 +228,29 @@ class KnowledgeBase:
             # 从prompts模块导入动态提示生成器
             from src.prompts import dynamic_prompt_generator
             
-            # 分析上下文以生成适应性提示
-            adaptive_prompt = dynamic_prompt_generator.generate_context_aware_prompt(
-                question=question,
-                context=context
-            )
+            # 分析上下文（结果同时用于生成提示和返回给调用方，只分析一次）
+            document_analysis = dynamic_prompt_generator.analyzer.analyze_document(context)
             
-            # 使用适配的提示进行问答
-            answer = self.qwen_client.chat_with_custom_prompt(adaptive_prompt)
+            # 同一上下文下相同（或语义相近）的问题直接复用已缓存的答案；
+            # 查询向量在检索时已生成，embed_query命中嵌入缓存
+            question_vector = None
+            if dynamic_prompt_generator.cache.semantic_enabled:
+                question_vector = self.embedding_client.embed_query(question)
+            answer = dynamic_prompt_generator.get_cached_answer(question, context, question_vector)
             
-            # 获取文档分析结果以提供更多上下文信息
-            document_analysis = dynamic_prompt_generator.analyzer.analyze_document(context)
+            if answer is None:
+                # 分析上下文以生成适应性提示
+                adaptive_prompt = dynamic_prompt_generator.generate_context_aware_prompt(
+                    question=question,
+                    context=context,
+                    document_analysis=document_analysis
+                )
+                
+                # 使用适配的提示进行问答
+                answer = self.qwen_client.chat_with_custom_prompt(adaptive_prompt)
+                dynamic_prompt_generator.cache_answer(question, context, answer, question_vector)
+            else:
+                logger.info("问答缓存命中，跳过模型调用")
             
             return {
                 'answer': answer,
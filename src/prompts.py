@@ -1,16 +1,115 @@
 """统一的动态提示模板系统 - 集成原始提示和LangChain兼容版本，并实现动态适应性"""
 from pydantic import BaseModel, Field
-from typing import Literal, List, Union, Optional, Dict, Any
-from langchain_core.prompts import PromptTemplate
-import inspect
+from typing import Literal, List, Union, Optional, Dict, Any, Tuple, TYPE_CHECKING
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from string import Template
 import re
 import json
+import threading
+from .config.settings import Config
 from .utils.logger import logger
+from .utils.semantic_cache import SemanticSearchCache
+
+# JSON格式示例优先使用orjson输出
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# langchain_core 只在首次使用LangChain提示模板时导入，只使用原始提示词类的调用方无需加载
+if TYPE_CHECKING:
+    from langchain_core.prompts import PromptTemplate
+
+# 文档分析结果按内容哈希缓存；安装了xxhash时使用更快的非加密哈希
+try:
+    import xxhash
+    _content_hash = xxhash.xxh3_64_intdigest
+except ImportError:
+    _content_hash = hash
+
+# 文档分析缓存的最大条目数
+ANALYSIS_CACHE_SIZE = 1024
+
+
+# 文档类型识别关键词，按判断优先级排列；每个类型预编译为一个忽略大小写的多选正则，
+# 一次扫描即可判断是否命中，无需先对全文做小写转换
+_DOCUMENT_TYPE_KEYWORDS = (
+    ("financial_annual_report", (
+        "财务报告", "资产负债表", "利润表", "现金流量表", "股东权益", "营业收入", "净利润",
+        "年报", "年度报告", "半年报", "季度报", "审计报告", "财务状况", "经营成果"
+    )),
+    ("legal_document", (
+        "合同", "协议", "条款", "法律", "法规", "规定", "义务", "权利", "责任", "违约"
+    )),
+    ("technical_document", (
+        "技术规格", "系统架构", "接口", "api", "算法", "数据结构", "性能", "测试", "部署"
+    )),
+    ("academic_paper", (
+        "abstract", "introduction", "methodology", "results", "conclusion", "参考文献",
+        "摘要", "引言", "研究", "实验", "结论"
+    )),
+)
+
+_DOCUMENT_TYPE_PATTERNS = tuple(
+    (document_type, re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE))
+    for document_type, keywords in _DOCUMENT_TYPE_KEYWORDS
+)
+
+# 领域关键词：文档被识别为对应类型时，提取其中出现的关键词；
+# 第三项表示是否区分大小写（金融缩写如 ROA、ROE 不区分大小写时会误匹配 broad、heroes 等单词）
+_DOMAIN_KEYWORDS = (
+    ("financial_annual_report", (
+        "营业收入", "净利润", "总资产", "净资产", "资产负债率", "毛利率",
+        "现金流", "股东权益", "每股收益", "市盈率", "ROE", "ROA", "EBITDA"
+    ), True),
+    ("technical_document", (
+        "API", "interface", "function", "class", "method", "algorithm",
+        "performance", "optimization", "security", "scalability"
+    ), False),
+)
+_CASE_SENSITIVE_DOMAINS = frozenset(
+    document_type for document_type, _, case_sensitive in _DOMAIN_KEYWORDS if case_sensitive
+)
+
+# 安装了pyahocorasick时，把文档类型关键词和不区分大小写的领域关键词放进同一个自动机，
+# 对小写化后的内容做一次扫描即可得到文档类型和领域关键词；
+# 区分大小写的领域关键词放在另一个自动机中，只在识别出对应文档类型时扫描原始内容
+try:
+    import ahocorasick
+    _keyword_entries = {}
+    _case_sensitive_entries = {}
+    for _priority, (_document_type, _keywords) in enumerate(_DOCUMENT_TYPE_KEYWORDS):
+        for _keyword in _keywords:
+            _keyword_entries.setdefault(_keyword.lower(), []).append((_priority, None))
+    for _document_type, _keywords, _case_sensitive in _DOMAIN_KEYWORDS:
+        for _keyword in _keywords:
+            if _case_sensitive:
+                _case_sensitive_entries.setdefault(_keyword, []).append((_document_type, _keyword))
+            else:
+                _keyword_entries.setdefault(_keyword.lower(), []).append((_document_type, _keyword))
+    
+    def _build_automaton(entries):
+        automaton = ahocorasick.Automaton()
+        for keyword, keyword_entries in entries.items():
+            automaton.add_word(keyword, tuple(keyword_entries))
+        automaton.make_automaton()
+        return automaton
+    
+    _KEYWORD_AUTOMATON = _build_automaton(_keyword_entries)
+    _CASE_SENSITIVE_AUTOMATON = _build_automaton(_case_sensitive_entries)
+except ImportError:
+    _KEYWORD_AUTOMATON = None
+    _CASE_SENSITIVE_AUTOMATON = None
+
+# 关键短语：连续的字母数字/中文字符，长度至少为4
+_KEY_PHRASE_RE = re.compile(r'[\w\u4e00-\u9fff]{4,}')
 
 
+@lru_cache(maxsize=None)
 def build_system_prompt(instruction: str = "", example: str = "", pydantic_schema: str = "") -> str:
     """
-    构建系统提示词
+    构建系统提示词（纯函数，参数均为常量字符串，结果按参数缓存）
     
     Args:
         instruction: 指令部分
@@ -40,6 +139,9 @@ class DynamicPromptAnalyzer:
     def __init__(self):
         self.document_metadata = {}
         self.content_patterns = {}
+        # 内容哈希 -> 分析结果（不含元数据），同一检索上下文重复出现时无需重新分析
+        self._analysis_cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._analysis_cache_lock = threading.Lock()
         
     def analyze_document(self, document_content: str, metadata: Dict[str, Any] = None) -> Dict[str, Any]:
         """
@@ -52,276 +154,337 @@ class DynamicPromptAnalyzer:
         Returns:
             分析结果，包含文档类型、特征等信息
         """
+        cache_key = (_content_hash(document_content), len(document_content))
+        with self._analysis_cache_lock:
+            cached = self._analysis_cache.get(cache_key)
+            if cached is not None:
+                self._analysis_cache.move_to_end(cache_key)
+        
+        if cached is None:
+            document_type, domain_keywords = self._scan_keywords(document_content)
+            cached = {
+                "document_type": document_type,
+                "domain_keywords": domain_keywords,
+                "content_structure": self._analyze_content_structure(document_content)
+            }
+            with self._analysis_cache_lock:
+                self._analysis_cache[cache_key] = cached
+                while len(self._analysis_cache) > ANALYSIS_CACHE_SIZE:
+                    self._analysis_cache.popitem(last=False)
+        
         analysis_result = {
-            "document_type": self._identify_document_type(document_content),
-            "domain_keywords": self._extract_domain_keywords(document_content),
-            "content_structure": self._analyze_content_structure(document_content),
+            **cached,
             "metadata": metadata or {}
         }
         
         return analysis_result
     
-    def _identify_document_type(self, content: str) -> str:
-        """识别文档类型"""
-        content_lower = content.lower()
-        
-        # 金融/年报类文档
-        if any(keyword in content_lower for keyword in [
-            "财务报告", "资产负债表", "利润表", "现金流量表", "股东权益", "营业收入", "净利润", 
-            "年报", "年度报告", "半年报", "季度报", "审计报告", "财务状况", "经营成果"
-        ]):
-            return "financial_annual_report"
-        
-        # 法律文档
-        elif any(keyword in content_lower for keyword in [
-            "合同", "协议", "条款", "法律", "法规", "规定", "义务", "权利", "责任", "违约"
-        ]):
-            return "legal_document"
+    def _scan_keywords(self, content: str) -> Tuple[str, List[str]]:
+        """识别文档类型并提取领域关键词；可用时由Aho-Corasick自动机一次扫描完成"""
+        if _KEYWORD_AUTOMATON is None:
+            document_type = self._identify_document_type(content)
+            return document_type, self._extract_domain_keywords(content, document_type)
         
-        # 技术文档
-        elif any(keyword in content_lower for keyword in [
-            "技术规格", "系统架构", "接口", "api", "算法", "数据结构", "性能", "测试", "部署"
-        ]):
-            return "technical_document"
+        best_priority = len(_DOCUMENT_TYPE_KEYWORDS)
+        domain_hits = []
+        for _, entries in _KEYWORD_AUTOMATON.iter(content.lower()):
+            for category, keyword in entries:
+                if keyword is None:
+                    best_priority = min(best_priority, category)
+                else:
+                    domain_hits.append((category, keyword))
         
-        # 学术论文
-        elif any(keyword in content_lower for keyword in [
-            "abstract", "introduction", "methodology", "results", "conclusion", "参考文献", 
-            "摘要", "引言", "研究", "实验", "结论"
-        ]):
-            return "academic_paper"
+        if best_priority < len(_DOCUMENT_TYPE_KEYWORDS):
+            document_type = _DOCUMENT_TYPE_KEYWORDS[best_priority][0]
+        else:
+            document_type = "general_document"
+        if document_type in _CASE_SENSITIVE_DOMAINS:
+            domain_hits = [
+                hit for _, entries in _CASE_SENSITIVE_AUTOMATON.iter(content) for hit in entries
+            ]
+        # 按首次出现顺序去重，相同内容总是得到相同顺序的关键词
+        keywords = [keyword for category, keyword in domain_hits if category == document_type]
+        return document_type, list(dict.fromkeys(keywords))
+    
+    def _identify_document_type(self, content: str) -> str:
+        """识别文档类型（金融/年报、法律、技术、学术论文，均未命中则为普通文档）"""
+        for document_type, pattern in _DOCUMENT_TYPE_PATTERNS:
+            if pattern.search(content):
+                return document_type
         
         # 普通文档
-        else:
-            return "general_document"
+        return "general_document"
     
-    def _extract_domain_keywords(self, content: str) -> List[str]:
-        """提取领域关键词"""
+    def _extract_domain_keywords(self, content: str, document_type: str) -> List[str]:
+        """提取领域关键词（document_type为调用方已识别的文档类型）"""
         content_lower = content.lower()
         keywords = []
         
-        # 金融关键词
-        if "financial_annual_report" in self._identify_document_type(content):
-            financial_keywords = [
-                "营业收入", "净利润", "总资产", "净资产", "资产负债率", "毛利率", 
-                "现金流", "股东权益", "每股收益", "市盈率", "ROE", "ROA", "EBITDA"
-            ]
-            found_keywords = [kw for kw in financial_keywords if kw in content]
-            keywords.extend(found_keywords)
-        
-        # 技术关键词
-        if "technical_document" in self._identify_document_type(content):
-            tech_keywords = [
-                "API", "interface", "function", "class", "method", "algorithm", 
-                "performance", "optimization", "security", "scalability"
-            ]
-            found_keywords = [kw for kw in tech_keywords if kw.lower() in content_lower]
-            keywords.extend(found_keywords)
+        for domain_type, domain_keywords, case_sensitive in _DOMAIN_KEYWORDS:
+            if domain_type == document_type:
+                if case_sensitive:
+                    keywords.extend(kw for kw in domain_keywords if kw in content)
+                else:
+                    keywords.extend(kw for kw in domain_keywords if kw.lower() in content_lower)
         
-        # 去重并返回
-        return list(set(keywords))
+        # 按出现顺序去重并返回
+        return list(dict.fromkeys(keywords))
     
     def _analyze_content_structure(self, content: str) -> Dict[str, Any]:
         """分析文档结构"""
         lines = content.split('\n')
         
+        # 一次遍历同时统计非空行数、总长度并检测章节标题
+        paragraph_count = 0
+        total_length = 0
+        section_indicators = []
+        for i, line in enumerate(lines):
+            total_length += len(line)
+            stripped = line.strip()
+            if not stripped:
+                continue
+            paragraph_count += 1
+            if len(stripped) < 100:  # 可能的标题
+                if stripped.endswith(':') or stripped.isupper() or \
+                   any(char.isdigit() for char in stripped.split()[0]):
+                    section_indicators.append((i, stripped))
+        
         structure = {
-            "paragraph_count": len([line for line in lines if line.strip()]),
-            "average_line_length": sum(len(line) for line in lines) / len(lines) if lines else 0,
-            "section_indicators": [],
+            "paragraph_count": paragraph_count,
+            "average_line_length": total_length / len(lines) if lines else 0,
+            "section_indicators": section_indicators,
             "table_of_contents": [],
             "key_phrases": []
         }
         
-        # 检测章节标题
-        for i, line in enumerate(lines):
-            if len(line.strip()) > 0 and len(line.strip()) < 100:  # 可能的标题
-                if line.strip().endswith(':') or line.strip().isupper() or \
-                   any(char.isdigit() for char in line.split()[0]) if line.split() else False:
-                    structure["section_indicators"].append((i, line.strip()))
+        # 提取关键短语：一次正则扫描切出长度大于3的词（忽略太短的词），由Counter计数
+        word_freq = Counter(_KEY_PHRASE_RE.findall(content.lower()))
         
-        # 提取关键短语
-        words = content.split()
-        word_freq = {}
-        for word in words:
-            clean_word = re.sub(r'[^\w\u4e00-\u9fff]', '', word).lower()
-            if len(clean_word) > 3:  # 忽略太短的词
-                word_freq[clean_word] = word_freq.get(clean_word, 0) + 1
-        
-        # 找出高频词
-        frequent_words = [word for word, freq in word_freq.items() if freq > 2]
-        structure["key_phrases"] = frequent_words[:20]  # 返回前20个高频词
+        # 找出高频词，返回前20个出现超过2次的词
+        structure["key_phrases"] = [word for word, freq in word_freq.most_common(20) if freq > 2]
         
         return structure
 
 
-class DynamicRAGPromptGenerator:
-    """动态RAG提示生成器"""
-    
-    def __init__(self):
-        self.analyzer = DynamicPromptAnalyzer()
-        self.cache = {}
-    
-    def generate_context_aware_prompt(self, 
-                                    question: str, 
-                                    context: str, 
-                                    document_analysis: Dict[str, Any] = None) -> str:
-        """
-        根据上下文和文档分析生成适应性提示词
-        
-        Args:
-            question: 用户问题
-            context: 检索到的上下文
-            document_analysis: 文档分析结果
-            
-        Returns:
-            适应性提示词
-        """
-        if document_analysis is None:
-            document_analysis = self.analyzer.analyze_document(context)
-        
-        # 根据文档类型生成相应的提示
-        document_type = document_analysis.get("document_type", "general_document")
-        
-        if document_type == "financial_annual_report":
-            return self._generate_financial_prompt(question, context)
-        elif document_type == "legal_document":
-            return self._generate_legal_prompt(question, context)
-        elif document_type == "technical_document":
-            return self._generate_technical_prompt(question, context)
-        elif document_type == "academic_paper":
-            return self._generate_academic_prompt(question, context)
-        else:
-            return self._generate_general_prompt(question, context)
-    
-    def _generate_financial_prompt(self, question: str, context: str) -> str:
-        """生成金融类文档的提示词"""
-        return f"""你是一个专业的金融分析师，正在分析公司年报或财务报告。
+def _dump_json(data: Dict[str, Any]) -> str:
+    """将JSON格式示例输出为紧凑的规范JSON文本（保持字段顺序，中文不转义，无多余空白）"""
+    if orjson is not None:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _answer_format(step_by_step_analysis: str, reasoning_summary: str, final_answer: str) -> str:
+    """生成动态提示词末尾的JSON回答格式说明，在导入时为各文档类型生成一次"""
+    return "\n\n请按照以下JSON格式回答：\n" + _dump_json({
+        "step_by_step_analysis": step_by_step_analysis,
+        "reasoning_summary": reasoning_summary,
+        "relevant_pages": [1, 2, 3],
+        "final_answer": final_answer
+    })
+
+
+# 动态提示词：静态部分（角色、注意事项、输出格式）放在前面作为固定前缀，
+# 上下文和问题放在末尾，同类型问题的提示词共享相同前缀，便于模型服务端的前缀缓存命中
+_FINANCIAL_SYSTEM_PROMPT = """你是一个专业的金融分析师，正在分析公司年报或财务报告。
 你的任务是仅基于提供的财务文档内容，精确回答给定问题。
 
 特别注意事项：
 1. 对于数值类问题，必须严格匹配指标定义和计量单位
 2. 注意区分总额、净额、比率、百分比等不同计量方式
 3. 尊重数据的时间范围和会计期间
-4. 如果问题需要计算或推导而文档未直接提供，请返回'N/A'
-
-以下是上下文:
-"{context}"
+4. 如果问题需要计算或推导而文档未直接提供，请返回'N/A'""" + _answer_format(
+    step_by_step_analysis="1. 明确问题所需的财务指标定义\n2. 在上下文中查找对应数据\n3. 验证数据的准确性、期间和单位\n4. 确认是否满足问题要求\n5. 得出结论",
+    reasoning_summary="简要总结分析过程和依据",
+    final_answer="精确的数值或文字答案，如无法确定则返回'N/A'"
+)
 
----
-
-以下是问题：
-"{question}"
-
-请按照以下JSON格式回答：
-{{
-  "step_by_step_analysis": "1. 明确问题所需的财务指标定义\\n2. 在上下文中查找对应数据\\n3. 验证数据的准确性、期间和单位\\n4. 确认是否满足问题要求\\n5. 得出结论",
-  "reasoning_summary": "简要总结分析过程和依据",
-  "relevant_pages": [1, 2, 3],  // 相关页面编号列表
-  "final_answer": "精确的数值或文字答案，如无法确定则返回'N/A'"
-}}"""
-    
-    def _generate_legal_prompt(self, question: str, context: str) -> str:
-        """生成法律类文档的提示词"""
-        return f"""你是一个专业的法律分析师，正在分析合同或法律文档。
+_LEGAL_SYSTEM_PROMPT = """你是一个专业的法律分析师，正在分析合同或法律文档。
 你的任务是仅基于提供的法律文档内容，精确解释相关条款。
 
 特别注意事项：
 1. 严格按照文档条款进行解释，不得推测或假设
 2. 注意条款的有效期、适用条件和例外情况
 3. 区分权利与义务、违约责任等不同性质的条款
-4. 如果问题超出文档范围，请返回'N/A'
+4. 如果问题超出文档范围，请返回'N/A'""" + _answer_format(
+    step_by_step_analysis="1. 识别问题涉及的法律概念或条款\n2. 在上下文中定位相关条款\n3. 分析条款的适用条件\n4. 确认条款的效力和约束力\n5. 得出结论",
+    reasoning_summary="简要总结法律分析过程",
+    final_answer="基于法律文档的精确解释，如无法确定则返回'N/A'"
+)
 
-以下是上下文:
-"{context}"
-
----
-
-以下是问题：
-"{question}"
-
-请按照以下JSON格式回答：
-{{
-  "step_by_step_analysis": "1. 识别问题涉及的法律概念或条款\\n2. 在上下文中定位相关条款\\n3. 分析条款的适用条件\\n4. 确认条款的效力和约束力\\n5. 得出结论",
-  "reasoning_summary": "简要总结法律分析过程",
-  "relevant_pages": [1, 2, 3],  // 相关页面编号列表
-  "final_answer": "基于法律文档的精确解释，如无法确定则返回'N/A'"
-}}"""
-    
-    def _generate_technical_prompt(self, question: str, context: str) -> str:
-        """生成技术类文档的提示词"""
-        return f"""你是一个技术专家，正在分析技术文档或API文档。
+_TECHNICAL_SYSTEM_PROMPT = """你是一个技术专家，正在分析技术文档或API文档。
 你的任务是仅基于提供的技术文档内容，解答技术实现问题。
 
 特别注意事项：
 1. 严格按照文档中的技术规范进行回答
 2. 注意版本、兼容性和依赖关系
 3. 区分概念解释、使用方法和最佳实践
-4. 如涉及未明确说明的实现细节，请返回'N/A'
+4. 如涉及未明确说明的实现细节，请返回'N/A'""" + _answer_format(
+    step_by_step_analysis="1. 明确问题的技术领域\n2. 在文档中查找相关技术信息\n3. 验证信息的准确性和时效性\n4. 确认是否满足问题需求\n5. 得出结论",
+    reasoning_summary="简要总结技术分析过程",
+    final_answer="基于技术文档的精确答案，如无法确定则返回'N/A'"
+)
 
-以下是上下文:
-"{context}"
-
----
-
-以下是问题：
-"{question}"
-
-请按照以下JSON格式回答：
-{{
-  "step_by_step_analysis": "1. 明确问题的技术领域\\n2. 在文档中查找相关技术信息\\n3. 验证信息的准确性和时效性\\n4. 确认是否满足问题需求\\n5. 得出结论",
-  "reasoning_summary": "简要总结技术分析过程",
-  "relevant_pages": [1, 2, 3],  // 相关页面编号列表
-  "final_answer": "基于技术文档的精确答案，如无法确定则返回'N/A'"
-}}"""
-    
-    def _generate_academic_prompt(self, question: str, context: str) -> str:
-        """生成学术类文档的提示词"""
-        return f"""你是一个学术研究员，正在分析学术论文。
+_ACADEMIC_SYSTEM_PROMPT = """你是一个学术研究员，正在分析学术论文。
 你的任务是仅基于提供的论文内容，回答研究相关问题。
 
 特别注意事项：
 1. 严格按照论文内容进行分析，不得超出文档范围
 2. 区分研究结论、假设、方法论和局限性
 3. 注意研究的适用范围和条件
-4. 如果问题涉及未充分讨论的内容，请返回'N/A'
-
-以下是上下文:
-"{context}"
+4. 如果问题涉及未充分讨论的内容，请返回'N/A'""" + _answer_format(
+    step_by_step_analysis="1. 识别问题所属的研究领域\n2. 在论文中查找相关信息\n3. 分析研究方法和结论的可靠性\n4. 确认信息的适用性\n5. 得出结论",
+    reasoning_summary="简要总结学术分析过程",
+    final_answer="基于论文内容的精确回答，如无法确定则返回'N/A'"
+)
+
+_GENERAL_SYSTEM_PROMPT = """你是一个专业的内容分析师。
+你的任务是仅基于提供的文档内容，准确回答给定问题。""" + _answer_format(
+    step_by_step_analysis="1. 理解问题的要求\n2. 在上下文中寻找相关信息\n3. 验证信息的准确性\n4. 确认信息满足问题需求\n5. 得出结论",
+    reasoning_summary="简要总结分析过程",
+    final_answer="基于上下文的准确答案，如无法确定则返回'N/A'"
+)
+
+# 动态部分：每次请求不同的上下文和问题，模板在导入时编译一次，调用时只替换占位符
+_DYNAMIC_USER_TEMPLATE = Template("""以下是上下文:
+"$context"
 
 ---
 
 以下是问题：
-"{question}"
-
-请按照以下JSON格式回答：
-{{
-  "step_by_step_analysis": "1. 识别问题所属的研究领域\\n2. 在论文中查找相关信息\\n3. 分析研究方法和结论的可靠性\\n4. 确认信息的适用性\\n5. 得出结论",
-  "reasoning_summary": "简要总结学术分析过程",
-  "relevant_pages": [1, 2, 3],  // 相关页面编号列表
-  "final_answer": "基于论文内容的精确回答，如无法确定则返回'N/A'"
-}}"""
-    
-    def _generate_general_prompt(self, question: str, context: str) -> str:
-        """生成通用文档的提示词"""
-        return f"""你是一个专业的内容分析师。
-你的任务是仅基于提供的文档内容，准确回答给定问题。
+"$question\"""")
 
-以下是上下文:
-"{context}"
+# 拼接为单条提示词时静态前缀与动态部分之间的分隔（前缀缓存的切分点）
+PROMPT_CACHE_CHECKPOINT = "\n\n---\n\n"
 
----
-
-以下是问题：
-"{question}"
 
-请按照以下JSON格式回答：
-{{
-  "step_by_step_analysis": "1. 理解问题的要求\\n2. 在上下文中寻找相关信息\\n3. 验证信息的准确性\\n4. 确认信息满足问题需求\\n5. 得出结论",
-  "reasoning_summary": "简要总结分析过程",
-  "relevant_pages": [1, 2, 3],  // 相关页面编号列表
-  "final_answer": "基于上下文的准确答案，如无法确定则返回'N/A'"
-}}"""
+class DynamicRAGPromptGenerator:
+    """动态RAG提示生成器"""
+    
+    def __init__(self):
+        self.analyzer = DynamicPromptAnalyzer()
+        # 问答结果缓存：按 (问题, 上下文哈希) 精确匹配；设置了相似度阈值并提供问题向量时，
+        # 同一上下文下语义相近的问题直接复用已有答案，跳过LLM调用
+        self.cache = SemanticSearchCache(
+            max_size=Config.ANSWER_CACHE_SIZE,
+            ttl=Config.ANSWER_CACHE_TTL,
+            similarity_threshold=Config.ANSWER_CACHE_SIMILARITY
+        )
+        # 文档类型 -> 提示词生成方法，未知类型使用通用提示词
+        self._dispatch = {
+            "financial_annual_report": self._generate_financial_prompt,
+            "legal_document": self._generate_legal_prompt,
+            "technical_document": self._generate_technical_prompt,
+            "academic_paper": self._generate_academic_prompt,
+        }
+    
+    def generate_context_aware_messages(self, 
+                                        question: str, 
+                                        context: Optional[str] = None, 
+                                        document_analysis: Dict[str, Any] = None,
+                                        context_parts: Optional[List[str]] = None) -> Dict[str, str]:
+        """
+        根据上下文和文档分析生成适应性提示词，静态前缀与动态部分分开返回
+        
+        Args:
+            question: 用户问题
+            context: 检索到的上下文
+            document_analysis: 文档分析结果
+            context_parts: 未拼接的上下文片段，未提供context时在此处拼接一次
+            
+        Returns:
+            {"system": 按文档类型固定的系统提示词, "user": 包含上下文和问题的用户提示词}
+        """
+        if context is None:
+            context = "\n\n".join(context_parts or [])
+        
+        if document_analysis is None:
+            document_analysis = self.analyzer.analyze_document(context)
+        
+        # 根据文档类型生成相应的提示
+        document_type = document_analysis.get("document_type", "general_document")
+        generate = self._dispatch.get(document_type, self._generate_general_prompt)
+        return generate(question, context)
+    
+    def generate_context_aware_prompt(self, 
+                                    question: str, 
+                                    context: Optional[str] = None, 
+                                    document_analysis: Dict[str, Any] = None,
+                                    context_parts: Optional[List[str]] = None) -> str:
+        """
+        根据上下文和文档分析生成适应性提示词
+        
+        Args:
+            question: 用户问题
+            context: 检索到的上下文
+            document_analysis: 文档分析结果
+            context_parts: 未拼接的上下文片段，未提供context时在此处拼接一次
+            
+        Returns:
+            适应性提示词（静态前缀在前，上下文和问题在后）
+        """
+        messages = self.generate_context_aware_messages(
+            question,
+            context=context,
+            document_analysis=document_analysis,
+            context_parts=context_parts
+        )
+        return messages["system"] + PROMPT_CACHE_CHECKPOINT + messages["user"]
+    
+    @staticmethod
+    def _context_key(context: str) -> tuple:
+        return (_content_hash(context), len(context))
+    
+    def get_cached_answer(self, question: str, context: str,
+                          question_vector: Optional[List[float]] = None) -> Optional[Any]:
+        """
+        查找同一上下文下相同（或语义相近）问题的已缓存答案
+        
+        Args:
+            question: 用户问题
+            context: 检索到的上下文
+            question_vector: 问题向量，提供时在精确匹配未命中后进行语义匹配
+        """
+        context_key = self._context_key(context)
+        answer = self.cache.get(question, context_key)
+        if answer is None and self.cache.semantic_enabled:
+            if question_vector is not None:
+                answer = self.cache.get_similar(question_vector, context_key)
+            else:
+                self.cache.record_miss()
+        return answer
+    
+    def cache_answer(self, question: str, context: str, answer: Any,
+                     question_vector: Optional[List[float]] = None):
+        """缓存问答结果，提供问题向量时同时登记用于语义匹配"""
+        self.cache.put(question, self._context_key(context), answer, question_vector)
+    
+    @staticmethod
+    def _build_messages(system_prompt: str, question: str, context: str) -> Dict[str, str]:
+        """组合静态系统提示词与动态用户提示词"""
+        return {
+            "system": system_prompt,
+            "user": _DYNAMIC_USER_TEMPLATE.substitute(context=context, question=question)
+        }
+    
+    def _generate_financial_prompt(self, question: str, context: str) -> Dict[str, str]:
+        """生成金融类文档的提示词"""
+        return self._build_messages(_FINANCIAL_SYSTEM_PROMPT, question, context)
+    
+    def _generate_legal_prompt(self, question: str, context: str) -> Dict[str, str]:
+        """生成法律类文档的提示词"""
+        return self._build_messages(_LEGAL_SYSTEM_PROMPT, question, context)
+    
+    def _generate_technical_prompt(self, question: str, context: str) -> Dict[str, str]:
+        """生成技术类文档的提示词"""
+        return self._build_messages(_TECHNICAL_SYSTEM_PROMPT, question, context)
+    
+    def _generate_academic_prompt(self, question: str, context: str) -> Dict[str, str]:
+        """生成学术类文档的提示词"""
+        return self._build_messages(_ACADEMIC_SYSTEM_PROMPT, question, context)
+    
+    def _generate_general_prompt(self, question: str, context: str) -> Dict[str, str]:
+        """生成通用文档的提示词"""
+        return self._build_messages(_GENERAL_SYSTEM_PROMPT, question, context)
 
 
 # 原始提示模板（保持向后兼容）
@@ -377,16 +540,15 @@ class RephrasedQuestions(BaseModel):
     system_prompt_with_schema = build_system_prompt(instruction, example, pydantic_schema)
 
 
-class AnswerWithRAGContextSharedPrompt:
-    """RAG上下文问答共享提示词基类"""
-    instruction = """你是一个RAG（检索增强生成）问答系统。
+# RAG上下文问答各提示词类共用的指令和用户提示词
+_SHARED_INSTRUCTION = """你是一个RAG（检索增强生成）问答系统。
 你的任务是仅基于文档中RAG检索到的相关内容，回答给定问题。
 
 在给出最终答案前，请详细分步思考，尤其关注问题措辞。
 - 注意：答案可能与问题表述不同。
 - 根据文档类型运用相应的专业知识进行分析."""
 
-    user_prompt = """以下是上下文:
+_SHARED_USER_PROMPT = """以下是上下文:
 \"\"\"
 {context}
 \"\"\"
@@ -398,10 +560,16 @@ class AnswerWithRAGContextSharedPrompt:
 """
 
 
+class AnswerWithRAGContextSharedPrompt:
+    """RAG上下文问答共享提示词基类"""
+    instruction = _SHARED_INSTRUCTION
+    user_prompt = _SHARED_USER_PROMPT
+
+
 class AnswerWithRAGContextNamePrompt:
     """基于RAG上下文的人名、公司名等命名实体问答提示词类"""
-    instruction = AnswerWithRAGContextSharedPrompt.instruction
-    user_prompt = AnswerWithRAGContextSharedPrompt.user_prompt
+    instruction = _SHARED_INSTRUCTION
+    user_prompt = _SHARED_USER_PROMPT
 
     class AnswerSchema(BaseModel):
         step_by_step_analysis: str = Field(
@@ -423,7 +591,26 @@ class AnswerWithRAGContextNamePrompt:
 如上下文无相关信息，返回'N/A'.
 """)
 
-    pydantic_schema = re.sub(r"^ {4}", "", inspect.getsource(AnswerSchema), flags=re.MULTILINE)
+    pydantic_schema = '''class AnswerSchema(BaseModel):
+    step_by_step_analysis: str = Field(
+        description="详细分步推理过程，至少5步，150字以上。特别注意问题措辞，避免被迷惑。有时上下文中看似有答案，但可能并非所问内容，仅为相似项.")
+    reasoning_summary: str = Field(description="简要总结分步推理过程，约50字.")
+    relevant_pages: List[int] = Field(description="""
+仅包含直接用于回答问题的信息页面编号。只包括：
+- 直接包含答案或明确陈述的页面
+- 强有力支持答案的关键信息页面
+不要包含仅与答案弱相关或间接相关的页面。
+列表中至少应有一个页面.
+""")
+
+    final_answer: Union[str, Literal["N/A"]] = Field(description="""
+如为公司名，需与问题中完全一致.
+如为人名，需为全名.
+如为产品名，需与上下文完全一致.
+不得包含多余信息、词语或注释.
+如上下文无相关信息，返回'N/A'.
+""")
+'''
 
     example = r"""示例：
 问题：
@@ -446,8 +633,8 @@ class AnswerWithRAGContextNamePrompt:
 
 class AnswerWithRAGContextNumberPrompt:
     """基于RAG上下文的数字指标问答提示词类"""
-    instruction = AnswerWithRAGContextSharedPrompt.instruction
-    user_prompt = AnswerWithRAGContextSharedPrompt.user_prompt
+    instruction = _SHARED_INSTRUCTION
+    user_prompt = _SHARED_USER_PROMPT
 
     class AnswerSchema(BaseModel):
         step_by_step_analysis: str = Field(description="""
@@ -503,7 +690,60 @@ class AnswerWithRAGContextNumberPrompt:
 - 如上下文无相关信息，返回'N/A'
 """)
 
-    pydantic_schema = re.sub(r"^ {4}", "", inspect.getsource(AnswerSchema), flags=re.MULTILINE)
+    pydantic_schema = '''class AnswerSchema(BaseModel):
+    step_by_step_analysis: str = Field(description="""
+详细分步推理过程，至少5步，150字以上.
+**严格的指标匹配要求：**    
+
+1. 明确问题中指标的精确定义，它实际衡量什么？
+2. 检查上下文中的所有可能指标。不要只看名称，要关注其实际衡量内容.
+3. 仅当上下文指标的含义与目标指标*完全一致*时才接受。可接受同义词，但概念不同则不可.
+4. 拒绝（并返回'N/A'）的情况：
+- 上下文指标范围大于或小于问题指标.
+- 上下文指标为相关但非*完全等价*的概念（如代理指标或更宽泛类别）.
+- 需要计算、推导或推断才能作答.
+- 聚合不匹配：问题要求单一值，但上下文仅有总计.
+5. 不允许猜测：如对指标等价性有任何疑问，默认返回`N/A`.
+""")
+
+    reasoning_summary: str = Field(description="简要总结分步推理过程，约50字.")
+
+    relevant_pages: List[int] = Field(description="""
+仅包含直接用于回答问题的信息页面编号。只包括：
+- 直接包含答案或明确陈述的页面
+- 强有力支持答案的关键信息页面
+不要包含仅与答案弱相关或间接相关的页面.
+列表中至少应有一个页面.
+""")
+
+    final_answer: Union[float, int, Literal['N/A']] = Field(description="""
+答案应为精确的数值型指标.
+- 百分比示例：
+上下文值：58,3%
+最终答案：58.3
+
+特别注意上下文中是否有单位、千、百万等说明，需据此调整答案（不变、加3个零或加6个零）.
+如数值带括号，表示为负数.
+
+- 负数示例：
+上下文值：(2,124,837) CHF
+最终答案：-2124837
+
+- 千为单位示例：
+上下文值：4970,5（千美元）
+最终答案：4970500
+
+- 如上下文指标币种与问题币种不符，返回'N/A'
+示例：上下文值780000 USD，问题要求EUR
+最终答案：'N/A'
+
+- 如上下文未直接给出指标，即使可由其他指标计算，也返回'N/A'
+示例：问题要求每股分红，仅有总分红和流通股数，不能直接作答.
+最终答案：'N/A'
+
+- 如上下文无相关信息，返回'N/A'
+""")
+'''
 
     example = r"""示例1：
 问题：
@@ -540,8 +780,8 @@ class AnswerWithRAGContextNumberPrompt:
 
 class AnswerWithRAGContextBooleanPrompt:
     """基于RAG上下文的布尔值问答提示词类"""
-    instruction = AnswerWithRAGContextSharedPrompt.instruction
-    user_prompt = AnswerWithRAGContextSharedPrompt.user_prompt
+    instruction = _SHARED_INSTRUCTION
+    user_prompt = _SHARED_USER_PROMPT
 
     class AnswerSchema(BaseModel):
         step_by_step_analysis: str = Field(description="""
@@ -560,7 +800,23 @@ class AnswerWithRAGContextBooleanPrompt:
 如果问题问某事是否发生，且上下文有相关信息但未发生，则返回False.
 """)
 
-    pydantic_schema = re.sub(r"^ {4}", "", inspect.getsource(AnswerSchema), flags=re.MULTILINE)
+    pydantic_schema = '''class AnswerSchema(BaseModel):
+    step_by_step_analysis: str = Field(description="""
+详细分步推理过程，至少5步，150字以上。特别注意问题措辞，避免被迷惑。有时上下文中看似有答案，但可能并非所问内容，仅为相似项.
+""")
+    reasoning_summary: str = Field(description="简要总结分步推理过程，约50字.")
+    relevant_pages: List[int] = Field(description="""
+仅包含直接用于回答问题的信息页面编号。只包括：
+- 直接包含答案或明确陈述的页面
+- 强有力支持答案的关键信息页面
+不要包含仅与答案弱相关或间接相关的页面.
+列表中至少应有一个页面.
+""")        
+    final_answer: Union[bool] = Field(description="""
+一个从上下文中精确提取的布尔值（True或False），直接回答问题.
+如果问题问某事是否发生，且上下文有相关信息但未发生，则返回False.
+""")
+'''
     example = r"""
 问题：
 "'万科企业股份有限公司'年报是否宣布了分红政策变更？"
@@ -582,8 +838,8 @@ class AnswerWithRAGContextBooleanPrompt:
 
 class AnswerWithRAGContextNamesPrompt:
     """基于RAG上下文的多名实体问答提示词类"""
-    instruction = AnswerWithRAGContextSharedPrompt.instruction
-    user_prompt = AnswerWithRAGContextSharedPrompt.user_prompt
+    instruction = _SHARED_INSTRUCTION
+    user_prompt = _SHARED_USER_PROMPT
 
     class AnswerSchema(BaseModel):
         """RAG上下文下多实体/名单类答案的结构定义。"""
@@ -614,7 +870,35 @@ class AnswerWithRAGContextNamesPrompt:
 如无信息，返回'N/A'.
 """)
 
-    pydantic_schema = re.sub(r"^ {4}", "", inspect.getsource(AnswerSchema), flags=re.MULTILINE)
+    pydantic_schema = '''class AnswerSchema(BaseModel):
+    """RAG上下文下多实体/名单类答案的结构定义。"""
+    step_by_step_analysis: str = Field(description="详细分步推理过程，至少5步，150字以上。注意区分实体类型，避免被迷惑.")
+
+    reasoning_summary: str = Field(description="简要总结推理过程，约50字.")
+
+    relevant_pages: List[int] = Field(description="""
+仅包含直接用于回答问题的页面编号。只包括：
+- 直接包含答案或明确陈述的页面
+- 强有力支持答案的关键信息页面
+不要包含仅与答案弱相关或间接相关的页面.
+列表中至少应有一个页面.
+""")
+
+    final_answer: Union[List[str], Literal["N/A"]] = Field(description="""
+每个条目需与上下文完全一致.
+
+如问题问职位（如职位变动），仅返回职位名称，不含姓名或其他信息。新任高管也算作职位变动。若同一职位有多次变动，仅返回一次，且职位名称用单数.
+示例：['首席技术官', '董事', '首席执行官']
+
+如问题问姓名，仅返回上下文中的全名.
+示例：['张三', '李四']
+
+如问题问新产品，仅返回上下文中的产品名。候选产品或测试阶段产品不算新产品.
+示例：['生态智能2000', '绿能Pro']
+
+如无信息，返回'N/A'.
+""")
+'''
 
     example = r"""
 示例：
@@ -671,7 +955,16 @@ class ComparativeAnswerPrompt:
 
         final_answer: Union[str, Literal["N/A"]] = Field(description="公司名称需与问题中完全一致。答案只能是单个公司名或'N/A'.")
 
-    pydantic_schema = re.sub(r"^ {4}", "", inspect.getsource(AnswerSchema), flags=re.MULTILINE)
+    pydantic_schema = '''class AnswerSchema(BaseModel):
+    """比较类问题最终答案的结构定义。"""
+    step_by_step_analysis: str = Field(description="详细分步推理过程，至少5步，150字以上.")
+
+    reasoning_summary: str = Field(description="简要总结推理过程，约50字.")
+
+    relevant_pages: List[int] = Field(description="保持为空列表.")
+
+    final_answer: Union[str, Literal["N/A"]] = Field(description="公司名称需与问题中完全一致。答案只能是单个公司名或'N/A'.")
+'''
 
     example = r"""
 示例：
@@ -773,8 +1066,8 @@ class RetrievalRankingMultipleBlocks(BaseModel):
 
 class AnswerWithRAGContextStringPrompt:
     """基于RAG上下文的字符串问答提示词类"""
-    instruction = AnswerWithRAGContextSharedPrompt.instruction
-    user_prompt = AnswerWithRAGContextSharedPrompt.user_prompt
+    instruction = _SHARED_INSTRUCTION
+    user_prompt = _SHARED_USER_PROMPT
 
     class AnswerSchema(BaseModel):
         step_by_step_analysis: str = Field(description="""
@@ -793,7 +1086,23 @@ class AnswerWithRAGContextStringPrompt:
 如上下文无相关信息，可简要说明未找到答案.
 """)
 
-    pydantic_schema = re.sub(r"^ {4}", "", inspect.getsource(AnswerSchema), flags=re.MULTILINE)
+    pydantic_schema = '''class AnswerSchema(BaseModel):
+    step_by_step_analysis: str = Field(description="""
+详细分步推理过程，至少5步，150字以上。请结合上下文信息，逐步分析并归纳答案.
+""")
+    reasoning_summary: str = Field(description="简要总结分步推理过程，约50字.")
+    relevant_pages: List[int] = Field(description="""
+仅包含直接用于回答问题的信息页面编号。只包括：
+- 直接包含答案或明确陈述的页面
+- 强有力支持答案的关键信息页面
+不要包含仅与答案弱相关或间接相关的页面.
+列表中至少应有一个页面.
+""")
+    final_answer: str = Field(description="""
+最终答案为一段完整、连贯的文本，需基于上下文内容作答.
+如上下文无相关信息，可简要说明未找到答案.
+""")
+'''
 
     example = r'''示例：
 问题：
@@ -814,6 +1123,31 @@ class AnswerWithRAGContextStringPrompt:
     system_prompt_with_schema = build_system_prompt(instruction, example, pydantic_schema)
 
 
+@lru_cache(maxsize=None)
+def _build_prompt_template(template: str) -> "PromptTemplate":
+    """构建 context/question 两个变量的PromptTemplate；模板内容固定，首次调用时构建并校验，之后复用同一对象"""
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate(
+        input_variables=["context", "question"],
+        template=template
+    )
+
+
+def _adaptive_qa_prompt(system_prompt_with_schema: str) -> "PromptTemplate":
+    """由系统提示词构建自适应问答模板"""
+    return _build_prompt_template(system_prompt_with_schema + "\n\n{context}\n\n{question}")
+
+
+class _LazyPromptTemplate:
+    """类属性形式的PromptTemplate，首次访问时才构建"""
+
+    def __init__(self, template: str):
+        self.template = template
+
+    def __get__(self, instance, owner) -> "PromptTemplate":
+        return _build_prompt_template(self.template)
+
+
 # LangChain兼容的提示模板（扩展原始模板）
 class LangChainPrompts:
     """LangChain兼容的提示模板集合 - 基于原始模板扩展"""
@@ -826,56 +1160,33 @@ class LangChainPrompts:
 问题: {question}
 答案:"""
 
-    basic_rag_prompt = PromptTemplate(
-        input_variables=["context", "question"],
-        template=BASIC_RAG_TEMPLATE
-    )
+    basic_rag_prompt = _LazyPromptTemplate(BASIC_RAG_TEMPLATE)
 
     # 从原始模板转换而来的LangChain兼容版本
     @staticmethod
-    def get_adaptive_name_qa_prompt() -> PromptTemplate:
+    def get_adaptive_name_qa_prompt() -> "PromptTemplate":
         """获取自适应人名/公司名问答提示模板"""
-        template = AnswerWithRAGContextNamePrompt.system_prompt_with_schema + "\n\n{context}\n\n{question}"
-        return PromptTemplate(
-            input_variables=["context", "question"],
-            template=template
-        )
+        return _adaptive_qa_prompt(AnswerWithRAGContextNamePrompt.system_prompt_with_schema)
 
     @staticmethod
-    def get_adaptive_number_qa_prompt() -> PromptTemplate:
+    def get_adaptive_number_qa_prompt() -> "PromptTemplate":
         """获取自适应数字指标问答提示模板"""
-        template = AnswerWithRAGContextNumberPrompt.system_prompt_with_schema + "\n\n{context}\n\n{question}"
-        return PromptTemplate(
-            input_variables=["context", "question"],
-            template=template
-        )
+        return _adaptive_qa_prompt(AnswerWithRAGContextNumberPrompt.system_prompt_with_schema)
 
     @staticmethod
-    def get_adaptive_boolean_qa_prompt() -> PromptTemplate:
+    def get_adaptive_boolean_qa_prompt() -> "PromptTemplate":
         """获取自适应布尔值问答提示模板"""
-        template = AnswerWithRAGContextBooleanPrompt.system_prompt_with_schema + "\n\n{context}\n\n{question}"
-        return PromptTemplate(
-            input_variables=["context", "question"],
-            template=template
-        )
+        return _adaptive_qa_prompt(AnswerWithRAGContextBooleanPrompt.system_prompt_with_schema)
 
     @staticmethod
-    def get_adaptive_names_qa_prompt() -> PromptTemplate:
+    def get_adaptive_names_qa_prompt() -> "PromptTemplate":
         """获取自适应多实体问答提示模板"""
-        template = AnswerWithRAGContextNamesPrompt.system_prompt_with_schema + "\n\n{context}\n\n{question}"
-        return PromptTemplate(
-            input_variables=["context", "question"],
-            template=template
-        )
+        return _adaptive_qa_prompt(AnswerWithRAGContextNamesPrompt.system_prompt_with_schema)
 
     @staticmethod
-    def get_adaptive_string_qa_prompt() -> PromptTemplate:
+    def get_adaptive_string_qa_prompt() -> "PromptTemplate":
         """获取自适应字符串问答提示模板"""
-        template = AnswerWithRAGContextStringPrompt.system_prompt_with_schema + "\n\n{context}\n\n{question}"
-        return PromptTemplate(
-            input_variables=["context", "question"],
-            template=template
-        )
+        return _adaptive_qa_prompt(AnswerWithRAGContextStringPrompt.system_prompt_with_schema)
 
 
 # 动态提示生成器实例
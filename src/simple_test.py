@@ -5,19 +5,24 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from fastapi import FastAPI
 from fastapi.responses import FileResponse
 import uvicorn
+from utils.logger import logger
 
 app = FastAPI()
 
+# 前端页面路径在启动时确定并检查一次，避免每个请求都访问文件系统；
+# 按本文件所在目录解析为绝对路径，不依赖启动时的工作目录
+FRONTEND_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend", "index.html")
+FRONTEND_EXISTS = os.path.exists(FRONTEND_PATH)
+
 @app.get("/")
 async def root():
-    print("Root endpoint called")
-    frontend_path = os.path.join("frontend", "index.html")
-    print(f"Looking for file at: {frontend_path}")
-    if os.path.exists(frontend_path):
-        print("File exists, returning FileResponse")
-        return FileResponse(frontend_path)
+    logger.debug("Root endpoint called")
+    logger.debug(f"Looking for file at: {FRONTEND_PATH}")
+    if FRONTEND_EXISTS:
+        logger.debug("File exists, returning FileResponse")
+        return FileResponse(FRONTEND_PATH)
     else:
-        print("File does not exist, returning dict")
+        logger.debug("File does not exist, returning dict")
         return {"message": "Frontend file not found"}
 
 if __name__ == "__main__":
@@ -0,0 +1,52 @@
+# 答案类型判断 - 基于关键词的一次扫描分类
+import re
+
+# 答案类型关键词（模块级不可变常量），按判断优先级排列：number → name → boolean → names
+_ANSWER_TYPE_KEYWORDS = (
+    ("number", ("多少", "金额", "数值", "数量", "比例", "百分比", "率", "收入", "利润", "资产", "负债",
+                "销售额", "成本", "费用", "投资", "市值", "股价", "收益", "产值", "产量", "销量")),
+    ("name", ("谁", "哪个", "哪位", "什么人", "姓名", "名字", "叫什么", "称谓", "职务", "职位", "角色")),
+    ("boolean", ("是否", "有没有", "是否存在", "能否", "可否", "是不是", "是否具备", "是否拥有")),
+    ("names", ("哪些", "哪些人", "几个人", "都有谁", "都包括", "分别", "列表", "清单", "所有", "多个")),
+)
+
+try:
+    import ahocorasick
+    _ANSWER_TYPE_AUTOMATON = ahocorasick.Automaton()
+    for _priority, (_answer_type, _keywords) in enumerate(_ANSWER_TYPE_KEYWORDS):
+        for _keyword in _keywords:
+            # 同一关键词出现在多个类别时保留优先级更高的类别
+            if _keyword not in _ANSWER_TYPE_AUTOMATON:
+                _ANSWER_TYPE_AUTOMATON.add_word(_keyword, (_priority, _answer_type))
+    _ANSWER_TYPE_AUTOMATON.make_automaton()
+except ImportError:
+    _ANSWER_TYPE_AUTOMATON = None
+
+# 未安装pyahocorasick时，每个类别使用一个预编译的多选正则
+_ANSWER_TYPE_PATTERNS = [
+    (answer_type, re.compile("|".join(map(re.escape, keywords))))
+    for answer_type, keywords in _ANSWER_TYPE_KEYWORDS
+]
+
+
+def determine_answer_type(question: str) -> str:
+    """
+    根据问题内容判断答案类型
+    
+    Args:
+        question: 问题文本
+        
+    Returns:
+        答案类型 ("name", "number", "boolean", "names", "string")
+    """
+    # 关键词均为中文，无需大小写归一化；一次扫描取优先级最高的命中类型
+    if _ANSWER_TYPE_AUTOMATON is not None:
+        best = min((value for _, value in _ANSWER_TYPE_AUTOMATON.iter(question)), default=None)
+        return best[1] if best is not None else "string"
+    
+    for answer_type, pattern in _ANSWER_TYPE_PATTERNS:
+        if pattern.search(question):
+            return answer_type
+    
+    # 默认为字符串类型
+    return "string"
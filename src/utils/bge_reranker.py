@@ -1,12 +1,136 @@
 # 通用重排序器 - 支持多种重排模型
 from typing import List, Dict, Any
+import asyncio
 from src.utils.logger import logger
 import os
 from dotenv import load_dotenv
 from openai import OpenAI
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import src.prompts as prompts
-from concurrent.futures import ThreadPoolExecutor
+from src.utils.scorer_cache import get_scorer_cache, text_digest
+from src.utils.ttl_cache import TTLCache
+from src.utils.ranking import top_k_indices
+from src.config.settings import Config
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+import re
+import numpy as np
+
+# LLM单文档打分失败时使用的默认相关性分数
+LLM_FALLBACK_SCORE = 0.5
+_RELEVANCE_SCORE_RE = re.compile(r'"?relevance_score"?\s*[:：]\s*([0-9]*\.?[0-9]+)')
+
+# 环境变量只在模块导入时加载一次，避免每次创建重排序器都重新查找并解析 .env 文件
+load_dotenv()
+_JINA_API_KEY = os.getenv("JINA_API_KEY")
+_LLM_PROVIDER = os.getenv("LLM_PROVIDER", "dashscope").lower()
+_OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+_DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
+_JINA_HEADERS = {
+    'Content-Type': 'application/json',
+    'Authorization': f'Bearer {_JINA_API_KEY}'
+}
+
+# CrossEncoder 模型及其ONNX INT8量化导出文件名
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+ONNX_MODEL_FILE = "model_quantized.onnx"
+
+# CrossEncoder 输入的最大token数，以及其中至少留给文档部分的token数（查询超出部分被截断）
+PAIR_MAX_TOKENS = 512
+DOC_MIN_TOKENS = 256
+# 文档分词结果缓存（进程内共享）
+_doc_tokens_cache = TTLCache(max_items=10000, ttl_sec=3600)
+
+# Jina API 请求的 (连接, 读取) 超时（秒）
+JINA_TIMEOUT = (5, 30)
+# 发送给Jina的单个文档最大字符数（jina-reranker-v2-base-multilingual 最多处理1024个token，中文约每字1个token）
+JINA_MAX_DOC_CHARS = 1024
+
+
+# 查询级重排结果缓存：短时间内重复的 (查询, 候选文档) 组合直接返回上次的结果。
+# 模块级共享，因为 get_high_comp_reranker() 每次检索都会创建新的重排序器
+_rerank_results_cache = TTLCache(
+    max_items=Config.RERANK_RESULT_CACHE_SIZE,
+    ttl_sec=Config.RERANK_RESULT_CACHE_TTL
+)
+
+
+_jina_session = None
+_jina_session_lock = threading.Lock()
+# 正在进行中的Jina重排请求：(查询, 文档, top_k) -> Future
+_jina_inflight: Dict[tuple, Future] = {}
+_jina_inflight_lock = threading.Lock()
+
+
+def _get_jina_session() -> requests.Session:
+    """
+    获取进程内共享的Jina API会话（带连接池与重试）
+    模块级共享，使每次新建的重排序器都能复用已建立的TLS连接
+    """
+    global _jina_session
+    if _jina_session is None:
+        with _jina_session_lock:
+            if _jina_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=16,
+                    pool_maxsize=32,
+                    max_retries=Retry(
+                        total=3,
+                        backoff_factor=0.3,
+                        status_forcelist=[429, 500, 502, 503, 504],
+                        allowed_methods=None  # 重排请求是幂等的，POST也允许重试
+                    )
+                )
+                session.mount("https://", adapter)
+                _jina_session = session
+    return _jina_session
+
+
+def _doc_token_ids(tokenizer, doc: str) -> List[int]:
+    """文档的分词结果（不含特殊符号），按 (分词器, 文档) 缓存，多轮对话中重复出现的检索结果无需重新分词"""
+    key = (tokenizer.name_or_path, doc)
+    token_ids = _doc_tokens_cache.get(key)
+    if token_ids is None:
+        token_ids = tokenizer(doc, add_special_tokens=False, truncation=True, max_length=PAIR_MAX_TOKENS)['input_ids']
+        _doc_tokens_cache.set(key, token_ids)
+    return token_ids
+
+
+def _encode_pairs(tokenizer, query: str, documents: List[str]) -> Dict[str, np.ndarray]:
+    """
+    组装 [CLS] 查询 [SEP] 文档 [SEP] 形式的模型输入
+    
+    查询只分词一次（最多保留 PAIR_MAX_TOKENS - DOC_MIN_TOKENS - 3 个token），文档复用缓存的分词结果，
+    截断到查询之外剩余的长度；返回 input_ids / attention_mask / token_type_ids 三个int64矩阵
+    """
+    query_ids = tokenizer(
+        query, add_special_tokens=False, truncation=True, max_length=PAIR_MAX_TOKENS - DOC_MIN_TOKENS - 3
+    )['input_ids']
+    doc_budget = PAIR_MAX_TOKENS - len(query_ids) - 3
+    doc_ids = [_doc_token_ids(tokenizer, doc)[:doc_budget] for doc in documents]
+    
+    prefix = [tokenizer.cls_token_id, *query_ids, tokenizer.sep_token_id]
+    width = len(prefix) + max(len(ids) for ids in doc_ids) + 1
+    input_ids = np.full((len(documents), width), tokenizer.pad_token_id, dtype=np.int64)
+    attention_mask = np.zeros((len(documents), width), dtype=np.int64)
+    token_type_ids = np.zeros((len(documents), width), dtype=np.int64)
+    
+    for row, ids in enumerate(doc_ids):
+        length = len(prefix) + len(ids) + 1
+        input_ids[row, :length] = prefix + ids + [tokenizer.sep_token_id]
+        attention_mask[row, :length] = 1
+        token_type_ids[row, len(prefix):length] = 1
+    
+    return {'input_ids': input_ids, 'attention_mask': attention_mask, 'token_type_ids': token_type_ids}
+
+
+def _original_order_results(documents: List[str], top_k: int) -> List[Dict[str, Any]]:
+    """重排不可用时按原始顺序返回结果，使用按位置分配的得分；标记为fallback，不写入得分缓存"""
+    return [{'index': i, 'score': 1.0/(i+1), 'text': doc, 'original_rank': i, 'rerank_score': 1.0/(i+1), 'fallback': True}
+            for i, doc in enumerate(documents[:top_k])]
 
 
 class UniversalBGEReranker:
@@ -26,6 +150,7 @@ class UniversalBGEReranker:
         self.model = None
         self.llm_client = None
         self.jina_headers = None
+        self.onnx_session = None
         self._initialized = False
         
         # 初始化模型
@@ -46,10 +171,13 @@ class UniversalBGEReranker:
             self._setup_cross_encoder()
     
     def _setup_cross_encoder(self):
-        """初始化CrossEncoder模型"""
+        """初始化CrossEncoder模型；配置了ONNX模型目录时优先使用ONNX Runtime INT8推理"""
+        if Config.CROSS_ENCODER_ONNX_PATH and self._setup_onnx_cross_encoder(Config.CROSS_ENCODER_ONNX_PATH):
+            return
+        
         try:
             from sentence_transformers import CrossEncoder
-            model_name = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+            model_name = CROSS_ENCODER_MODEL
             logger.info(f"正在尝试加载重排序模型: {model_name}")
             
             try:
@@ -69,37 +197,85 @@ class UniversalBGEReranker:
         if not self._initialized:
             logger.info("CrossEncoder重排序功能将不可用，系统将继续运行但跳过重排序步骤")
     
+    def _setup_onnx_cross_encoder(self, model_dir: str) -> bool:
+        """加载 export_onnx_cross_encoder() 导出的INT8量化模型，成功返回True"""
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError:
+            logger.warning("onnxruntime或transformers库未安装，使用PyTorch CrossEncoder")
+            return False
+        
+        try:
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = Config.ONNX_INTRA_OP_THREADS
+            self.onnx_session = ort.InferenceSession(
+                os.path.join(model_dir, ONNX_MODEL_FILE),
+                sess_options=options,
+                providers=["CPUExecutionProvider"]
+            )
+            self.onnx_tokenizer = AutoTokenizer.from_pretrained(model_dir)
+            self.onnx_input_names = {item.name for item in self.onnx_session.get_inputs()}
+            self._initialized = True
+            logger.info(f"ONNX CrossEncoder重排序模型加载成功: {model_dir}")
+            return True
+        except Exception as e:
+            self.onnx_session = None
+            logger.warning(f"加载ONNX CrossEncoder模型失败，使用PyTorch CrossEncoder: {str(e)}")
+            return False
+    
+    def _onnx_predict(self, query: str, documents: List[str]) -> np.ndarray:
+        """ONNX Runtime 批量推理，返回与 CrossEncoder.predict 一致的sigmoid得分"""
+        features = _encode_pairs(self.onnx_tokenizer, query, documents)
+        feed = {name: value for name, value in features.items() if name in self.onnx_input_names}
+        logits = self.onnx_session.run(None, feed)[0]
+        return 1.0 / (1.0 + np.exp(-logits[:, 0]))
+    
+    def _torch_predict(self, query: str, documents: List[str]) -> np.ndarray:
+        """
+        直接调用CrossEncoder底层模型推理，复用缓存的文档分词结果
+        
+        与 CrossEncoder.predict 使用同样的模型和激活函数，但截断方式不同：predict 对 (查询, 文档)
+        使用 longest_first 截断，这里先截断查询、再把文档截断到剩余长度，超长输入的得分会略有差异
+        """
+        import torch
+        
+        tokenizer = self.model.tokenizer
+        features = _encode_pairs(tokenizer, query, documents)
+        device = next(self.model.model.parameters()).device
+        inputs = {
+            name: torch.from_numpy(value).to(device)
+            for name, value in features.items()
+            if name in tokenizer.model_input_names
+        }
+        with torch.no_grad():
+            logits = self.model.model(**inputs).logits
+            scores = self.model.default_activation_function(logits)
+        return scores[:, 0].cpu().numpy()
+    
     def _setup_jina_api(self):
         """初始化Jina API重排器"""
         try:
             # 初始化Jina重排API地址和请求头
             self.url = 'https://api.jina.ai/v1/rerank'
-            self.jina_headers = self._get_jina_headers()
+            self.jina_headers = _JINA_HEADERS
+            self.session = _get_jina_session()
             self._initialized = True
             logger.info("Jina API重排序器初始化成功")
         except Exception as e:
             logger.error(f"Jina API重排序器初始化失败: {str(e)}")
     
-    def _get_jina_headers(self):
-        """获取Jina API请求头"""
-        load_dotenv()
-        jina_api_key = os.getenv("JINA_API_KEY")    
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {jina_api_key}'
-        }
-        return headers
-    
     def _setup_llm(self):
         """初始化LLM重排器"""
         # 支持 openai/dashscope，默认 dashscope
-        self.provider = os.getenv("LLM_PROVIDER", "dashscope").lower()
+        self.provider = _LLM_PROVIDER
         try:
             self.llm_client = self._set_up_llm_client()
             self.system_prompt_rerank_single_block = prompts.RerankingPrompt.system_prompt_rerank_single_block
             self.system_prompt_rerank_multiple_blocks = prompts.RerankingPrompt.system_prompt_rerank_multiple_blocks
             self.schema_for_single_block = prompts.RetrievalRankingSingleBlock
             self.schema_for_multiple_blocks = prompts.RetrievalRankingMultipleBlocks
+            self.llm_max_workers = Config.LLM_RERANK_MAX_WORKERS
             self._initialized = True
             logger.info("LLM重排序器初始化成功")
         except Exception as e:
@@ -107,12 +283,11 @@ class UniversalBGEReranker:
     
     def _set_up_llm_client(self):
         """根据 provider 初始化 LLM 客户端"""
-        load_dotenv()
         if self.provider == "openai":
-            return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            return OpenAI(api_key=_OPENAI_API_KEY)
         elif self.provider == "dashscope":
             import dashscope
-            dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
+            dashscope.api_key = _DASHSCOPE_API_KEY
             return dashscope
         else:
             raise ValueError(f"不支持的 LLM provider: {self.provider}")
@@ -122,29 +297,27 @@ class UniversalBGEReranker:
         if not self._initialized:
             logger.debug("CrossEncoder重排序器未初始化，返回原始顺序")
             # 返回按原始顺序的结果，使用简单的分数（按位置分配）
-            return [{'index': i, 'score': 1.0/(i+1), 'text': doc, 'original_rank': i, 'rerank_score': 1.0/(i+1)} 
-                    for i, doc in enumerate(documents[:top_k])]
+            return _original_order_results(documents, top_k)
         
         try:
             # 使用CrossEncoder模型
-            sentence_pairs = [[query, doc] for doc in documents]
-            scores = self.model.predict(sentence_pairs)
+            if self.onnx_session is not None:
+                scores = self._onnx_predict(query, documents)
+            else:
+                scores = self._torch_predict(query, documents)
             
-            # 转换得分并排序（按得分降序）
-            score_list = [(i, float(scores[i])) for i in range(len(documents))]
-            score_list.sort(key=lambda x: x[1], reverse=True)  # 按分数降序排列
-        
-            # 返回top_k结果
-            results = []
-            for i in range(min(top_k, len(score_list))):
-                idx, score = score_list[i]
-                results.append({
+            # 只选出得分最高的top_k个（按得分降序），无需对全部得分排序
+            scores = np.asarray(scores, dtype=np.float32)
+            results = [
+                {
                     'index': idx,
-                    'score': float(score),
+                    'score': float(scores[idx]),
                     'text': documents[idx],
                     'original_rank': idx,  # 原始排名
-                    'rerank_score': float(score)  # 重排序得分
-                })
+                    'rerank_score': float(scores[idx])  # 重排序得分
+                }
+                for idx in top_k_indices(scores, top_k)
+            ]
             
             logger.debug(f"CrossEncoder重排序完成，处理了 {len(documents)} 个文档，返回 {len(results)} 个结果")
             return results
@@ -152,25 +325,53 @@ class UniversalBGEReranker:
         except Exception as e:
             logger.error(f"CrossEncoder重排序执行失败: {str(e)}")
             # 返回按原始顺序的结果，但包含rerank_score字段以保持一致性
-            return [{'index': i, 'score': 1.0/(i+1), 'text': doc, 'original_rank': i, 'rerank_score': 1.0/(i+1)} 
-                    for i, doc in enumerate(documents[:top_k])]
+            return _original_order_results(documents, top_k)
 
     def _jina_api_rerank(self, query: str, documents: List[str], top_k: int = 10) -> List[Dict[str, Any]]:
-        """Jina API 重排实现"""
+        """
+        Jina API 重排实现
+        
+        并发的相同请求（查询、文档、top_k均相同）只发送一次HTTP调用，其余调用方等待并共享其结果
+        """
         if not self._initialized or not self.jina_headers:
             logger.debug("Jina API重排序器未初始化，返回原始顺序")
-            return [{'index': i, 'score': 1.0/(i+1), 'text': doc, 'original_rank': i, 'rerank_score': 1.0/(i+1)} 
-                    for i, doc in enumerate(documents[:top_k])]
+            return _original_order_results(documents, top_k)
+        
+        key = (query, tuple(documents), top_k)
+        with _jina_inflight_lock:
+            future = _jina_inflight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                _jina_inflight[key] = future
+        
+        if not is_owner:
+            logger.debug("相同的Jina API重排序请求正在进行，等待其结果")
+            return list(future.result())
         
+        try:
+            results = self._jina_api_request(query, documents, top_k)
+            future.set_result(results)
+            return results
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _jina_inflight_lock:
+                _jina_inflight.pop(key, None)
+
+    def _jina_api_request(self, query: str, documents: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """发送一次Jina API重排请求"""
         try:
             data = {
                 "model": "jina-reranker-v2-base-multilingual",
                 "query": query,
                 "top_n": top_k,
-                "documents": documents
+                # 超出模型输入上限的部分服务端也会截断，提前截断可减少请求体积
+                "documents": [doc[:JINA_MAX_DOC_CHARS] for doc in documents]
             }
 
-            response = requests.post(url=self.url, headers=self.jina_headers, json=data)
+            response = self.session.post(self.url, headers=self.jina_headers, json=data, timeout=JINA_TIMEOUT)
 
             if response.status_code == 200:
                 result = response.json()
@@ -193,49 +394,74 @@ class UniversalBGEReranker:
             else:
                 logger.warning(f"Jina API重排序请求失败: {response.status_code}, {response.text}")
                 # 返回原始顺序
-                return [{'index': i, 'score': 1.0/(i+1), 'text': doc, 'original_rank': i, 'rerank_score': 1.0/(i+1)} 
-                        for i, doc in enumerate(documents[:top_k])]
+                return _original_order_results(documents, top_k)
         except Exception as e:
             logger.error(f"Jina API重排序执行失败: {str(e)}")
-            return [{'index': i, 'score': 1.0/(i+1), 'text': doc, 'original_rank': i, 'rerank_score': 1.0/(i+1)} 
-                    for i, doc in enumerate(documents[:top_k])]
+            return _original_order_results(documents, top_k)
 
     def _llm_rerank(self, query: str, documents: List[str], top_k: int = 5) -> List[Dict[str, Any]]:
-        """LLM 重排实现"""
+        """LLM 重排实现：逐个文档打分（pointwise），多个文档并行调用"""
         if not self._initialized or not self.llm_client:
             logger.debug("LLM重排序器未初始化，返回原始顺序")
-            return [{'index': i, 'score': 1.0/(i+1), 'text': doc, 'original_rank': i, 'rerank_score': 1.0/(i+1)} 
-                    for i, doc in enumerate(documents[:top_k])]
+            return _original_order_results(documents, top_k)
         
         try:
-            # 使用LLM对多个文本块进行重排
-            formatted_blocks = "\n\n---\n\n".join([f'Block {i+1}:\n\n"""{text}"""' for i, text in enumerate(documents)])
-            user_prompt = (
-                f"Here is the query: \"{query}\"\n\n"
-                "Here are the retrieved text blocks:\n"
-                f"{formatted_blocks}\n\n"
-                f"You should provide exactly {len(documents)} rankings, in order."
-            )
+            if len(documents) > 1:
+                with ThreadPoolExecutor(max_workers=min(self.llm_max_workers, len(documents))) as executor:
+                    scores = list(executor.map(lambda doc: self._score_one_doc(query, doc), documents))
+            else:
+                scores = [self._score_one_doc(query, doc) for doc in documents]
+            
+            # 构建结果；打分失败的文档使用默认分数，并标记为不写入得分缓存
+            results = [
+                {
+                    'index': i,
+                    'score': float(score),
+                    'text': doc,
+                    'original_rank': i,  # 原始排名
+                    'rerank_score': float(score),  # 重排序得分
+                    'score_fallback': failed
+                }
+                for i, (doc, (score, failed)) in enumerate(zip(documents, scores))
+            ]
             
+            # 按分数排序
+            results.sort(key=lambda x: x['rerank_score'], reverse=True)
+            results = results[:top_k]
+            
+            logger.debug(f"LLM重排序完成，处理了 {len(documents)} 个文档，返回 {len(results)} 个结果")
+            return results
+            
+        except Exception as e:
+            logger.error(f"LLM重排序执行失败: {str(e)}")
+            return _original_order_results(documents, top_k)
+
+    def _score_one_doc(self, query: str, doc: str):
+        """
+        使用单文本块提示词为一个文档打分
+        
+        Returns:
+            (相关性得分, 是否为失败时的默认分数)
+        """
+        user_prompt = (
+            f"Here is the query: \"{query}\"\n\n"
+            "Here is the retrieved text block:\n"
+            f'"""{doc}"""'
+        )
+        messages = [
+            {"role": "system", "content": self.system_prompt_rerank_single_block},
+            {"role": "user", "content": user_prompt},
+        ]
+        try:
             if self.provider == "openai":
                 completion = self.llm_client.beta.chat.completions.parse(
                     model="gpt-4o-mini-2024-07-18",
                     temperature=0,
-                    messages=[
-                        {"role": "system", "content": self.system_prompt_rerank_multiple_blocks},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    response_format=self.schema_for_multiple_blocks
+                    messages=messages,
+                    response_format=self.schema_for_single_block
                 )
-                response = completion.choices[0].message.parsed
-                response_dict = response.model_dump()
-                rankings = response_dict.get('block_rankings', [])
+                return float(completion.choices[0].message.parsed.relevance_score), False
             elif self.provider == "dashscope":
-                import dashscope
-                messages = [
-                    {"role": "system", "content": self.system_prompt_rerank_multiple_blocks},
-                    {"role": "user", "content": user_prompt},
-                ]
                 rsp = self.llm_client.Generation.call(
                     model="qwen-turbo",
                     messages=messages,
@@ -246,47 +472,19 @@ class UniversalBGEReranker:
                 # 健壮性检查，防止 rsp 为 None 或非 dict
                 if not rsp or not isinstance(rsp, dict):
                     raise RuntimeError(f"DashScope返回None或非dict: {rsp}")
-                    
-                if 'output' in rsp and 'choices' in rsp['output']:
-                    content = rsp['output']['choices'][0]['message']['content']
-                    # 这里只返回字符串，后续可按需解析
-                    rankings = [{"relevance_score": 0.0, "reasoning": content} for _ in documents]
-                else:
+                if 'output' not in rsp or 'choices' not in rsp['output']:
                     raise RuntimeError(f"DashScope返回格式异常: {rsp}")
+                
+                content = rsp['output']['choices'][0]['message']['content']
+                match = _RELEVANCE_SCORE_RE.search(content)
+                if not match:
+                    raise RuntimeError(f"无法从DashScope返回中解析相关性分数: {content[:200]}")
+                return float(match.group(1)), False
             else:
                 raise ValueError(f"不支持的 LLM provider: {self.provider}")
-            
-            # 构建结果
-            results = []
-            processed_docs = 0
-            for i, doc in enumerate(documents):
-                if i < len(rankings):
-                    score = rankings[i].get("relevance_score", 0.0)
-                else:
-                    score = 0.0  # 默认分数
-                
-                results.append({
-                    'index': i,
-                    'score': float(score),
-                    'text': doc,
-                    'original_rank': i,  # 原始排名
-                    'rerank_score': float(score)  # 重排序得分
-                })
-                processed_docs += 1
-                
-                if processed_docs >= top_k:
-                    break
-            
-            # 按分数排序
-            results.sort(key=lambda x: x['rerank_score'], reverse=True)
-            
-            logger.debug(f"LLM重排序完成，处理了 {len(documents)} 个文档，返回 {len(results)} 个结果")
-            return results
-            
         except Exception as e:
-            logger.error(f"LLM重排序执行失败: {str(e)}")
-            return [{'index': i, 'score': 1.0/(i+1), 'text': doc, 'original_rank': i, 'rerank_score': 1.0/(i+1)} 
-                    for i, doc in enumerate(documents[:top_k])]
+            logger.warning(f"LLM单文档打分失败，使用默认分数 {LLM_FALLBACK_SCORE}: {str(e)}")
+            return LLM_FALLBACK_SCORE, True
 
     def rerank(self, query: str, documents: List[str], top_k: int = 5) -> List[Dict[str, Any]]:
         """
@@ -303,6 +501,52 @@ class UniversalBGEReranker:
         if not documents:
             return []
         
+        score_cache = get_scorer_cache() if self._initialized else None
+        if score_cache is None:
+            return self._score_documents(query, documents, top_k)
+        
+        # 先查得分缓存，只把未缓存过的文档交给重排模型
+        model_key = self._cache_model_key()
+        qhash = text_digest(query)
+        dhashes = [text_digest(doc) for doc in documents]
+        scores = score_cache.get_many(model_key, qhash, set(dhashes))
+        
+        missing = [i for i, dhash in enumerate(dhashes) if dhash not in scores]
+        if missing:
+            missing_docs = [documents[i] for i in missing]
+            scored = self._score_documents(query, missing_docs, len(missing_docs))
+            if any(result.get('fallback') for result in scored):
+                return _original_order_results(documents, top_k)
+            new_scores = [(dhashes[missing[result['index']]], result['rerank_score']) for result in scored]
+            score_cache.put_many(model_key, qhash, [
+                item for item, result in zip(new_scores, scored) if not result.get('score_fallback')
+            ])
+            scores.update(new_scores)
+        else:
+            logger.debug(f"重排序得分全部命中缓存，共 {len(documents)} 个文档")
+        
+        available = [i for i, dhash in enumerate(dhashes) if dhash in scores]
+        values = np.fromiter((scores[dhashes[i]] for i in available), dtype=np.float32, count=len(available))
+        ranked = [available[j] for j in top_k_indices(values, top_k)]
+        return [
+            {
+                'index': i,
+                'score': scores[dhashes[i]],
+                'text': documents[i],
+                'original_rank': i,
+                'rerank_score': scores[dhashes[i]]
+            }
+            for i in ranked
+        ]
+    
+    def _cache_model_key(self) -> str:
+        """得分缓存中区分不同重排模型的标识"""
+        if self.model_type == "llm":
+            return f"llm:{self.provider}"
+        return self.model_type
+    
+    def _score_documents(self, query: str, documents: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """按模型类型调用相应的重排实现"""
         if self.model_type == "cross_encoder":
             return self._cross_encoder_rerank(query, documents, top_k)
         elif self.model_type == "jina_api":
@@ -327,9 +571,26 @@ class UniversalBGEReranker:
         """
         if not search_results:
             return []
+        
+        cache_key = (
+            self._cache_model_key(),
+            query,
+            tuple(result.get('id') or hash(result['content']) for result in search_results),
+            top_k
+        )
+        cached = _rerank_results_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"重排序结果缓存命中，返回 {len(cached)} 个结果")
+            return list(cached)
             
-        # 提取文档内容
-        documents = [result['content'] for result in search_results]
+        # 提取文档内容；内容完全相同的结果（如同一文档被重复导入）只送入重排一次，保留首次出现的结果
+        first_index: Dict[str, int] = {}
+        for i, result in enumerate(search_results):
+            first_index.setdefault(result['content'], i)
+        documents = list(first_index)
+        original_indices = list(first_index.values())
+        if len(documents) < len(search_results):
+            logger.debug(f"重排前去除 {len(search_results) - len(documents)} 个内容重复的结果")
         
         # 进行重排序
         reranked_results = self.rerank(query, documents, top_k)
@@ -337,7 +598,7 @@ class UniversalBGEReranker:
         # 重新组装结果，保持原始结果的所有信息
         final_results = []
         for reranked_result in reranked_results:
-            original_idx = reranked_result['index']
+            original_idx = original_indices[reranked_result['index']]
             original_result = search_results[original_idx].copy()
             # 添加重排序后的得分（覆盖可能已有的值）
             original_result['rerank_score'] = reranked_result['rerank_score']
@@ -345,9 +606,40 @@ class UniversalBGEReranker:
             original_result['original_position'] = original_idx + 1
             final_results.append(original_result)
         
+        # 重排不可用（按原始顺序返回）时不缓存，以便恢复后重新计算
+        if not any(result.get('fallback') for result in reranked_results):
+            _rerank_results_cache.set(cache_key, list(final_results))
+        
         logger.info(f"重排序搜索结果完成，返回 {len(final_results)} 个结果")
         return final_results
 
+    async def arerank(self, query: str, documents: List[str], top_k: int = 5) -> List[Dict[str, Any]]:
+        """异步重排序：在线程中执行 rerank()，不阻塞事件循环，多个查询可通过asyncio.gather并发"""
+        return await asyncio.to_thread(self.rerank, query, documents, top_k)
+
+    async def arerank_search_results(self, query: str, search_results: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
+        """异步重排序搜索结果，同 rerank_search_results()"""
+        return await asyncio.to_thread(self.rerank_search_results, query, search_results, top_k)
+
+
+def export_onnx_cross_encoder(output_dir: str, model_name: str = CROSS_ENCODER_MODEL):
+    """
+    一次性导出CrossEncoder为ONNX并做动态INT8量化（需要安装 optimum[onnxruntime]）
+    导出目录配置到 CROSS_ENCODER_ONNX_PATH 后，cross_encoder 重排即使用ONNX Runtime推理
+    """
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    
+    model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+    quantizer = ORTQuantizer.from_pretrained(model)
+    quantizer.quantize(
+        save_dir=output_dir,
+        quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    )
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+    logger.info(f"CrossEncoder ONNX INT8模型已导出到: {output_dir}")
+
 
 def create_reranker(model_type: str = "jina_api"):
     """
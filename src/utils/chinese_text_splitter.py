@@ -1,17 +1,35 @@
 """
-增强的文档分割器，结合LangChain TextSplitter和滑动窗口策略
+增强的文档分割器，按分隔符优先级递归切分并结合滑动窗口策略
 用于优化中文文档的分块效果
 """
-from typing import List, Optional
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from typing import Iterable, Iterator, List, Optional, Tuple
+from collections import deque
+import copy
+import re
 from langchain_core.documents import Document
+from src.config.settings import Config
 from src.utils.logger import logger
 
 
+def estimate_token_count(text: str) -> int:
+    """
+    快速估算文本的token数，可作为分割器的 length_function，使块大小与嵌入模型的token上限对齐
+    
+    ASCII字符按平均约4个字符1个token计算，汉字等非ASCII字符按每字1个token（偏保守的上限）计算；
+    ASCII字符数通过 encode('ascii', 'ignore') 在C层统计，无需逐字符判断或完整分词
+    """
+    if text.isascii():
+        return (len(text) + 3) // 4
+    ascii_count = len(text.encode('ascii', 'ignore'))
+    return (ascii_count + 3) // 4 + len(text) - ascii_count
+
+
 class ChineseTextSplitter:
     """
     中文文本分割器，专门为中文文档优化
-    结合了LangChain的TextSplitter和滑动窗口策略
+    
+    切分规则与LangChain的RecursiveCharacterTextSplitter一致（分隔符保留在后一块开头，块间按chunk_overlap重叠），
+    但分隔符正则预编译后直接在原文的下标区间上匹配，切分与合并只操作整数下标，每个块只切片一次，不再反复复制和拼接子串。
     """
     
     def __init__(
@@ -56,14 +74,9 @@ class ChineseTextSplitter:
         self.separators = separators
         self.length_function = length_function or len
         
-        # 初始化LangChain的RecursiveCharacterTextSplitter
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=separators,
-            length_function=self.length_function,
-            is_separator_regex=False
-        )
+        # 去重后的非空分隔符按优先级预编译，空字符串""表示最后按字符切分
+        self._patterns = [re.compile(re.escape(sep)) for sep in dict.fromkeys(separators) if sep]
+        self._char_level = "" in separators
     
     def split_documents(self, documents: List[Document]) -> List[Document]:
         """
@@ -77,27 +90,31 @@ class ChineseTextSplitter:
         """
         logger.info(f"开始分割 {len(documents)} 个文档，块大小: {self.chunk_size}，重叠: {self.chunk_overlap}")
         
-        split_docs = []
-        
-        for doc in documents:
-            # 使用LangChain的text_splitter分割单个文档
-            doc_splits = self.text_splitter.split_documents([doc])
-            
-            # 为每个分割添加元数据
-            for split_doc in doc_splits:
-                # 保留原始元数据
-                if not hasattr(split_doc, 'metadata'):
-                    split_doc.metadata = {}
-                
-                # 添加分割相关的元数据
-                split_doc.metadata['chunk_size'] = self.chunk_size
-                split_doc.metadata['chunk_overlap'] = self.chunk_overlap
-                split_doc.metadata['original_length'] = len(doc.page_content)
-                
-                split_docs.append(split_doc)
+        split_docs = list(self.iter_split_documents(documents))
         
         logger.info(f"分割完成，得到 {len(split_docs)} 个文档块")
         return split_docs
+    
+    def iter_split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        逐个分割文档并依次产出文档块（documents可以是生成器，如按页加载的PDF）
+        
+        Args:
+            documents: 输入的文档
+            
+        Yields:
+            分割后的文档块
+        """
+        common_meta = {'chunk_size': self.chunk_size, 'chunk_overlap': self.chunk_overlap}
+        for doc in documents:
+            # 每个文档只构建一次块元数据：保留原始元数据（与原文档不共享），并添加分割相关的元数据；
+            # 元数据为扁平的来源/页码等信息，各块浅拷贝这份字典即可
+            chunk_meta = copy.deepcopy(doc.metadata)
+            chunk_meta.update(common_meta)
+            chunk_meta['original_length'] = len(doc.page_content)
+            
+            for chunk in self.split_text(doc.page_content):
+                yield Document(page_content=chunk, metadata=dict(chunk_meta))
 
     def split_text(self, text: str) -> List[str]:
         """
@@ -109,7 +126,83 @@ class ChineseTextSplitter:
         Returns:
             分割后的文本列表
         """
-        return self.text_splitter.split_text(text)
+        chunks: List[str] = []
+        self._split_span(text, 0, len(text), 0, chunks)
+        return chunks
+    
+    def _split_span(self, text: str, start: int, end: int, level: int, chunks: List[str]):
+        """
+        切分 text[start:end]：使用该区间内出现的最高优先级分隔符切成若干段，
+        小于chunk_size的相邻段合并成块，过长的段用下一级分隔符继续切分（递归深度不超过分隔符个数）
+        """
+        # 正则直接在原文的 [start, end) 区间内匹配，不复制子串
+        for current in range(level, len(self._patterns)):
+            pattern = self._patterns[current]
+            first = pattern.search(text, start, end)
+            if first is not None:
+                break
+        else:
+            # 区间内没有可用的分隔符
+            if self._char_level:
+                self._split_chars(text, start, end, chunks)
+            else:
+                self._emit(text, start, end, chunks)
+            return
+        
+        # 分隔符保留在后一段的开头
+        cuts = [match.start() for match in pattern.finditer(text, first.start(), end)]
+        if cuts[0] == start:
+            cuts = cuts[1:]
+        small: List[Tuple[int, int]] = []
+        for piece_start, piece_end in zip([start, *cuts], [*cuts, end]):
+            if self._length(text, piece_start, piece_end) < self.chunk_size:
+                small.append((piece_start, piece_end))
+                continue
+            if small:
+                self._merge(text, small, chunks)
+                small = []
+            self._split_span(text, piece_start, piece_end, current + 1, chunks)
+        if small:
+            self._merge(text, small, chunks)
+    
+    def _length(self, text: str, start: int, end: int) -> int:
+        if self.length_function is len:
+            return end - start
+        return self.length_function(text[start:end])
+    
+    def _merge(self, text: str, spans: List[Tuple[int, int]], chunks: List[str]):
+        """把相邻的小段合并成不超过chunk_size的块，相邻块之间保留不超过chunk_overlap的重叠"""
+        window = deque()
+        total = 0
+        for start, end in spans:
+            length = self._length(text, start, end)
+            if total + length > self.chunk_size:
+                if window:
+                    self._emit(text, window[0][0], window[-1][1], chunks)
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    total -= window.popleft()[2]
+            window.append((start, end, length))
+            total += length
+        if window:
+            self._emit(text, window[0][0], window[-1][1], chunks)
+    
+    def _split_chars(self, text: str, start: int, end: int, chunks: List[str]):
+        """没有分隔符可用时按字符切分"""
+        if self.length_function is not len:
+            self._merge(text, [(i, i + 1) for i in range(start, end)], chunks)
+            return
+        # 按字符数计长时，逐字符合并等价于步长为 chunk_size - chunk_overlap 的固定窗口
+        step = max(1, self.chunk_size - self.chunk_overlap)
+        while end - start > self.chunk_size:
+            self._emit(text, start, start + self.chunk_size, chunks)
+            start += step
+        self._emit(text, start, end, chunks)
+    
+    @staticmethod
+    def _emit(text: str, start: int, end: int, chunks: List[str]):
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
 
 
 # 全局默认分割器实例
@@ -135,5 +228,6 @@ def create_advanced_chinese_splitter(
     return ChineseTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
-        separators=separators
+        separators=separators,
+        length_function=estimate_token_count if Config.SPLITTER_LENGTH_UNIT == "tokens" else None
     )
\ No newline at end of file
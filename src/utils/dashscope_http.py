@@ -0,0 +1,71 @@
+"""
+DashScope SDK 在每次同步调用时都会新建 requests.Session()，
+导致每个 embedding / 生成请求都要重新进行 TCP + TLS 握手。
+本模块提供一个带连接池和 keep-alive 的共享 Session，并让 SDK 的 HTTP 请求复用它。
+"""
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from src.utils.logger import logger
+
+# 连接池大小，需覆盖上传线程池等并发调用方
+POOL_MAXSIZE = 64
+
+_session = None
+_installed = False
+_install_lock = threading.Lock()
+_session_lock = threading.Lock()
+
+
+def get_shared_session() -> requests.Session:
+    """获取全局共享的 requests.Session（带连接池、keep-alive 与连接重试）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_MAXSIZE,
+                    pool_maxsize=POOL_MAXSIZE,
+                    max_retries=Retry(total=3, backoff_factor=0.2)
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+class _SharedSessionContext:
+    """替代 requests.Session() 的上下文管理器：返回共享 Session，退出时不关闭连接"""
+
+    def __enter__(self) -> requests.Session:
+        return get_shared_session()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class _PooledRequests:
+    """requests 模块代理，仅替换 Session，其余属性透传"""
+    Session = _SharedSessionContext
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+def install_dashscope_keepalive():
+    """让 DashScope SDK 的同步 HTTP 请求复用共享连接池（幂等）"""
+    global _installed
+    if _installed:
+        return
+    with _install_lock:
+        if _installed:
+            return
+        try:
+            from dashscope.api_entities import http_request
+            http_request.requests = _PooledRequests()
+            _installed = True
+            logger.info("已启用 DashScope HTTP 连接复用")
+        except (ImportError, AttributeError) as e:
+            logger.warning(f"无法启用 DashScope HTTP 连接复用: {e}")
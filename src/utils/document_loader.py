@@ -1,11 +1,45 @@
 # 文档加载器
 import os
-from typing import List
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Tuple
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
 from langchain_core.documents import Document
+from src.config.settings import Config
 from src.utils.logger import logger
 from src.utils.chinese_text_splitter import ChineseTextSplitter, create_advanced_chinese_splitter
 
+# 未配置 DOCUMENT_LOADER_WORKERS 时单次目录导入最多使用的解析进程数（多个导入可能同时进行）
+DEFAULT_LOADER_WORKERS = 4
+
+
+def extract_content_and_metadata(doc: Any) -> Tuple[str, Dict[str, Any]]:
+    """从Document/dict/字符串中提取文档内容和元数据，缺少或为None的元数据统一返回空字典"""
+    if hasattr(doc, 'page_content'):
+        return doc.page_content, getattr(doc, 'metadata', None) or {}
+    if isinstance(doc, dict):
+        content = doc['page_content'] if 'page_content' in doc else str(doc)
+        return content, doc.get('metadata') or {}
+    if isinstance(doc, str):
+        return doc, {}
+    return str(doc), {}
+
+
+def _load_file(file_path: str, use_advanced_splitting: bool, chunk_size: int, chunk_overlap: int) -> List[Document]:
+    """加载并分割单个文件，失败时记录警告并返回空列表（模块级函数，便于在子进程中执行）"""
+    try:
+        return DocumentLoader.load_document(
+            file_path, 
+            use_advanced_splitting=use_advanced_splitting,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+    except Exception as e:
+        logger.warning(f"无法加载文件 {file_path}: {str(e)}")
+        return []
+
 
 class DocumentLoader:
     """文档加载器，支持多种格式，并使用优化的中文文本分割策略"""
@@ -31,6 +65,33 @@ class DocumentLoader:
         Returns:
             文档列表
         """
+        return list(DocumentLoader.iter_document(
+            file_path,
+            use_advanced_splitting=use_advanced_splitting,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        ))
+    
+    @staticmethod
+    def iter_document(
+        file_path: str, 
+        use_advanced_splitting: bool = True,
+        chunk_size: int = 500,
+        chunk_overlap: int = 50
+    ) -> Iterator[Document]:
+        """
+        按页（或按文件）流式加载文档并逐页分割，内存中只保留当前页及其文档块；
+        不支持的文件格式在调用时立即抛出异常
+        
+        Args:
+            file_path: 文件路径
+            use_advanced_splitting: 是否使用高级分割策略
+            chunk_size: 分割块大小
+            chunk_overlap: 分割块重叠大小
+        
+        Yields:
+            文档块
+        """
         ext = os.path.splitext(file_path)[1].lower()
         
         if ext == '.pdf':
@@ -42,28 +103,109 @@ class DocumentLoader:
         else:
             raise ValueError(f"不支持的文件格式: {ext}")
         
+        return DocumentLoader._stream_loader(loader, file_path, use_advanced_splitting, chunk_size, chunk_overlap)
+    
+    @staticmethod
+    def _stream_loader(
+        loader,
+        file_path: str,
+        use_advanced_splitting: bool,
+        chunk_size: int,
+        chunk_overlap: int
+    ) -> Iterator[Document]:
+        """通过 loader.lazy_load() 逐页读取，添加文件元数据后逐页分割并产出文档块"""
         logger.info(f"正在加载文档: {file_path}")
-        documents = loader.load()
-        logger.info(f"成功加载 {len(documents)} 个原始文档块")
+        filename = os.path.basename(file_path)
+        page_count = 0
+        chunk_count = 0
         
-        # 添加文件元数据
-        for doc in documents:
-            if not hasattr(doc, 'metadata'):
-                doc.metadata = {}
-            doc.metadata['source'] = file_path
-            doc.metadata['filename'] = os.path.basename(file_path)
+        def iter_pages():
+            nonlocal page_count
+            for doc in loader.lazy_load():
+                # 添加文件元数据
+                if not hasattr(doc, 'metadata'):
+                    doc.metadata = {}
+                doc.metadata['source'] = file_path
+                doc.metadata['filename'] = filename
+                page_count += 1
+                yield doc
         
-        # 如果启用了高级分割，则使用优化的中文分割器
-        if use_advanced_splitting and len(documents) > 0:
+        # 如果启用了高级分割，则使用优化的中文分割器逐页分割
+        if use_advanced_splitting:
             logger.info(f"使用高级分割策略，块大小: {chunk_size}，重叠: {chunk_overlap}")
             splitter = create_advanced_chinese_splitter(
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap
             )
-            documents = splitter.split_documents(documents)
-            logger.info(f"高级分割完成后，共有 {len(documents)} 个文档块")
+            documents = splitter.iter_split_documents(iter_pages())
+        else:
+            documents = iter_pages()
+        
+        for doc in documents:
+            chunk_count += 1
+            yield doc
+        
+        logger.info(f"成功加载 {page_count} 个原始文档块，共产出 {chunk_count} 个文档块")
+    
+    @staticmethod
+    def iter_documents_from_directory(
+        directory: str, 
+        use_advanced_splitting: bool = True,
+        chunk_size: int = 500,
+        chunk_overlap: int = 50
+    ) -> Iterator[Document]:
+        """
+        逐个文件加载目录中所有支持的文档并依次产出文档块，内存中只保留当前文件的文档块
         
-        return documents
+        Args:
+            directory: 目录路径
+            use_advanced_splitting: 是否使用高级分割策略
+            chunk_size: 分割块大小
+            chunk_overlap: 分割块重叠大小
+        
+        Yields:
+            文档块
+        """
+        file_paths = [
+            os.path.join(root, file)
+            for root, dirs, files in os.walk(directory)
+            for file in files
+            if os.path.splitext(file)[1].lower() in DocumentLoader.SUPPORTED_EXTENSIONS
+        ]
+        options = (use_advanced_splitting, chunk_size, chunk_overlap)
+        workers = min(
+            Config.DOCUMENT_LOADER_WORKERS or min(DEFAULT_LOADER_WORKERS, os.cpu_count() or 1),
+            len(file_paths)
+        )
+        
+        total = 0
+        if workers <= 1:
+            for file_path in file_paths:
+                try:
+                    for doc in DocumentLoader.iter_document(file_path, *options):
+                        total += 1
+                        yield doc
+                except Exception as e:
+                    logger.warning(f"无法加载文件 {file_path}: {str(e)}")
+        else:
+            # PDF/DOCX解析主要是持有GIL的纯Python代码，用多进程并行解析；
+            # 同时在途的文件数有上限，并按文件顺序产出，内存中只保留少量文件的文档块；
+            # 调用方进程中已有多个线程（线程池、日志写出线程等），用spawn启动子进程，避免fork继承被占用的锁而死锁
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                path_iter = iter(file_paths)
+                pending = deque(
+                    executor.submit(_load_file, file_path, *options)
+                    for file_path in islice(path_iter, workers * 2)
+                )
+                while pending:
+                    docs = pending.popleft().result()
+                    next_path = next(path_iter, None)
+                    if next_path is not None:
+                        pending.append(executor.submit(_load_file, next_path, *options))
+                    total += len(docs)
+                    yield from docs
+        
+        logger.info(f"从目录 {directory} 总共加载了 {total} 个文档块")
     
     @staticmethod
     def load_documents_from_directory(
@@ -84,23 +226,9 @@ class DocumentLoader:
         Returns:
             文档列表
         """
-        all_documents = []
-
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                file_path = os.path.join(root, file)
-                if os.path.splitext(file)[1].lower() in DocumentLoader.SUPPORTED_EXTENSIONS:
-                    try:
-                        docs = DocumentLoader.load_document(
-                            file_path, 
-                            use_advanced_splitting=use_advanced_splitting,
-                            chunk_size=chunk_size,
-                            chunk_overlap=chunk_overlap
-                        )
-                        all_documents.extend(docs)
-                    except Exception as e:
-                        logger.warning(f"无法加载文件 {file_path}: {str(e)}")
-                        continue
-        
-        logger.info(f"从目录 {directory} 总共加载了 {len(all_documents)} 个文档块")
-        return all_documents
\ No newline at end of file
+        return list(DocumentLoader.iter_documents_from_directory(
+            directory,
+            use_advanced_splitting=use_advanced_splitting,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        ))
@@ -1,22 +1,66 @@
 # 向量化工具类
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import numpy as np
 import dashscope
 from src.config.settings import Config
 from src.utils.logger import logger
+from src.utils.dashscope_http import install_dashscope_keepalive
+
+# 限流(429)或服务端错误(5xx)时的最大重试次数与初始退避时间（秒）
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
 
 class EmbeddingClient:
     """阿里通义 embedding 客户端"""
     
+    # 查询向量缓存，所有实例共享：键为 (模型名, 规范化后的查询)
+    _query_cache: "OrderedDict[tuple, List[float]]" = OrderedDict()
+    _query_cache_lock = threading.Lock()
+    
     def __init__(self):
         # 设置API密钥
         dashscope.api_key = Config.DASHSCOPE_API_KEY
+        install_dashscope_keepalive()
         self.model = Config.EMBEDDING_MODEL_NAME
         
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """嵌入文档列表"""
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """
+        嵌入文档列表；超过单次请求上限时按批拆分并发调用，结果保持输入顺序
+        
+        Returns:
+            形状为 (len(texts), 向量维度) 的float32矩阵，每一行是一个文档向量
+        """
         try:
             logger.info(f"正在嵌入 {len(texts)} 个文档")
             
+            batch_size = Config.EMBEDDING_BATCH_SIZE
+            batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+            if len(batches) <= 1:
+                embeddings = self._embed_batch(texts)
+            else:
+                workers = min(max(1, Config.EMBEDDING_CONCURRENCY), len(batches))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    embeddings = [
+                        embedding
+                        for batch_embeddings in executor.map(self._embed_batch, batches)
+                        for embedding in batch_embeddings
+                    ]
+            
+            logger.info(f"文档嵌入完成，每个向量维度: {len(embeddings[0]) if embeddings else 0}")
+            # 连续的float32矩阵比嵌套的Python float列表小约7倍，写入ES时可直接序列化
+            return np.asarray(embeddings, dtype=np.float32)
+                
+        except Exception as e:
+            logger.error(f"文档嵌入失败: {str(e)}")
+            raise
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """单次调用API嵌入一批文本，遇到限流或服务端错误时指数退避重试"""
+        for attempt in range(MAX_RETRIES + 1):
             # 使用dashscope TextEmbedding API
             response = dashscope.TextEmbedding.call(
                 model=self.model,
@@ -28,24 +72,56 @@ class EmbeddingClient:
                 if isinstance(response.output, dict):
                     # 如果是字典类型，通过键访问
                     embeddings_data = response.output.get('embeddings', [])
-                    embeddings = [item['embedding'] for item in embeddings_data]
-                else:
-                    # 如果是对象类型，通过属性访问
-                    embeddings = [item.embedding for item in response.output.embeddings]
-                    
-                logger.info(f"文档嵌入完成，每个向量维度: {len(embeddings[0]) if embeddings else 0}")
-                return embeddings
-            else:
-                error_msg = f"Embedding API调用失败: {response.code} - {response.message}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
-                
-        except Exception as e:
-            logger.error(f"文档嵌入失败: {str(e)}")
-            raise
+                    return [item['embedding'] for item in embeddings_data]
+                # 如果是对象类型，通过属性访问
+                return [item.embedding for item in response.output.embeddings]
+            
+            if attempt < MAX_RETRIES and (response.status_code == 429 or response.status_code >= 500):
+                delay = RETRY_BACKOFF * (2 ** attempt)
+                logger.warning(f"Embedding API返回 {response.status_code}，{delay:.1f} 秒后重试")
+                time.sleep(delay)
+                continue
+            
+            error_msg = f"Embedding API调用失败: {response.code} - {response.message}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+    
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """规范化查询文本（合并空白字符）作为缓存键"""
+        return " ".join(query.split())
+    
+    def _get_cached_query(self, key: tuple) -> Optional[List[float]]:
+        with self._query_cache_lock:
+            embedding = self._query_cache.get(key)
+            if embedding is not None:
+                self._query_cache.move_to_end(key)
+            return embedding
+    
+    def _cache_query(self, key: tuple, embedding: List[float]):
+        with self._query_cache_lock:
+            self._query_cache[key] = embedding
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > Config.EMBEDDING_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
     
     def embed_query(self, query: str) -> List[float]:
-        """嵌入查询文本"""
+        """嵌入查询文本（命中缓存时不调用API）"""
+        cache_enabled = Config.EMBEDDING_CACHE_SIZE > 0
+        if cache_enabled:
+            cache_key = (self.model, self._normalize_query(query))
+            cached = self._get_cached_query(cache_key)
+            if cached is not None:
+                logger.debug(f"查询向量命中缓存: {query[:50]}...")
+                return cached
+        
+        embedding = self._embed_query_uncached(query)
+        if cache_enabled:
+            self._cache_query(cache_key, embedding)
+        return embedding
+    
+    def _embed_query_uncached(self, query: str) -> List[float]:
+        """调用API嵌入查询文本"""
         try:
             logger.info(f"正在嵌入查询: {query[:50]}...")
             
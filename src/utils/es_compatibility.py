@@ -4,6 +4,7 @@ Elasticsearch 9.x 兼容性工具模块
 """
 
 from elasticsearch import Elasticsearch
+import threading
 import sys
 import os
 # 添加项目根目录到路径中
@@ -11,6 +12,69 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 from config.settings import Config
 from utils.logger import logger
 
+# 安装了orjson时使用C实现的序列化器，显著加快包含1024维向量的请求体编码
+try:
+    from elasticsearch.serializer import OrjsonSerializer
+    _SERIALIZER_KWARGS = {"serializer": OrjsonSerializer()}
+except ImportError:
+    _SERIALIZER_KWARGS = {}
+
+# 多节点集群可开启节点嗅探：启动时及节点故障时刷新节点列表，自动发现新节点并绕开故障节点
+_SNIFF_KWARGS = {
+    "sniff_on_start": True,
+    "sniff_on_node_failure": True,
+    "min_delay_between_sniffing": 60,
+} if Config.ES_SNIFF else {}
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def to_es_vector(vector):
+    """
+    将向量转换为发送给ES的格式
+    使用orjson序列化器时转换为float32数组，由orjson直接编码numpy数组（按float32精度输出，数字更短）；
+    否则numpy数组转换为列表，Python列表保持原样
+    """
+    if _SERIALIZER_KWARGS and np is not None:
+        return np.asarray(vector, dtype=np.float32)
+    if hasattr(vector, "tolist"):
+        # 标准库json无法序列化numpy数组（如 embed_documents 返回的矩阵行）
+        return vector.tolist()
+    return vector
+
+
+def get_es_client():
+    """
+    获取进程内共享的ES客户端（首次调用时创建）
+    所有ElasticSearchClient实例复用同一个连接池，避免重复的TCP/TLS握手
+    """
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = create_es_client()
+    return _shared_client
+
+
+def _log_es_version(info):
+    """记录ES版本并检查版本兼容性"""
+    es_version = info['version']['number']
+    logger.info(f"Elasticsearch 版本: {es_version}")
+    
+    major_version = int(es_version.split('.')[0])
+    if major_version >= 9:
+        logger.info(f"当前连接的ES {es_version} 版本与客户端兼容")
+    elif major_version == 8:
+        logger.info(f"当前连接的ES {es_version} 版本与客户端兼容")
+    else:
+        logger.warning(f"检测到ES版本 {es_version}，可能与当前客户端存在兼容性问题")
+
 
 def create_es_client():
     """
@@ -27,28 +91,15 @@ def create_es_client():
             ca_certs=None,  # 如果有自定义CA证书可以指定
             max_retries=3,  # 设置重试次数
             retry_on_timeout=True,  # 超时时重试
-            http_compress=True  # 启用压缩减少传输数据量
+            http_compress=True,  # 启用压缩减少传输数据量
+            connections_per_node=Config.ES_CONNECTIONS_PER_NODE,  # 连接池大小，需覆盖后端线程池的并发请求
+            **_SERIALIZER_KWARGS,
+            **_SNIFF_KWARGS
         )
         
-        # 测试连接
-        if es_client.ping():
-            logger.info("成功连接到 Elasticsearch 9.x 服务器")
-        else:
-            logger.warning("无法连接到 Elasticsearch 服务器")
-            
-        # 获取ES版本信息
-        info = es_client.info()
-        es_version = info['version']['number']
-        logger.info(f"Elasticsearch 版本: {es_version}")
-        
-        # 检查版本兼容性
-        major_version = int(es_version.split('.')[0])
-        if major_version >= 9:
-            logger.info(f"当前连接的ES {es_version} 版本与客户端兼容")
-        elif major_version == 8:
-            logger.info(f"当前连接的ES {es_version} 版本与客户端兼容")
-        else:
-            logger.warning(f"检测到ES版本 {es_version}，可能与当前客户端存在兼容性问题")
+        # 一次 info() 请求同时完成连通性检查与版本检查（ping() 内部同样调用 info()，无需多一次往返）
+        _log_es_version(es_client.info())
+        logger.info("成功连接到 Elasticsearch 9.x 服务器")
         
         return es_client
         
@@ -66,26 +117,15 @@ def create_es_client():
                 ca_certs=None,
                 max_retries=3,
                 retry_on_timeout=True,
-                http_compress=True
+                http_compress=True,
+                connections_per_node=Config.ES_CONNECTIONS_PER_NODE,
+                **_SERIALIZER_KWARGS,
+                **_SNIFF_KWARGS
             )
             
-            if es_client.ping():
-                logger.info("成功连接到 Elasticsearch 服务器 (跳过SSL验证)")
-                
-                # 获取ES版本信息
-                info = es_client.info()
-                es_version = info['version']['number']
-                logger.info(f"Elasticsearch 版本: {es_version}")
-                
-                major_version = int(es_version.split('.')[0])
-                if major_version >= 9:
-                    logger.info(f"当前连接的ES {es_version} 版本与客户端兼容")
-                elif major_version == 8:
-                    logger.info(f"当前连接的ES {es_version} 版本与客户端兼容")
-                else:
-                    logger.warning(f"检测到ES版本 {es_version}，可能与当前客户端存在兼容性问题")
-                
-                return es_client
+            _log_es_version(es_client.info())
+            logger.info("成功连接到 Elasticsearch 服务器 (跳过SSL验证)")
+            return es_client
         except Exception as e2:
             logger.error(f"即使跳过SSL验证也无法连接到ES: {str(e2)}")
             raise
@@ -1,8 +1,44 @@
 # Jina重排序器 - 替代BGE重排序器
 from typing import List, Dict, Any
 from src.utils.logger import logger
+from src.config.settings import Config
+from src.utils.ttl_cache import TTLCache
+from src.utils.ranking import top_k_indices
+import functools
+import threading
 import sys
 import os
+import numpy as np
+
+# 主模型加载失败时使用的备用CrossEncoder模型
+BACKUP_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# transformers模型推理的批大小
+RERANK_BATCH_SIZE = 32
+# (查询, 文档) 对的最大token数，以及其中查询部分的最大token数
+MAX_PAIR_TOKENS = 512
+MAX_QUERY_TOKENS = 64
+# 文档分词结果缓存的条数与有效期（秒）
+DOC_TOKEN_CACHE_SIZE = 10000
+DOC_TOKEN_CACHE_TTL = 3600
+
+
+# torch / transformers / sentence_transformers 导入耗时且占用大量内存，只在首次使用时导入一次
+@functools.lru_cache(maxsize=1)
+def _torch():
+    import torch
+    return torch
+
+
+@functools.lru_cache(maxsize=1)
+def _transformers():
+    import transformers
+    return transformers
+
+
+@functools.lru_cache(maxsize=1)
+def _sentence_transformers():
+    import sentence_transformers
+    return sentence_transformers
 
 
 class JinaReranker:
@@ -21,54 +57,171 @@ class JinaReranker:
         self.model_name = model_name
         self.model = None
         self.tokenizer = None
+        self.ct2_encoder = None
+        self.classifier = None
+        self.device = "cpu"
+        # 文档分词结果缓存（LRU）
+        self._doc_tokens = TTLCache(max_items=DOC_TOKEN_CACHE_SIZE, ttl_sec=DOC_TOKEN_CACHE_TTL)
         self._initialized = False
         
     def initialize(self):
-        """初始化模型"""
-        try:
-            from transformers import AutoTokenizer, AutoModelForSequenceClassification
-            
-            logger.info(f"正在加载Jina重排序模型: {self.model_name}")
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, local_files_only=False)
-            self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name, local_files_only=False)
-            self._initialized = True
-            logger.info("Jina重排序模型加载成功")
-            
-        except ImportError:
-            logger.warning("未安装transformers库，Jina重排序功能不可用")
-            logger.info("可通过 pip install transformers torch 安装所需依赖")
-            self._initialized = False
-            
-        except OSError:
-            # 如果无法下载在线模型，则尝试加载本地模型或其他可用模型
+        """初始化模型：依次尝试候选模型，第一个加载成功的即被使用"""
+        if Config.JINA_RERANKER_CT2_PATH and self._initialize_ct2(Config.JINA_RERANKER_CT2_PATH):
+            return
+        
+        candidates = [(self.model_name, "transformers")]
+        if self.model_name != BACKUP_MODEL:
+            candidates.append((BACKUP_MODEL, "sentence_transformers"))
+        
+        for model_name, kind in candidates:
             try:
-                logger.info(f"在线模型加载失败，尝试备用模型...")
-                # 尝试使用一个较小的模型作为备选
-                backup_model = "cross-encoder/ms-marco-MiniLM-L-6-v2"
-                logger.info(f"正在加载备用重排序模型: {backup_model}")
-                from sentence_transformers import CrossEncoder
-                self.model = CrossEncoder(backup_model)
-                self.model_name = backup_model
+                self._load_model(model_name, kind)
+                self.model_name = model_name
                 self._initialized = True
-                logger.info("备用重排序模型加载成功")
-            except Exception:
-                logger.warning("备用模型加载也失败，Jina重排序功能将不可用")
-                self._initialized = False
-                
+                logger.info(f"重排序模型加载成功: {model_name}")
+                return
+            except ImportError:
+                logger.warning(f"未安装{kind}库，无法加载重排序模型: {model_name}")
+                logger.info("可通过 pip install transformers torch sentence-transformers 安装所需依赖")
+            except Exception as e:
+                logger.error(f"重排序模型加载失败: {model_name}, {str(e)}")
+            self.model = None
+            self.tokenizer = None
+        
+        logger.warning("所有重排序模型均加载失败，Jina重排序功能将不可用")
+        self._initialized = False
+    
+    def _load_model(self, model_name: str, kind: str):
+        """按类型加载重排序模型：transformers序列分类模型或sentence_transformers的CrossEncoder"""
+        logger.info(f"正在加载重排序模型: {model_name}")
+        if kind == "transformers":
+            transformers = _transformers()
+            self.tokenizer = transformers.AutoTokenizer.from_pretrained(model_name, local_files_only=False, use_fast=True)
+            self.model = transformers.AutoModelForSequenceClassification.from_pretrained(model_name, local_files_only=False)
+            self._move_to_gpu()
+        else:
+            self.model = _sentence_transformers().CrossEncoder(model_name)
+    
+    def _move_to_gpu(self):
+        """有GPU时把模型转为半精度放到GPU上（Ampere及以上使用BF16，否则FP16）"""
+        torch = _torch()
+        
+        if not torch.cuda.is_available():
+            return
+        dtype = torch.bfloat16 if torch.cuda.get_device_capability()[0] >= 8 else torch.float16
+        self.model = self.model.to("cuda", dtype=dtype)
+        self.device = "cuda"
+        logger.info(f"Jina重排序模型使用GPU推理，精度: {dtype}")
+    
+    def _initialize_ct2(self, model_dir: str) -> bool:
+        """
+        使用CTranslate2 INT8编码器（由 ct2-transformers-converter --quantization int8 离线转换），
+        只保留HF模型的分类头在torch中计算最终得分；成功返回True
+        """
+        try:
+            import ctranslate2
+            transformers = _transformers()
+        except ImportError:
+            logger.warning("未安装ctranslate2，使用transformers重排序模型")
+            return False
+        
+        try:
+            logger.info(f"正在加载CTranslate2重排序模型: {model_dir}")
+            use_cuda = ctranslate2.get_cuda_device_count() > 0
+            self._ct2_device = "cuda" if use_cuda else "cpu"
+            self.tokenizer = transformers.AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
+            hf_model = transformers.AutoModelForSequenceClassification.from_pretrained(self.model_name)
+            self.classifier = hf_model.classifier.eval().to(self._ct2_device)
+            del hf_model
+            self.ct2_encoder = ctranslate2.Encoder(
+                model_dir,
+                device=self._ct2_device,
+                compute_type="int8_float16" if use_cuda else "int8"
+            )
+            self._initialized = True
+            logger.info("CTranslate2重排序模型加载成功")
+            return True
         except Exception as e:
-            logger.error(f"Jina重排序模型加载失败: {str(e)}")
-            # 尝试加载备用模型
-            try:
-                logger.info("尝试加载备用重排序模型...")
-                from sentence_transformers import CrossEncoder
-                backup_model = "cross-encoder/ms-marco-MiniLM-L-6-v2"
-                self.model = CrossEncoder(backup_model)
-                self.model_name = backup_model
-                self._initialized = True
-                logger.info("备用重排序模型加载成功")
-            except Exception as backup_error:
-                logger.error(f"备用重排序模型加载失败: {str(backup_error)}")
-                self._initialized = False
+            self.ct2_encoder = None
+            self.classifier = None
+            logger.warning(f"CTranslate2重排序模型加载失败，使用transformers重排序模型: {str(e)}")
+            return False
+    
+    def _ct2_scores(self, query: str, documents: List[str]) -> np.ndarray:
+        """CTranslate2编码 + torch分类头计算相关性得分"""
+        torch = _torch()
+        
+        encoded = self._encode_pairs(query, documents)
+        tokens = [self.tokenizer.convert_ids_to_tokens(ids) for ids in encoded['input_ids']]
+        output = self.ct2_encoder.forward_batch(tokens, token_type_ids=encoded.get('token_type_ids'))
+        
+        # BERT类模型的分类头接在池化输出之后，XLM-R类模型的分类头直接取最后一层隐藏状态
+        hidden = output.pooler_output if output.pooler_output is not None else output.last_hidden_state
+        hidden = torch.as_tensor(hidden, device=self._ct2_device)
+        with torch.no_grad():
+            return self.classifier(hidden).view(-1).float().cpu().numpy()
+    
+    def _doc_token_ids(self, documents: List[str]) -> List[List[int]]:
+        """
+        文档的分词结果（不含特殊符号），多次查询召回相同文档时直接复用；
+        未缓存的文档合并为一次批量分词
+        """
+        token_ids = [self._doc_tokens.get(doc) for doc in documents]
+        missing = list(dict.fromkeys(doc for doc, ids in zip(documents, token_ids) if ids is None))
+        if missing:
+            encoded = self.tokenizer(missing, add_special_tokens=False, truncation=True, max_length=MAX_PAIR_TOKENS)['input_ids']
+            new_ids = dict(zip(missing, encoded))
+            for doc, ids in new_ids.items():
+                self._doc_tokens.set(doc, ids)
+            token_ids = [ids if ids is not None else new_ids[doc] for doc, ids in zip(documents, token_ids)]
+        return token_ids
+    
+    def _encode_pairs(self, query: str, documents: List[str]) -> Dict[str, List[List[int]]]:
+        """
+        用查询和缓存的文档分词结果拼出模型输入（未填充）：查询只分词一次，
+        超过 MAX_PAIR_TOKENS 时只截断文档部分
+        """
+        tokenizer = self.tokenizer
+        query_ids = tokenizer(query, add_special_tokens=False, truncation=True, max_length=MAX_QUERY_TOKENS)['input_ids']
+        doc_budget = MAX_PAIR_TOKENS - len(query_ids) - tokenizer.num_special_tokens_to_add(pair=True)
+        doc_ids = [ids[:doc_budget] for ids in self._doc_token_ids(documents)]
+        
+        input_ids = [tokenizer.build_inputs_with_special_tokens(query_ids, ids) for ids in doc_ids]
+        encoded = {
+            'input_ids': input_ids,
+            'attention_mask': [[1] * len(ids) for ids in input_ids]
+        }
+        if 'token_type_ids' in tokenizer.model_input_names:
+            encoded['token_type_ids'] = [
+                tokenizer.create_token_type_ids_from_sequences(query_ids, ids) for ids in doc_ids
+            ]
+        return encoded
+    
+    def _transformers_scores(self, query: str, documents: List[str]) -> np.ndarray:
+        """
+        transformers模型计算相关性得分
+        
+        所有 (查询, 文档) 对只分词一次，按token长度排序后分成小批次，每批只填充到批内最长序列，
+        避免一个长文档使所有序列都填充到512
+        """
+        torch = _torch()
+        
+        encoded = self._encode_pairs(query, documents)
+        order = np.argsort([len(ids) for ids in encoded['input_ids']], kind='stable')
+        scores = np.empty(len(documents), dtype=np.float32)
+        
+        with torch.inference_mode():
+            for start in range(0, len(documents), RERANK_BATCH_SIZE):
+                batch_idx = order[start:start + RERANK_BATCH_SIZE]
+                features = self.tokenizer.pad(
+                    {name: [values[i] for i in batch_idx] for name, values in encoded.items()},
+                    padding='longest',
+                    return_tensors='pt'
+                )
+                if self.device != "cpu":
+                    features = {name: value.to(self.device, non_blocking=True) for name, value in features.items()}
+                scores[batch_idx] = self.model(**features).logits.view(-1).float().cpu().numpy()
+        return scores
     
     def rerank(self, query: str, documents: List[str], top_k: int = 5) -> List[Dict[str, Any]]:
         """
@@ -88,47 +241,28 @@ class JinaReranker:
                     for i, doc in enumerate(documents[:top_k])]
         
         try:
+            if self.ct2_encoder is not None:
+                scores = self._ct2_scores(query, documents)
             # 检查是否使用CrossEncoder模型
-            if hasattr(self.model, 'predict'):
+            elif hasattr(self.model, 'predict'):
                 # 对于CrossEncoder模型
                 sentence_pairs = [[query, doc] for doc in documents]
                 scores = self.model.predict(sentence_pairs)
-                
-                # 转换得分并排序
-                score_list = [(i, float(scores[i])) for i in range(len(documents))]
-                score_list.sort(key=lambda x: x[1], reverse=True)
             else:
                 # 使用原始transformers方法
-                sentence_pairs = [[query, doc] for doc in documents]
-                
-                # Tokenize 输入
-                features = self.tokenizer(
-                    sentence_pairs,
-                    padding=True,
-                    truncation=True,
-                    return_tensors='pt',
-                    max_length=512
-                )
-                
-                import torch
-                # 计算相关性得分
-                with torch.no_grad():
-                    scores = self.model(**features).logits.view(-1).float()
-                    
-                # 转换得分并排序
-                score_list = [(i, float(scores[i])) for i in range(len(documents))]
-                score_list.sort(key=lambda x: x[1], reverse=True)
+                scores = self._transformers_scores(query, documents)
             
-            # 返回top_k结果
-            results = []
-            for i in range(min(top_k, len(score_list))):
-                idx, score = score_list[i]
-                results.append({
+            # 只对得分最高的top_k个结果排序
+            scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+            results = [
+                {
                     'index': idx,
-                    'score': float(score),
+                    'score': float(scores[idx]),
                     'text': documents[idx],
                     'original_rank': idx  # 原始排名
-                })
+                }
+                for idx in top_k_indices(scores, top_k)
+            ]
             
             logger.debug(f"Jina重排序完成，处理了 {len(documents)} 个文档，返回 {len(results)} 个结果")
             return results
@@ -160,16 +294,16 @@ class JinaReranker:
         # 进行重排序
         reranked_results = self.rerank(query, documents, top_k)
         
-        # 重新组装结果，保持原始结果的所有信息
-        final_results = []
-        for reranked_result in reranked_results:
-            original_idx = reranked_result['index']
-            original_result = search_results[original_idx].copy()
-            # 添加重排序后的得分
-            original_result['rerank_score'] = reranked_result['score']
-            original_result['rerank_position'] = len(final_results) + 1
-            original_result['original_position'] = original_idx + 1
-            final_results.append(original_result)
+        # 只为top_k结果重新组装字典，保持原始结果的所有信息并添加重排序得分
+        final_results = [
+            {
+                **search_results[reranked_result['index']],
+                'rerank_score': reranked_result['score'],
+                'rerank_position': position,
+                'original_position': reranked_result['index'] + 1
+            }
+            for position, reranked_result in enumerate(reranked_results, 1)
+        ]
         
         logger.info(f"Jina重排序搜索结果完成，返回 {len(final_results)} 个结果")
         return final_results
@@ -177,12 +311,16 @@ class JinaReranker:
 
 # 全局重排序器实例
 _jina_reranker = None
+_jina_reranker_lock = threading.Lock()
 
 
 def get_jina_reranker(model_name: str = "jinaai/jina-reranker-v1-turbo-en") -> JinaReranker:
-    """获取全局Jina重排序器实例"""
+    """获取全局Jina重排序器实例（并发首次调用时只加载一次模型）"""
     global _jina_reranker
     if _jina_reranker is None:
-        _jina_reranker = JinaReranker(model_name)
-        _jina_reranker.initialize()
+        with _jina_reranker_lock:
+            if _jina_reranker is None:
+                reranker = JinaReranker(model_name)
+                reranker.initialize()
+                _jina_reranker = reranker
     return _jina_reranker
\ No newline at end of file
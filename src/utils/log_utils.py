@@ -1,20 +1,37 @@
 # 日志记录和调试工具
 import logging
+import logging.handlers
+import atexit
+import queue
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any
 import json
-import traceback
+import inspect
+import time
 from functools import wraps
 
+# 单个日志文件的最大字节数及保留的历史文件个数
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 10
+
+# 后台写日志的监听器（进程内只启动一个）
+_log_listener = None
+
 def setup_logging():
-    """设置应用程序日志"""
+    """设置应用程序日志（由后台线程写文件和控制台，调用方只负责入队）"""
+    global _log_listener
+    root_logger = logging.getLogger()
+    if _log_listener is not None:
+        return root_logger
+    
     # 创建logs目录
     log_dir = Path("logs")
     log_dir.mkdir(exist_ok=True)
     
     # 配置基本日志设置
     log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    formatter = logging.Formatter(log_format)
     
     # 主日志文件
     main_log = str(log_dir / f"knowledge_base_{datetime.now().strftime('%Y%m%d')}.log")
@@ -22,52 +39,85 @@ def setup_logging():
     # 错误日志文件
     error_log = str(log_dir / f"error_{datetime.now().strftime('%Y%m%d')}.log")
     
-    # 配置日志记录器
-    logging.basicConfig(
-        level=logging.INFO,
-        format=log_format,
-        handlers=[
-            logging.FileHandler(main_log, encoding='utf-8'),
-            logging.StreamHandler(),  # 控制台输出
-        ]
+    # 按大小轮转的文件处理器，避免长时间运行时日志文件无限增长
+    main_handler = logging.handlers.RotatingFileHandler(
+        main_log, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
     )
+    console_handler = logging.StreamHandler()  # 控制台输出
     
     # 单独配置错误日志
-    error_handler = logging.FileHandler(error_log, encoding='utf-8')
+    error_handler = logging.handlers.RotatingFileHandler(
+        error_log, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
     error_handler.setLevel(logging.ERROR)
-    error_formatter = logging.Formatter(log_format)
-    error_handler.setFormatter(error_formatter)
     
-    # 添加错误处理器到根日志记录器
-    root_logger = logging.getLogger()
-    root_logger.addHandler(error_handler)
+    for handler in (main_handler, console_handler, error_handler):
+        handler.setFormatter(formatter)
+    
+    # 根日志记录器只挂QueueHandler，实际I/O由QueueListener的后台线程完成
+    log_queue = queue.Queue(-1)
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    
+    _log_listener = logging.handlers.QueueListener(
+        log_queue, main_handler, console_handler, error_handler, respect_handler_level=True
+    )
+    _log_listener.start()
+    # 退出前写完队列中剩余的日志
+    atexit.register(_log_listener.stop)
     
     return root_logger
 
 
 def log_api_call(func):
-    """装饰器：记录API调用信息"""
+    """装饰器：记录API调用信息（同时支持同步函数和async函数）"""
+    def _log_start(logger, args, kwargs):
+        logger.info(f"开始执行 {func.__name__}")
+        # 参数可能包含大文本或向量，只在开启DEBUG时才格式化
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"参数: args={args}, kwargs={kwargs}")
+    
+    def _log_success(logger, start_ns, result):
+        duration = (time.perf_counter_ns() - start_ns) / 1e9
+        logger.info(f"{func.__name__} 执行完成，耗时: {duration:.2f} 秒")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"返回值: {result}")
+    
+    def _log_failure(logger, start_ns, e):
+        duration = (time.perf_counter_ns() - start_ns) / 1e9
+        logger.error(f"{func.__name__} 执行失败，耗时: {duration:.2f} 秒")
+        # 由logging在输出时格式化异常堆栈
+        logger.error(f"错误详情: {str(e)}", exc_info=True)
+    
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            logger = logging.getLogger(func.__module__)
+            start_ns = time.perf_counter_ns()
+            
+            try:
+                _log_start(logger, args, kwargs)
+                result = await func(*args, **kwargs)
+                _log_success(logger, start_ns, result)
+                return result
+            except Exception as e:
+                _log_failure(logger, start_ns, e)
+                raise
+        
+        return async_wrapper
+    
     @wraps(func)
     def wrapper(*args, **kwargs):
         logger = logging.getLogger(func.__module__)
-        start_time = datetime.now()
+        start_ns = time.perf_counter_ns()
         
         try:
-            logger.info(f"开始执行 {func.__name__}")
-            logger.debug(f"参数: args={args}, kwargs={kwargs}")
-            
+            _log_start(logger, args, kwargs)
             result = func(*args, **kwargs)
-            
-            duration = (datetime.now() - start_time).total_seconds()
-            logger.info(f"{func.__name__} 执行完成，耗时: {duration:.2f} 秒")
-            logger.debug(f"返回值: {result}")
-            
+            _log_success(logger, start_ns, result)
             return result
         except Exception as e:
-            duration = (datetime.now() - start_time).total_seconds()
-            logger.error(f"{func.__name__} 执行失败，耗时: {duration:.2f} 秒")
-            logger.error(f"错误详情: {str(e)}")
-            logger.error(f"堆栈跟踪: {traceback.format_exc()}")
+            _log_failure(logger, start_ns, e)
             raise
     
     return wrapper
@@ -79,19 +129,19 @@ def log_operation(operation_name: str):
         @wraps(func)
         def wrapper(*args, **kwargs):
             logger = logging.getLogger(func.__module__)
-            start_time = datetime.now()
+            start_ns = time.perf_counter_ns()
             
             logger.info(f"[{operation_name}] 开始执行 {func.__name__}")
             
             try:
                 result = func(*args, **kwargs)
                 
-                duration = (datetime.now() - start_time).total_seconds()
+                duration = (time.perf_counter_ns() - start_ns) / 1e9
                 logger.info(f"[{operation_name}] {func.__name__} 执行成功，耗时: {duration:.2f}s")
                 
                 return result
             except Exception as e:
-                duration = (datetime.now() - start_time).total_seconds()
+                duration = (time.perf_counter_ns() - start_ns) / 1e9
                 logger.error(f"[{operation_name}] {func.__name__} 执行失败，耗时: {duration:.2f}s")
                 logger.error(f"[{operation_name}] 错误详情: {str(e)}")
                 raise
@@ -1,18 +1,29 @@
 # 日志配置
 import os
+import sys
 from loguru import logger
 from datetime import datetime
 
+# 以 src.utils.logger 导入时使用包路径，以 utils.logger 导入（sys.path 中只有 src 目录）时使用顶层路径
+try:
+    from src.config.settings import Config
+except ImportError:
+    from config.settings import Config
+
 def setup_logger():
     """设置日志记录器"""
     # 清除默认的日志处理器
     logger.remove()
     
-    # 添加控制台处理器
+    # 添加控制台处理器（级别由 Config.LOG_LEVEL 控制，生产环境可设为 WARNING，INFO 日志只写入文件）；
+    # enqueue=True 由后台线程写出日志，不阻塞调用方；关闭 diagnose 避免异常时逐帧展开变量
     logger.add(
-        sink=lambda msg: print(msg, end=''),
-        level="INFO",
+        sys.stderr,
+        level=Config.LOG_LEVEL.upper(),
         colorize=True,
+        enqueue=True,
+        backtrace=False,
+        diagnose=False,
         format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
     )
     
@@ -27,6 +38,9 @@ def setup_logger():
         rotation="10 MB",
         retention="30 days",
         compression="zip",
+        enqueue=True,
+        backtrace=False,
+        diagnose=False,
         format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {name}:{function}:{line} - {message}"
     )
     
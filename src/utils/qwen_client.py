@@ -3,6 +3,8 @@ import dashscope
 from langchain_core.prompts import PromptTemplate
 from src.config.settings import Config
 from src.utils.logger import logger
+from src.utils.dashscope_http import install_dashscope_keepalive
+from src.utils.ttl_cache import TTLCache
 from src.prompts import (
     AnswerWithRAGContextNamePrompt,
     AnswerWithRAGContextNumberPrompt,
@@ -11,38 +13,101 @@ from src.prompts import (
     AnswerWithRAGContextStringPrompt,
     AnswerWithRAGContextSharedPrompt
 )
+import asyncio
 import json
-from typing import Dict, Any, Union
+from typing import Dict, Any, List, Tuple, Union
+
+
+# 安装了orjson时使用C实现的JSON解析
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+_JSON_DECODER = json.JSONDecoder()
+
+# 答案类型 -> 提示词类，未知类型使用 string
+_PROMPT_CLASSES = {
+    "name": AnswerWithRAGContextNamePrompt,
+    "number": AnswerWithRAGContextNumberPrompt,
+    "boolean": AnswerWithRAGContextBooleanPrompt,
+    "names": AnswerWithRAGContextNamesPrompt,
+    "string": AnswerWithRAGContextStringPrompt,
+}
+
+
+# 问答链的提示模板，只构建一次
+_QA_PROMPT = PromptTemplate(
+    template="""基于以下上下文信息回答问题:
+
+{context}
+
+问题: {question}
+答案:""",
+    input_variables=["context", "question"]
+)
+
+
+def _structured_prompt(question: str, context: str, answer_type: str) -> str:
+    """根据答案类型选择提示词并构建用户提示"""
+    prompt_class = _PROMPT_CLASSES.get(answer_type, AnswerWithRAGContextStringPrompt)
+    return prompt_class.user_prompt.format(context=context, question=question)
 
 
 class QwenLLMClient:
     """通义千问语言模型客户端"""
     
+    # 模型响应缓存，所有实例共享：键为 (模型名, 提示词)；只缓存温度为0的确定性输出
+    _response_cache = TTLCache(max_items=Config.LLM_CACHE_SIZE, ttl_sec=Config.LLM_CACHE_TTL)
+    
     def __init__(self):
         # 设置API密钥
         dashscope.api_key = Config.DASHSCOPE_API_KEY
+        install_dashscope_keepalive()
         self.model = Config.QWEN_MODEL_NAME
         
     def get_qa_chain(self, retriever):
         """获取问答链"""
-        # 自定义提示模板
-        template = """基于以下上下文信息回答问题:
-
-{context}
-
-问题: {question}
-答案:"""
-        
-        prompt = PromptTemplate(
-            template=template,
-            input_variables=["context", "question"]
-        )
-        
+        # 自定义提示模板见 _QA_PROMPT
         # 注意：这里我们需要使用兼容的LLM对象
         # 为了简化，直接使用chat方法
         logger.info("已准备问答链")
         return self
     
+    def _generate(self, prompt: str, temperature: float, use_cache: bool = True) -> str:
+        """
+        调用dashscope生成回答
+        
+        温度为0时输出确定，相同的 (模型, 提示词) 在缓存有效期内直接返回上次的回答；
+        采样生成（温度大于0）的回答不缓存
+        """
+        use_cache = use_cache and temperature == 0
+        cache_key = (self.model, prompt)
+        if use_cache:
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("模型响应命中缓存")
+                return cached
+        
+        # 使用dashscope直接调用
+        response = dashscope.Generation.call(
+            model=self.model,
+            prompt=prompt,
+            temperature=temperature,
+            max_tokens=2000
+        )
+        
+        if response.status_code == 200:
+            response_text = response.output.text
+            if use_cache:
+                self._response_cache.set(cache_key, response_text)
+            return response_text
+        else:
+            error_msg = f"API调用失败: {response.code} - {response.message}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+    
     def chat(self, question: str, context: str = ""):
         """直接对话"""
         try:
@@ -53,22 +118,9 @@ class QwenLLMClient:
             
             logger.info(f"向模型发送请求: {question[:50]}...")
             
-            # 使用dashscope直接调用
-            response = dashscope.Generation.call(
-                model=self.model,
-                prompt=prompt,
-                temperature=0.7,
-                max_tokens=2000
-            )
-            
-            if response.status_code == 200:
-                response_text = response.output.text
-                logger.info(f"收到模型响应: {response_text[:50]}...")
-                return response_text
-            else:
-                error_msg = f"API调用失败: {response.code} - {response.message}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
+            response_text = self._generate(prompt, temperature=0.7)
+            logger.info(f"收到模型响应: {response_text[:50]}...")
+            return response_text
                 
         except Exception as e:
             logger.error(f"对话请求失败: {str(e)}")
@@ -84,44 +136,46 @@ class QwenLLMClient:
             answer_type: 答案类型 ("name", "number", "boolean", "names", "string")
         """
         try:
-            # 根据问题类型选择适当的提示
-            if answer_type == "name":
-                prompt_class = AnswerWithRAGContextNamePrompt
-            elif answer_type == "number":
-                prompt_class = AnswerWithRAGContextNumberPrompt
-            elif answer_type == "boolean":
-                prompt_class = AnswerWithRAGContextBooleanPrompt
-            elif answer_type == "names":
-                prompt_class = AnswerWithRAGContextNamesPrompt
-            else:  # 默认为 string
-                prompt_class = AnswerWithRAGContextStringPrompt
-            
-            # 构建用户提示
-            user_prompt = prompt_class.user_prompt.format(context=context, question=question)
+            user_prompt = _structured_prompt(question, context, answer_type)
             
             logger.info(f"向模型发送结构化请求: {question[:50]}...")
             
-            # 使用dashscope直接调用
-            response = dashscope.Generation.call(
-                model=self.model,
-                prompt=user_prompt,
-                temperature=0.3,  # 更低的温度以获得更准确的结果
-                max_tokens=2000
-            )
-            
-            if response.status_code == 200:
-                response_text = response.output.text
-                logger.info(f"收到模型结构化响应: {response_text[:50]}...")
-                return response_text
-            else:
-                error_msg = f"API调用失败: {response.code} - {response.message}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
+            # 更低的温度以获得更准确的结果
+            response_text = self._generate(user_prompt, temperature=0.3)
+            logger.info(f"收到模型结构化响应: {response_text[:50]}...")
+            return response_text
                 
         except Exception as e:
             logger.error(f"结构化对话请求失败: {str(e)}")
             raise
     
+    async def chat_many(self, prompts: List[str], temperature: float = 0.7) -> List[str]:
+        """
+        并发发送多个提示词，按输入顺序返回回答
+        
+        Args:
+            prompts: 提示词列表
+            temperature: 温度
+        """
+        semaphore = asyncio.Semaphore(Config.LLM_CONCURRENCY)
+        
+        async def generate(prompt: str) -> str:
+            async with semaphore:
+                return await asyncio.to_thread(self._generate, prompt, temperature)
+        
+        logger.info(f"并发发送 {len(prompts)} 个模型请求")
+        return await asyncio.gather(*(generate(prompt) for prompt in prompts))
+    
+    async def structured_chat_many(self, requests: List[Tuple[str, str, str]]) -> List[str]:
+        """
+        并发执行多个结构化对话
+        
+        Args:
+            requests: (问题, 上下文, 答案类型) 列表
+        """
+        prompts = [_structured_prompt(question, context, answer_type) for question, context, answer_type in requests]
+        return await self.chat_many(prompts, temperature=0.3)
+    
     def chat_with_custom_prompt(self, custom_prompt: str):
         """
         使用自定义提示与模型对话
@@ -132,22 +186,11 @@ class QwenLLMClient:
         try:
             logger.info(f"向模型发送自定义提示请求: {custom_prompt[:50]}...")
             
-            # 使用dashscope直接调用
-            response = dashscope.Generation.call(
-                model=self.model,
-                prompt=custom_prompt,
-                temperature=0.3,  # 降低温度以获得更准确的结构化输出
-                max_tokens=2000
-            )
-            
-            if response.status_code == 200:
-                response_text = response.output.text
-                logger.info(f"收到模型自定义响应: {response_text[:50]}...")
-                return response_text
-            else:
-                error_msg = f"API调用失败: {response.code} - {response.message}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
+            # 降低温度以获得更准确的结构化输出；
+            # 问答路径已由答案缓存按 ANSWER_CACHE_TTL 缓存，这里不再缓存响应
+            response_text = self._generate(custom_prompt, temperature=0.3, use_cache=False)
+            logger.info(f"收到模型自定义响应: {response_text[:50]}...")
+            return response_text
                 
         except Exception as e:
             logger.error(f"自定义提示对话请求失败: {str(e)}")
@@ -161,30 +204,46 @@ class QwenLLMClient:
             response_text: 模型响应文本
             answer_type: 答案类型
         """
-        try:
-            # 尝试解析JSON响应
-            # 有时模型可能在回答前后添加说明文字，我们需要提取JSON部分
-            start_idx = response_text.find("{")
-            end_idx = response_text.rfind("}")
-            
-            if start_idx != -1 and end_idx != -1 and start_idx < end_idx:
-                json_str = response_text[start_idx:end_idx+1]
-                parsed_response = json.loads(json_str)
-                return parsed_response
-            else:
-                # 如果找不到JSON格式，尝试返回基本结构
-                return {
-                    "step_by_step_analysis": "无法解析响应格式",
-                    "reasoning_summary": "响应格式异常",
-                    "relevant_pages": [],
-                    "final_answer": response_text
-                }
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON解析失败: {str(e)}")
-            logger.error(f"响应内容: {response_text}")
+        # 有时模型可能在回答前后添加说明文字，我们需要提取JSON部分
+        start_idx = response_text.find("{")
+        end_idx = response_text.rfind("}")
+        
+        if start_idx == -1 or end_idx == -1 or start_idx >= end_idx:
+            # 如果找不到JSON格式，尝试返回基本结构
             return {
-                "step_by_step_analysis": "JSON解析失败",
-                "reasoning_summary": "无法解析模型响应",
+                "step_by_step_analysis": "无法解析响应格式",
+                "reasoning_summary": "响应格式异常",
                 "relevant_pages": [],
                 "final_answer": response_text
-            }
\ No newline at end of file
+            }
+        
+        # 绝大多数响应是首尾花括号之间的完整JSON，直接解析
+        try:
+            parsed_response = _json_loads(response_text[start_idx:end_idx+1])
+            if isinstance(parsed_response, dict):
+                return parsed_response
+        except ValueError as e:
+            first_error = e
+        else:
+            first_error = None
+        
+        # JSON前后还有其它花括号（如说明文字中的示例）时，从每个 "{" 处尝试解码一个完整对象，
+        # raw_decode 会正确处理嵌套花括号和字符串中的花括号
+        position = start_idx
+        while position != -1:
+            try:
+                parsed_response, _ = _JSON_DECODER.raw_decode(response_text, position)
+                if isinstance(parsed_response, dict):
+                    return parsed_response
+            except ValueError:
+                pass
+            position = response_text.find("{", position + 1)
+        
+        logger.error(f"JSON解析失败: {str(first_error) if first_error else '未找到JSON对象'}")
+        logger.error(f"响应内容: {response_text}")
+        return {
+            "step_by_step_analysis": "JSON解析失败",
+            "reasoning_summary": "无法解析模型响应",
+            "relevant_pages": [],
+            "final_answer": response_text
+        }
@@ -0,0 +1,19 @@
+# 排序工具函数
+from typing import List
+import numpy as np
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> List[int]:
+    """返回得分最高的top_k个下标（按得分降序，得分相同时按下标升序），用argpartition避免全量排序"""
+    if top_k <= 0:
+        return []
+    if top_k < len(scores):
+        # 第k高的得分；与它同分的文档可能多于剩余名额，只取下标最小的几个
+        kth_score = -np.partition(-scores, top_k - 1)[top_k - 1]
+        above = np.flatnonzero(scores > kth_score)
+        tied = np.flatnonzero(scores == kth_score)[:top_k - len(above)]
+        candidates = np.concatenate((above, tied))
+    else:
+        candidates = np.arange(len(scores))
+    # 按 (-得分, 下标) 排序，同分时保持原顺序
+    return candidates[np.lexsort((candidates, -scores[candidates]))].tolist()
@@ -0,0 +1,133 @@
+# 重排序得分缓存 - 基于SQLite持久化 (模型, 查询, 文档) 的相关性得分
+from typing import Dict, Iterable, Optional, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from src.config.settings import Config
+from src.utils.logger import logger
+
+# 单条SELECT语句中IN子句的最大参数个数（低于SQLite默认的变量数上限）
+MAX_QUERY_PARAMS = 500
+# 每写入多少批得分清理一次过期和超出上限的得分
+PRUNE_INTERVAL = 100
+
+
+def text_digest(text: str) -> bytes:
+    """计算文本的128位blake2b摘要，作为缓存键"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class ScorerCache:
+    """
+    重排序得分缓存
+
+    以 (模型标识, 查询摘要, 文档摘要) 为主键保存相关性得分，进程重启后仍然有效；
+    重复或部分重叠的检索结果只需为新出现的文档调用重排模型。
+    超过有效期的得分视为未命中，并与超出条数上限的最早得分一起定期删除，数据库不会无限增长。
+    """
+
+    def __init__(self, path: str, ttl_sec: float = 30 * 24 * 3600, max_rows: int = 1000000):
+        """
+        Args:
+            path: SQLite数据库文件路径
+            ttl_sec: 得分有效期（秒）
+            max_rows: 最多保存的得分条数
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.max_rows = max_rows
+        self._writes_since_prune = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rerank_scores ("
+            "model_key TEXT NOT NULL, qhash BLOB NOT NULL, dhash BLOB NOT NULL, score REAL NOT NULL, "
+            "created_at REAL NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (model_key, qhash, dhash)) WITHOUT ROWID"
+        )
+        # 旧版本创建的表没有写入时间列，补上后其中的得分按已过期处理
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(rerank_scores)")}
+        if "created_at" not in columns:
+            self._conn.execute("ALTER TABLE rerank_scores ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rerank_scores_created_at ON rerank_scores (created_at)")
+        self._conn.commit()
+        self.prune()
+
+    def get_many(self, model_key: str, qhash: bytes, dhashes: Iterable[bytes]) -> Dict[bytes, float]:
+        """批量查询得分，返回 文档摘要 -> 得分（只包含命中的文档）"""
+        dhashes = list(dhashes)
+        scores = {}
+        cutoff = time.time() - self.ttl_sec
+        with self._lock:
+            for start in range(0, len(dhashes), MAX_QUERY_PARAMS):
+                chunk = dhashes[start:start + MAX_QUERY_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT dhash, score FROM rerank_scores "
+                    f"WHERE model_key = ? AND qhash = ? AND dhash IN ({placeholders}) AND created_at >= ?",
+                    (model_key, qhash, *chunk, cutoff)
+                )
+                scores.update(rows)
+        return scores
+
+    def put_many(self, model_key: str, qhash: bytes, items: Iterable[Tuple[bytes, float]]):
+        """批量写入 (文档摘要, 得分)，每 PRUNE_INTERVAL 批清理一次旧得分"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rerank_scores (model_key, qhash, dhash, score, created_at) VALUES (?, ?, ?, ?, ?)",
+                ((model_key, qhash, dhash, score, now) for dhash, score in items)
+            )
+            self._conn.commit()
+            self._writes_since_prune += 1
+            should_prune = self._writes_since_prune >= PRUNE_INTERVAL
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        """删除过期的得分，以及超出条数上限的最早写入的得分"""
+        with self._lock:
+            self._writes_since_prune = 0
+            expired = self._conn.execute(
+                "DELETE FROM rerank_scores WHERE created_at < ?", (time.time() - self.ttl_sec,)
+            ).rowcount
+            overflow = self._conn.execute(
+                "DELETE FROM rerank_scores WHERE created_at <= ("
+                "SELECT created_at FROM rerank_scores ORDER BY created_at DESC LIMIT 1 OFFSET ?)",
+                (self.max_rows,)
+            ).rowcount
+            self._conn.commit()
+        if expired or overflow:
+            logger.info(f"已清理重排序得分缓存: 过期 {expired} 条，超出上限 {overflow} 条")
+
+
+_scorer_cache: Optional[ScorerCache] = None
+_scorer_cache_initialized = False
+_scorer_cache_lock = threading.Lock()
+
+
+def get_scorer_cache() -> Optional[ScorerCache]:
+    """获取进程内共享的重排序得分缓存；未配置路径或打开失败时返回None"""
+    global _scorer_cache, _scorer_cache_initialized
+    if not _scorer_cache_initialized:
+        with _scorer_cache_lock:
+            if not _scorer_cache_initialized:
+                if Config.RERANK_CACHE_PATH:
+                    try:
+                        _scorer_cache = ScorerCache(
+                            Config.RERANK_CACHE_PATH,
+                            ttl_sec=Config.RERANK_CACHE_TTL,
+                            max_rows=Config.RERANK_CACHE_MAX_ROWS
+                        )
+                        logger.info(f"已启用重排序得分缓存: {Config.RERANK_CACHE_PATH}")
+                    except (sqlite3.Error, OSError) as e:
+                        logger.warning(f"无法打开重排序得分缓存，将不使用缓存: {e}")
+                _scorer_cache_initialized = True
+    return _scorer_cache
@@ -0,0 +1,199 @@
+# 检索结果缓存 - 精确匹配 + 语义相似匹配
+from typing import Any, Dict, Hashable, List, Optional
+from collections import OrderedDict
+from itertools import islice
+import threading
+import time
+import numpy as np
+from src.utils.logger import logger
+
+# 淘汰时从最久未访问的若干条目中选择命中次数最少的一条（LRU与LFU结合），
+# 避免被大量一次性查询挤掉高频查询
+EVICTION_SAMPLE_SIZE = 8
+
+
+class SemanticSearchCache:
+    """
+    检索结果缓存
+
+    第一层按 (查询文本, 检索参数) 精确匹配；未命中时，若设置了相似度阈值，
+    再用查询向量与已缓存查询向量的余弦相似度查找语义相近的查询并复用其结果。
+    条目带TTL，按"最久未访问 + 命中次数最少"淘汰，知识库写入新文档后应调用 invalidate() 清空缓存。
+    调用顺序：get() 未命中后生成查询向量，再调用 get_similar()（同时负责统计未命中次数），
+    仍未命中则执行检索并 put()；未启用语义匹配时由 get() 统计未命中次数，
+    启用了语义匹配但跳过 get_similar() 的调用方应调用 record_miss()。检索前读取 generation 并传给 put()，
+    期间若调用过 invalidate()，该结果基于旧内容，不会写入缓存。
+    """
+
+    def __init__(self, max_size: int = 2000, ttl: float = 600, similarity_threshold: float = 0.0):
+        """
+        Args:
+            max_size: 最大缓存条目数，0表示禁用缓存
+            ttl: 条目有效期（秒）
+            similarity_threshold: 语义命中所需的最小余弦相似度，<=0 表示只做精确匹配
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.RLock()
+        # (查询文本, 检索参数) -> [写入时间, 向量槽位, 结果, 命中次数]
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # 已缓存查询的归一化向量矩阵，按槽位复用，避免每次查找重新堆叠
+        self._vectors: Optional[np.ndarray] = None
+        self._slot_keys: List[Optional[Hashable]] = [None] * max_size
+        self._free_slots = list(range(max_size - 1, -1, -1))
+        self._stats = {"hits": 0, "semantic_hits": 0, "misses": 0}
+        # 每次 invalidate() 加一，用于丢弃失效前开始的检索结果
+        self._generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.enabled and self.similarity_threshold > 0
+    
+    @property
+    def generation(self) -> int:
+        """当前缓存代数，invalidate() 后递增"""
+        return self._generation
+
+    def _is_expired(self, created_at: float) -> bool:
+        return time.monotonic() - created_at > self.ttl
+
+    def _remove(self, key: Hashable):
+        _, slot, _, _ = self._entries.pop(key)
+        if slot is not None:
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
+
+    def get(self, query: str, params: Hashable) -> Optional[List[Dict[str, Any]]]:
+        """精确匹配查找"""
+        if not self.enabled:
+            return None
+        key = (query, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry[0]):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                # 启用语义匹配时未命中次数由 get_similar() 统计
+                if not self.semantic_enabled:
+                    self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            entry[3] += 1
+            self._stats["hits"] += 1
+            return entry[2]
+
+    def get_similar(self, vector: List[float], params: Hashable) -> Optional[List[Dict[str, Any]]]:
+        """
+        语义匹配查找：返回检索参数相同、查询向量余弦相似度不低于阈值的缓存结果
+
+        Args:
+            vector: 当前查询向量
+            params: 检索参数，只在参数相同的条目之间复用结果
+        """
+        if not self.semantic_enabled:
+            # 未启用语义匹配时 get() 已统计过未命中
+            return None
+        query = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None or query.shape[0] != self._vectors.shape[1]:
+                self._stats["misses"] += 1
+                return None
+
+            similarities = self._vectors @ query
+            candidates = np.flatnonzero(similarities >= self.similarity_threshold)
+            # 按相似度从高到低检查候选条目
+            for slot in candidates[np.argsort(-similarities[candidates])]:
+                cached_key = self._slot_keys[slot]
+                if cached_key is None or cached_key[1] != params:
+                    continue
+                entry = self._entries[cached_key]
+                if self._is_expired(entry[0]):
+                    self._remove(cached_key)
+                    continue
+                self._entries.move_to_end(cached_key)
+                entry[3] += 1
+                results = entry[2]
+                self._stats["semantic_hits"] += 1
+                logger.debug(f"检索缓存语义命中，相似度: {similarities[slot]:.4f}")
+                return results
+
+            self._stats["misses"] += 1
+            return None
+
+    def record_miss(self):
+        """统计一次未命中（启用了语义匹配但本次未调用 get_similar() 时使用）"""
+        with self._lock:
+            self._stats["misses"] += 1
+    
+    def put(self, query: str, params: Hashable, results: List[Dict[str, Any]], vector: Optional[List[float]] = None,
+            generation: Optional[int] = None):
+        """
+        写入缓存；提供查询向量时同时登记用于语义匹配
+        
+        Args:
+            generation: 开始检索前读取的 generation，与当前代数不一致时（期间缓存已失效）不写入
+        """
+        if not self.enabled:
+            return
+        key = (query, params)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_size:
+                self._evict_one()
+
+            slot = None
+            if vector is not None and self.semantic_enabled:
+                normalized = self._normalize(vector)
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_size, normalized.shape[0]), dtype=np.float32)
+                if normalized.shape[0] == self._vectors.shape[1]:
+                    slot = self._free_slots.pop()
+                    self._vectors[slot] = normalized
+                    self._slot_keys[slot] = key
+
+            self._entries[key] = [time.monotonic(), slot, results, 0]
+
+    def _evict_one(self):
+        """淘汰一条缓存：过期条目优先，否则取最久未访问的几条中命中次数最少的"""
+        candidates = list(islice(self._entries.items(), EVICTION_SAMPLE_SIZE))
+        victim = min(
+            candidates,
+            key=lambda item: (not self._is_expired(item[1][0]), item[1][3])
+        )[0]
+        self._remove(victim)
+
+    def invalidate(self):
+        """清空缓存（知识库内容变化后调用）"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._slot_keys = [None] * self.max_size
+            self._free_slots = list(range(self.max_size - 1, -1, -1))
+            if self._vectors is not None:
+                self._vectors.fill(0)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["semantic_hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hit_rate": (self._stats["hits"] + self._stats["semantic_hits"]) / lookups if lookups else 0.0
+            }
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm > 0 else array
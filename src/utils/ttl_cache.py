@@ -0,0 +1,54 @@
+# 带过期时间的LRU缓存
+from typing import Any, Hashable, Optional
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """
+    线程安全的TTL + LRU缓存
+
+    命中时移动到队尾，超过容量时淘汰最久未访问的条目，超过有效期的条目在访问时移除。
+    """
+
+    def __init__(self, max_items: int = 4096, ttl_sec: float = 20):
+        """
+        Args:
+            max_items: 最大条目数，0表示禁用缓存
+            ttl_sec: 条目有效期（秒）
+        """
+        self.max_items = max_items
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """获取缓存值，不存在或已过期时返回None"""
+        if self.max_items <= 0:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.monotonic() > expires_at:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """写入缓存"""
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_sec, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
@@ -3,6 +3,8 @@ import os
 import sys
 import time
 import asyncio
+import random
+import threading
 from typing import Dict, Any
 
 # 添加项目根目录到路径
@@ -12,6 +14,23 @@ from src.models.knowledge_base import KnowledgeBase
 from src.config.settings import Config
 from src.utils.logger import logger
 from src.utils.document_loader import DocumentLoader
+from src.utils.ranking import top_k_indices
+import numpy as np
+
+# 所有测试共用一个已初始化的知识库实例，避免重复创建客户端和索引
+_kb = None
+_kb_lock = threading.Lock()
+
+def get_test_kb() -> KnowledgeBase:
+    """获取测试共用的知识库实例（首次调用时初始化）"""
+    global _kb
+    if _kb is None:
+        with _kb_lock:
+            if _kb is None:
+                kb = KnowledgeBase()
+                kb.initialize()
+                _kb = kb
+    return _kb
 
 def test_basic_components():
     """测试基本组件是否能正常工作"""
@@ -40,8 +59,7 @@ def test_basic_components():
     # 测试知识库初始化
     print("\n3. 测试知识库初始化...")
     try:
-        kb = KnowledgeBase()
-        kb.initialize()
+        get_test_kb()
         print("   ✓ 知识库初始化正常")
     except Exception as e:
         print(f"   ✗ 知识库初始化异常: {e}")
@@ -67,6 +85,25 @@ def test_basic_components():
     print("\n✓ 基本组件测试全部通过!")
     return True
 
+def test_top_k_indices():
+    """测试top-k排序与稳定的全量排序结果一致（同分时保持原顺序）"""
+    print("\n" + "="*60)
+    print("开始测试top-k排序")
+    print("="*60)
+    
+    rng = random.Random(0)
+    for _ in range(2000):
+        scores = [rng.randint(0, 5) for _ in range(rng.randint(0, 30))]
+        top_k = rng.randint(0, 35)
+        expected = [i for i, _ in sorted(enumerate(scores), key=lambda x: x[1], reverse=True)][:top_k]
+        actual = top_k_indices(np.asarray(scores, dtype=np.float32), top_k)
+        if actual != expected:
+            print(f"   ✗ top-k排序结果不一致: scores={scores}, top_k={top_k}, 期望 {expected}, 实际 {actual}")
+            return False
+    
+    print("   ✓ top-k排序与稳定排序结果一致")
+    return True
+
 def test_embedding_and_storage():
     """测试嵌入和存储功能"""
     print("\n" + "="*60)
@@ -74,8 +111,7 @@ def test_embedding_and_storage():
     print("="*60)
     
     try:
-        kb = KnowledgeBase()
-        kb.initialize()
+        kb = get_test_kb()
         
         # 测试嵌入功能
         print("\n1. 测试文本嵌入...")
@@ -113,8 +149,7 @@ def test_full_qa_process():
     print("="*60)
     
     try:
-        kb = KnowledgeBase()
-        kb.initialize()
+        kb = get_test_kb()
         
         # 添加测试文档
         print("\n1. 添加测试文档...")
@@ -147,30 +182,48 @@ def test_full_qa_process():
         traceback.print_exc()
         return False
 
+async def _run_concurrently(test_funcs):
+    """在线程池中并发运行多个同步测试函数，返回各自的结果"""
+    return await asyncio.gather(*(asyncio.to_thread(test_func) for test_func in test_funcs))
+
 def run_system_test():
     """运行完整系统测试"""
     print("开始运行知识库系统完整测试...")
     
-    tests = [
-        ("基本组件测试", test_basic_components),
+    # 基本组件测试负责初始化共用的知识库实例，先单独运行
+    basic_test = ("基本组件测试", test_basic_components)
+    # 其余测试主要等待ES和模型API，在线程中并发运行（输出可能交错）
+    concurrent_tests = [
         ("嵌入和存储测试", test_embedding_and_storage),
         ("完整问答流程测试", test_full_qa_process)
     ]
-    
+    # 不依赖外部服务的测试
+    offline_tests = [("top-k排序测试", test_top_k_indices)]
+    total_tests = len(offline_tests) + 1 + len(concurrent_tests)
     passed_tests = 0
-    total_tests = len(tests)
     
-    for test_name, test_func in tests:
+    def print_header(title):
         print(f"\n{'-'*60}")
-        print(f"运行测试: {test_name}")
+        print(title)
         print('-'*60)
-        
-        if test_func():
+    
+    def report(test_name, passed):
+        nonlocal passed_tests
+        if passed:
             passed_tests += 1
             print(f"\n✓ {test_name} 通过")
         else:
             print(f"\n✗ {test_name} 失败")
     
+    for test_name, test_func in offline_tests + [basic_test]:
+        print_header(f"运行测试: {test_name}")
+        report(test_name, test_func())
+    
+    print_header(f"并发运行测试: {'、'.join(name for name, _ in concurrent_tests)}")
+    results = asyncio.run(_run_concurrently([test_func for _, test_func in concurrent_tests]))
+    for (test_name, _), passed in zip(concurrent_tests, results):
+        report(test_name, passed)
+    
     print(f"\n{'='*60}")
     print(f"测试完成! 通过: {passed_tests}/{total_tests}")
     print('='*60)